@@ -0,0 +1,228 @@
+# benchmark.py
+# Latency / throughput benchmarks for the embedding and classification stages.
+#
+#   python evaluation/benchmark.py                          # full sweep -> benchmark_results.json
+#   python evaluation/benchmark.py --stages ecapa,heads --quick
+#   python evaluation/benchmark.py --baseline old.json      # flag p50 regressions
+#
+# Stages:
+#   ecapa     - SpeechBrain ECAPA encode_batch (what embed() / extract_embedding() run)
+#   wav2vec2  - torchaudio WAV2VEC2_BASE mean-pooled (get_embed() in ecapa.py)
+#   heads     - sklearn predict_proba of the binary / multiclass heads (+ scaler),
+#               and the same heads converted to NumPy (inference/heads.py)
+#   backends  - full wav -> probs through inference/backends.py engines
+#
+# Audio is synthetic (no disk I/O), clip lengths span the 0.5-3 s the
+# generators keep. Every row has p50/p99 latency per call, clips/s and
+# real-time factor (compute seconds per second of audio, < 1 is faster than
+# real time).
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import numpy as np
+import torch
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "inference"))
+from batching import ecapa_encoder, load_wav2vec2, wav2vec2_encoder, pad_batch
+from heads import NumpyHead
+
+SR = 16000
+LENGTHS = [0.5, 1.0, 1.5, 2.0, 3.0]
+BATCHES = [1, 8, 32]
+THREADS = sorted({1, 2, 4, os.cpu_count() or 1})
+
+
+def timeit(fn, warmup=2, iters=20):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(iters):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return np.array(times)
+
+
+def row(stage, times, batch, clip_s, threads, **extra):
+    p50 = float(np.percentile(times, 50))
+    return dict({
+        "stage": stage,
+        "clip_s": clip_s,
+        "batch": batch,
+        "threads": threads,
+        "p50_ms": round(p50 * 1000, 3),
+        "p99_ms": round(float(np.percentile(times, 99)) * 1000, 3),
+        "clips_per_s": round(batch / p50, 2),
+        "rtf": round(p50 / (batch * clip_s), 5) if clip_s else None,
+    }, **extra)
+
+
+def clips(batch, clip_s, seed=0):
+    rng = np.random.default_rng(seed)
+    return [(0.05 * rng.standard_normal(int(clip_s * SR))).astype(np.float32) for _ in range(batch)]
+
+
+def bench_encoder(stage, encode, lengths, batches, threads, iters):
+    rows = []
+    for t in threads:
+        torch.set_num_threads(t)
+        for clip_s in lengths:
+            for b in batches:
+                x, wav_lens = pad_batch(clips(b, clip_s))
+
+                def run():
+                    with torch.inference_mode():
+                        encode(x, wav_lens)
+                rows.append(row(stage, timeit(run, iters=iters), b, clip_s, t))
+                print(f"  {stage:<9} t={t:<2} len={clip_s:<3} b={b:<3} p50 {rows[-1]['p50_ms']:>9.2f}ms  rtf {rows[-1]['rtf']}")
+    return rows
+
+
+def bench_ecapa(lengths, batches, threads, iters):
+    from speechbrain.pretrained import EncoderClassifier
+    enc = EncoderClassifier.from_hparams(source="speechbrain/spkrec-ecapa-voxceleb",
+                                         savedir="pretrained_models/ecapa", run_opts={"device": "cpu"})
+    return bench_encoder("ecapa", ecapa_encoder(enc), lengths, batches, threads, iters)
+
+
+def bench_wav2vec2(lengths, batches, threads, iters):
+    model = load_wav2vec2()
+    return bench_encoder("wav2vec2", wav2vec2_encoder(model), lengths, batches, threads, iters)
+
+
+def bench_heads(batches, threads, iters):
+    import joblib
+    from threadpoolctl import threadpool_limits
+
+    heads = []
+    for name, path, dim in [("binary", "wakeword_classifier.joblib", 192),
+                            ("multiclass", "wakeword_multiclass_classifier.joblib", 768)]:
+        if os.path.exists(path):
+            heads.append((name, joblib.load(path), dim))
+        else:
+            print(f"  [skip] {path} not found")
+    scaler = joblib.load("wakeword_scaler.joblib") if os.path.exists("wakeword_scaler.joblib") else None
+
+    rows = []
+    for t in threads:
+        with threadpool_limits(t):
+            for name, clf, dim in heads:
+                dim = getattr(clf, "n_features_in_", dim)
+                for b in batches:
+                    X = np.random.default_rng(0).standard_normal((b, dim)).astype(np.float32)
+                    sc = scaler if name == "binary" and scaler is not None else None
+
+                    def run():
+                        z = sc.transform(X) if sc is not None else X
+                        clf.predict_proba(z)
+                    rows.append(row("heads", timeit(run, iters=iters * 5), b, None, t, head=name))
+                    print(f"  heads     t={t:<2} {name:<10} b={b:<3} p50 {rows[-1]['p50_ms']:>9.3f}ms")
+
+                    nh = NumpyHead.from_sklearn(clf, sc)
+                    rows.append(row("heads", timeit(lambda: nh.predict_proba(X), iters=iters * 5), b, None, t,
+                                    head=f"{name}-numpy"))
+                    print(f"  heads     t={t:<2} {name + '-numpy':<16} b={b:<3} p50 {rows[-1]['p50_ms']:>9.3f}ms")
+    return rows
+
+
+def bench_backends(lengths, batches, threads, iters):
+    from backends import make_backend
+
+    rows = []
+    for name, needs in [("speechbrain", "wakeword_classifier.joblib"),
+                        ("torchscript", "ecapa_combined.pt"),
+                        ("onnx", "ecapa_combined.onnx")]:
+        if not os.path.exists(needs):
+            print(f"  [skip] backend {name}: {needs} not found")
+            continue
+        for t in threads:
+            torch.set_num_threads(t)
+            kw = {"savedir": "pretrained_models/ecapa"} if name == "speechbrain" else {"threads": t}
+            backend = make_backend(name, **kw)
+            for clip_s in lengths:
+                for b in batches:
+                    waves = clips(b, clip_s)
+                    rows.append(row("backend", timeit(lambda: backend.predict_proba(waves), iters=iters),
+                                    b, clip_s, t, backend=name))
+                    print(f"  {name:<11} t={t:<2} len={clip_s:<3} b={b:<3} p50 {rows[-1]['p50_ms']:>9.2f}ms  rtf {rows[-1]['rtf']}")
+    return rows
+
+
+def key(r):
+    return (r["stage"], r.get("head"), r.get("backend"), r["clip_s"], r["batch"], r["threads"])
+
+
+def check_baseline(rows, path, tolerance):
+    with open(path) as f:
+        base = {key(r): r for r in json.load(f)["results"]}
+    slower = []
+    for r in rows:
+        b = base.get(key(r))
+        if b and r["p50_ms"] > b["p50_ms"] * (1 + tolerance):
+            slower.append(dict(r, baseline_p50_ms=b["p50_ms"],
+                               change=round(r["p50_ms"] / b["p50_ms"] - 1, 3)))
+    return slower
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--stages", default="ecapa,wav2vec2,heads,backends")
+    ap.add_argument("--lengths", default=",".join(map(str, LENGTHS)))
+    ap.add_argument("--batches", default=",".join(map(str, BATCHES)))
+    ap.add_argument("--threads", default=",".join(map(str, THREADS)))
+    ap.add_argument("--iters", type=int, default=20)
+    ap.add_argument("--quick", action="store_true", help="1.5 s clips, batch 1/8, 1 thread, 5 iters")
+    ap.add_argument("--out", default="benchmark_results.json")
+    ap.add_argument("--baseline", default=None, help="earlier results json to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="allowed p50 slowdown vs baseline")
+    args = ap.parse_args()
+
+    lengths = [float(x) for x in args.lengths.split(",")]
+    batches = [int(x) for x in args.batches.split(",")]
+    threads = [int(x) for x in args.threads.split(",")]
+    iters = args.iters
+    if args.quick:
+        lengths, batches, threads, iters = [1.5], [1, 8], [1], 5
+    stages = args.stages.split(",")
+
+    rows = []
+    if "ecapa" in stages:
+        print("ECAPA encode_batch")
+        rows += bench_ecapa(lengths, batches, threads, iters)
+    if "wav2vec2" in stages:
+        print("wav2vec2")
+        rows += bench_wav2vec2(lengths, batches, threads, iters)
+    if "heads" in stages:
+        print("sklearn heads")
+        rows += bench_heads(batches, threads, iters)
+    if "backends" in stages:
+        print("backends")
+        rows += bench_backends(lengths, batches, threads, iters)
+
+    out = {
+        "env": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": rows,
+    }
+    if args.baseline:
+        out["regressions"] = check_baseline(rows, args.baseline, args.tolerance)
+    with open(args.out, "w") as f:
+        json.dump(out, f, indent=2)
+    print(f"\n{len(rows)} results written to {args.out}")
+
+    if out.get("regressions"):
+        print(f"{len(out['regressions'])} rows slower than baseline by > {args.tolerance:.0%}:")
+        for r in out["regressions"]:
+            print(f"  {key(r)}: {r['baseline_p50_ms']} -> {r['p50_ms']} ms")
+        sys.exit(1)
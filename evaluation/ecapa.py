@@ -1,18 +1,27 @@
 import os
+import sys
+import time
+import hashlib
+import argparse
 import torch
-import torchaudio
 import joblib
 import numpy as np
+import soundfile as sf
+from concurrent.futures import ThreadPoolExecutor
+from torch.utils.data import Dataset, DataLoader
 from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 from sklearn.neural_network import MLPClassifier
 from sklearn.preprocessing import LabelEncoder
-import torchaudio.transforms as T
 import torch.nn.functional as F  # not actually used — left in like a human might
 
-# wav2vec2 base
-wav2vec = torchaudio.pipelines.WAV2VEC2_BASE.get_model()
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "inference"))
+from audio_io import TARGET_SR, load_audio
+from batching import length_buckets, pad_batch, fit_length, ecapa_encoder, load_wav2vec2, wav2vec2_encoder
+from feature_store import FeatureStore
+from audio_shards import open_shards
+from augment import Augmenter, NoiseBank
 
 # folder mapping — yeah, this is manual
 label_dirs = {
@@ -22,50 +31,306 @@ label_dirs = {
     "not wakeword": "data/training_data/finalnotwakeword"
 }
 
-X, y = [], []
-
-def get_embed(path):
-    x, fs = torchaudio.load(path)
-    if fs != 16000:
-        x = T.Resample(orig_freq=fs, new_freq=16000)(x)
-    with torch.inference_mode():
-        e = wav2vec(x)[0].mean(dim=1)
-    return e.squeeze().numpy()
-
-print("Grabbing features...")
-for lbl, d in label_dirs.items():
-    print(f" > {lbl}")
-    for i, f in enumerate(os.listdir(d)):
-        if not f.endswith(".wav"): continue
-        p = os.path.join(d, f)
+# features land in features/<embedder id>/ as shards + manifest, a re-run
+# (or a run that got killed) only embeds clips that are new or changed
+FEATURE_ROOT = "features"
+EMBEDDERS = {
+    "wav2vec2": ("wav2vec2-base-mean-v3", 768),  # v3: clips fit to the detector's 1.5 s window
+    "ecapa": ("ecapa-voxceleb", 192),
+}
+
+MODEL_PATH = "wakeword_multiclass_classifier_final.joblib"
+LABEL_ENCODER_PATH = "wakeword_label_encoder_final.joblib"
+# path + sha1 of every clip the saved model has been trained on, so a retrain
+# knows what's new
+TRAINED_PATH = "wakeword_multiclass_classifier_final.trained.tsv"
+# per-class probs of the test split, for evaluation/thresholds.py
+TEST_SCORES_PATH = "wakeword_multiclass_test_scores.npz"
+
+# online augmentation (--augment N): N extra variants of every training clip,
+# augmented inside the loader workers and embedded straight into the store as
+# "<path>#<recipe id>-<k>" - no augmented audio is ever written out
+NOISE_DIR = "assets/background"
+
+# --shards <pack>: read clips from a packed corpus (inference/audio_shards.py)
+# instead of walking label_dirs; paths stay the original wav paths
+shards = None
+
+
+def load_encoder(name):
+    if name == "ecapa":
+        from speechbrain.pretrained import EncoderClassifier
+        enc = EncoderClassifier.from_hparams(source="speechbrain/spkrec-ecapa-voxceleb",
+                                             savedir="pretrained_models/ecapa", run_opts={"device": "cpu"})
+        return ecapa_encoder(enc)
+    # wav2vec2 base
+    # weights go to pretrained_models/wav2vec2, where the offline detector looks
+    return wav2vec2_encoder(load_wav2vec2())
+
+
+def list_clips():
+    paths, labels = [], []
+    for lbl, d in label_dirs.items():
+        files = shards.listdir(d) if shards is not None else sorted(os.listdir(d))
+        for f in files:
+            if f.endswith(".wav"):
+                paths.append(os.path.join(d, f))
+                labels.append(lbl)
+    return paths, labels
+
+
+def clip_length(path):
+    if shards is not None:
+        return shards.num_samples(path)
+    # header only, in target-rate samples; unreadable files sort first and fail in the loader
+    try:
+        info = sf.info(path)
+        return int(info.frames * TARGET_SR / info.samplerate)
+    except Exception:
+        return 0
+
+
+class ClipDataset(Dataset):
+    """Decodes (and optionally augments) one clip per item inside the
+    DataLoader workers. Augmentation is seeded by the item's key, so it
+    doesn't matter which worker gets it."""
+
+    def __init__(self, paths, keys=None, augment=None, load=load_audio):
+        self.paths = paths
+        self.keys = keys or paths
+        self.augment = augment
+        self.load = load
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, i):
         try:
-            emb = get_embed(p)
-            if emb.shape[0] != 768:
-                print(f"   [skip] {f} — bad shape {emb.shape}")
-                continue
-            X.append(emb)
-            y.append(lbl)
-            if (i+1) % 25 == 0:
-                print(f"   - {i+1} done")
-        except Exception as err:
-            print(f"   [err] {f}: {err}")
+            x = self.load(self.paths[i])
+            if self.augment is not None:
+                x = self.augment(x, self.keys[i])
+            return i, x, None
+        except Exception as e:
+            return i, None, f"{type(e).__name__}: {e}"
+
+
+def collate(items):
+    return items  # ragged clips, padded per bucket in extract()
+
+
+def _worker_init(_):
+    torch.set_num_threads(1)  # decode + resample only, leave the cores to the model
+
+
+def variant_keys(path, augment, variants):
+    return [f"{path}#{augment.recipe_id}-{k}" for k in range(variants)]
+
+
+def source_of(key):
+    return key.split("#", 1)[0]
+
+
+def embed_into(store, keys, sources, labels, stats, encode, workers, batch_size, max_seconds, augment=None):
+    with ThreadPoolExecutor(16) as ex:
+        lengths = list(ex.map(clip_length, sources))
+    fixed = getattr(encode, "fixed_samples", None)  # wav2vec2: every clip one window long
+    if fixed:
+        lengths = [fixed] * len(lengths)
+    buckets = length_buckets(lengths, batch_size, int(max_seconds * TARGET_SR))
+
+    load = shards.load if shards is not None else load_audio
+    loader = DataLoader(ClipDataset(sources, keys, augment, load), batch_sampler=buckets, collate_fn=collate,
+                        num_workers=workers, worker_init_fn=_worker_init,
+                        prefetch_factor=4 if workers else None, persistent_workers=False)
+
+    n = 0
+    with store:
+        for items in loader:
+            good = [(i, w) for i, w, err in items if err is None and len(w)]
+            store.add_failed([(keys[i], err or "empty clip") for i, w, err in items
+                              if err is not None or not len(w)])
+            if good:
+                if fixed:  # after augmentation, which can change the length
+                    good = [(i, fit_length(w, fixed)) for i, w in good]
+                x, wav_lens = pad_batch([w for _, w in good])
+                with torch.inference_mode():
+                    e = encode(x, wav_lens).float().numpy()
+                store.add(e, [labels[i] for i, _ in good], [keys[i] for i, _ in good],
+                          [stats[keys[i]] for i, _ in good])
+            n += len(items)
+            if n // 500 != (n - len(items)) // 500:
+                print(f"   - {n}/{len(keys)} done")
+
+
+def extract(embedder="wav2vec2", workers=4, batch_size=16, max_seconds=48.0, shard_size=4096,
+            augment=None, variants=0):
+    embedder_id, dim = EMBEDDERS[embedder]
+    store = FeatureStore(os.path.join(FEATURE_ROOT, embedder_id), embedder_id, dim, shard_size)
+    encode = None
+
+    paths, labels = list_clips()
+    label_of = dict(zip(paths, labels))
+    stat = shards.stat if shards is not None else None
+    todo, stats = store.delta(paths, stat=stat)
+    print(f"{len(paths)} clips, {len(paths) - len(todo)} unchanged in {store.root}, {len(todo)} to embed")
+    if todo:
+        encode = load_encoder(embedder)
+        embed_into(store, todo, todo, [label_of[p] for p in todo], stats, encode,
+                   workers, batch_size, max_seconds)
+
+    if augment is not None and variants:
+        keys = [k for p in paths if not is_test(p) for k in variant_keys(p, augment, variants)]
+        todo, stats = store.delta(keys, sources=[source_of(k) for k in keys], stat=stat)
+        print(f"{len(keys)} augmented variants (recipe {augment.recipe_id}), {len(todo)} to embed")
+        if todo:
+            encode = encode or load_encoder(embedder)
+            embed_into(store, todo, [source_of(k) for k in todo], [label_of[source_of(k)] for k in todo],
+                       stats, encode, workers, batch_size, max_seconds, augment)
+    return store
+
+
+def is_test(path):
+    # stable 80/20 split by path, so a clip stays on the same side across retrains
+    # (augmented variants follow their source clip)
+    return int(hashlib.sha1(source_of(path).encode()).hexdigest()[:8], 16) % 5 == 0
+
+
+def load_previous():
+    if not all(os.path.exists(p) for p in (MODEL_PATH, LABEL_ENCODER_PATH, TRAINED_PATH)):
+        return None
+    with open(TRAINED_PATH) as f:
+        trained = dict(line.rstrip("\n").split("\t") for line in f if "\t" in line)
+    embedder_id = trained.pop("#embedder", None)  # feature store the head was fit on
+    return joblib.load(MODEL_PATH), joblib.load(LABEL_ENCODER_PATH), trained, embedder_id
+
+
+def can_partial_fit(clf):
+    return hasattr(clf, "partial_fit") and getattr(clf, "solver", "sgd") in ("sgd", "adam")
+
+
+def update(clf, store, new, old, le, epochs, replay, seed=42):
+    """partial_fit on the new clips plus a random replay sample of the old
+    ones, so the head doesn't drift toward whatever the generators added last.
+    Only new + replay rows are loaded."""
+    rng = np.random.default_rng(seed)
+    n_replay = min(len(old), int(replay * len(new)))
+    picked = [old[i] for i in rng.choice(len(old), n_replay, replace=False)] if n_replay else []
+    X, y, _, _ = store.load(new + picked)
+    y = le.transform(y)
+    for _ in range(epochs):
+        idx = rng.permutation(len(y))
+        clf.partial_fit(X[idx], y[idx])
+    return clf
+
+
+def train(store, full=False, epochs=20, replay=2.0, max_new=0.5, max_stale=0.05, augment=None, variants=0):
+    """Incremental when possible: partial_fit (or warm_start) the saved head on
+    clips it hasn't seen. Falls back to a full fit when there's no saved
+    model, the label set changed, too much of the old data was removed or
+    changed, or the delta is a large part of the set. Augmented variants of
+    the training clips are used for training only, never for the test split."""
+    paths, _ = list_clips()
+    entries = store.select(paths)  # only clips still on disk
+    test_e = [e for e in entries if is_test(e[3])]
+    if augment is not None and variants:
+        entries = store.select(paths + [k for p in paths if not is_test(p)
+                                        for k in variant_keys(p, augment, variants)])
+    train_e = [e for e in entries if not is_test(e[3])]
+    labels = sorted({e[2] for e in entries})
+
+    prev = None if full else load_previous()
+    reason = "--full" if full else "no previous model"
+    if prev is not None:
+        clf, le, trained, embedder_id = prev
+        current = {e[3]: e[6] for e in train_e}
+        new = [e for e in train_e if trained.get(e[3]) != e[6]]
+        old = [e for e in train_e if trained.get(e[3]) == e[6]]
+        stale = sum(current.get(p) != h for p, h in trained.items())
+        reason = None
+        if embedder_id != store.embedder_id:
+            reason = f"features changed {embedder_id} -> {store.embedder_id}"
+        elif list(le.classes_) != labels:
+            reason = f"label set changed {list(le.classes_)} -> {labels}"
+        elif stale > max_stale * len(trained):
+            reason = f"{stale} of {len(trained)} trained clips removed or changed"
+        elif len(new) > max_new * max(len(old), 1):
+            reason = f"{len(new)} new clips vs {len(old)} already trained"
+        elif not (can_partial_fit(clf) or "warm_start" in clf.get_params()):
+            reason = f"{type(clf).__name__} can't be updated incrementally"
 
-X = np.stack(X)
-y = np.array(y)
+    t0 = time.perf_counter()
+    if reason is None and not new:
+        print(f"Nothing new since the last fit ({len(old)} clips), keeping {MODEL_PATH}")
+    elif reason is None and can_partial_fit(clf):
+        print(f"Incremental: partial_fit on {len(new)} new clips (+ replay), {epochs} epochs")
+        clf = update(clf, store, new, old, le, epochs, replay)
+    else:
+        X_tr, y_tr, _, _ = store.load(train_e)
+        if reason is None:
+            print(f"Incremental: warm-start refit of {type(clf).__name__} on {len(y_tr)} clips")
+            clf.set_params(warm_start=True)
+        else:
+            print(f"Full fit on {len(y_tr)} clips ({reason})")
+            le = LabelEncoder().fit(labels)
+            clf = MLPClassifier(hidden_layer_sizes=(100,), max_iter=500, random_state=42)
+        clf.fit(X_tr, le.transform(y_tr))
+        del X_tr
+    print(f"Training took {time.perf_counter() - t0:.1f}s")
 
-le = LabelEncoder()
-y_enc = le.fit_transform(y)
+    print("Classes:", dict(zip(le.classes_, le.transform(le.classes_))))
+    if test_e:
+        X_te, y_te, p_te, _ = store.load(test_e)
+        probs = clf.predict_proba(X_te)
+        print(classification_report(le.transform(y_te), clf.classes_[probs.argmax(axis=1)]))
+        # probs columns follow clf.classes_, so labels and y_true index those columns
+        col = {c: j for j, c in enumerate(clf.classes_)}
+        np.savez(TEST_SCORES_PATH, probs=probs.astype(np.float32),
+                 y_true=np.array([col.get(c, -1) for c in le.transform(y_te)]),
+                 labels=np.array([str(c) for c in le.inverse_transform(clf.classes_)]), paths=np.array(p_te))
 
-print("Classes:", dict(zip(le.classes_, le.transform(le.classes_))))
+    # dump to disk
+    joblib.dump(clf, MODEL_PATH)
+    joblib.dump(le, LABEL_ENCODER_PATH)
+    tmp = TRAINED_PATH + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(f"#embedder\t{store.embedder_id}\n")
+        f.writelines(f"{e[3]}\t{e[6]}\n" for e in train_e)
+    os.replace(tmp, TRAINED_PATH)
 
-X_tr, X_te, y_tr, y_te = train_test_split(X, y_enc, test_size=0.2, random_state=42)
 
-clf = MLPClassifier(hidden_layer_sizes=(100,), max_iter=500, random_state=42)
-clf.fit(X_tr, y_tr)
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Extract features into shards, then train the multiclass head")
+    ap.add_argument("--embedder", choices=sorted(EMBEDDERS), default="wav2vec2")
+    ap.add_argument("--workers", type=int, default=4, help="DataLoader decode workers")
+    ap.add_argument("--batch-size", type=int, default=16)
+    ap.add_argument("--max-seconds", type=float, default=48.0, help="cap on padded audio per batch")
+    ap.add_argument("--shard-size", type=int, default=4096)
+    ap.add_argument("--extract-only", action="store_true")
+    ap.add_argument("--train-only", action="store_true")
+    ap.add_argument("--full", action="store_true", help="ignore the saved model, fit from scratch")
+    ap.add_argument("--epochs", type=int, default=20, help="partial_fit passes over new + replay clips")
+    ap.add_argument("--replay", type=float, default=2.0, help="old clips replayed per new clip")
+    ap.add_argument("--augment", type=int, default=0, metavar="N",
+                    help="N online-augmented variants per training clip (noise, speed, pitch, gain, shift)")
+    ap.add_argument("--aug-seed", type=int, default=0, help="new seed = new set of variants")
+    ap.add_argument("--noise-dir", default=NOISE_DIR)
+    ap.add_argument("--shards", default=None, help="packed corpus (inference/audio_shards.py) to read instead")
+    args = ap.parse_args()
+    shards = open_shards(args.shards)
 
-y_pr = clf.predict(X_te)
-print(classification_report(y_te, y_pr))
+    augment = None
+    if args.augment:
+        noise = NoiseBank(args.noise_dir) if os.path.isdir(args.noise_dir) else None
+        if noise is None:
+            print(f"[WARN] {args.noise_dir} not found, augmenting without noise")
+        augment = Augmenter(noise, seed=args.aug_seed)
 
-# dump to disk
-joblib.dump(clf, "wakeword_multiclass_classifier_final.joblib")
-joblib.dump(le, "wakeword_label_encoder_final.joblib")
+    if args.train_only:
+        embedder_id, dim = EMBEDDERS[args.embedder]
+        store = FeatureStore(os.path.join(FEATURE_ROOT, embedder_id), embedder_id, dim)
+    else:
+        print("Grabbing features...")
+        store = extract(args.embedder, args.workers, args.batch_size, args.max_seconds, args.shard_size,
+                        augment, args.augment)
+    if not args.extract_only:
+        train(store, args.full, args.epochs, args.replay, augment=augment, variants=args.augment)
@@ -1,18 +1,114 @@
+# ecapacombine.py
+# ECAPA + trained head as one raw-wav -> logits graph, exported to ONNX and
+# TorchScript for inference/backends.py.
+#
+#   python evaluation/ecapacombine.py --head wakeword_classifier.joblib --check clip.wav
+#
+# SpeechBrain's Fbank takes torch.stft(return_complex=True), which the ONNX
+# exporter rejects, so the graph uses ExportFbank: the same STFT as a conv1d
+# over fixed DFT kernels, then SpeechBrain's own mel filterbank. It is checked
+# against SpeechBrain's Fbank when the model is built, and the exported files
+# are checked against the eager model after export.
+
+import argparse
+import math
+import os
+import sys
+import joblib
+import numpy as np
 import torch
 import torch.nn as nn
 from speechbrain.pretrained import EncoderClassifier
-import torch.nn.functional as F  # might be used later, left in
+import torch.nn.functional as F
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "inference"))
+from heads import fold_sklearn
+from audio_io import load_audio
+
+
+def head_from_sklearn(clf, scaler=None):
+    """Rebuild a trained sklearn head (LogisticRegression / MLPClassifier,
+    192-dim input) as torch layers, with the scaler folded into the first
+    Linear. Output is logits such that softmax(logits) == predict_proba,
+    binary models get a constant 0 logit for class 0 (softmax([0, z]) ==
+    sigmoid(z)). Folding is shared with inference/heads.py.
+    """
+    Ws, bs, act, output = fold_sklearn(clf, scaler)
+    if output != "softmax":
+        raise ValueError("one-vs-rest multiclass heads can't be expressed as softmax logits")
+    if Ws[0].shape[0] != 192:
+        raise ValueError(f"head expects {Ws[0].shape[0]}-dim input, ECAPA gives 192")
+
+    act = {"relu": nn.ReLU, "tanh": nn.Tanh, "logistic": nn.Sigmoid, "identity": nn.Identity}[act]
+    layers = []
+    for i, (W, b) in enumerate(zip(Ws, bs)):
+        lin = nn.Linear(W.shape[0], W.shape[1])
+        lin.weight.data.copy_(torch.tensor(W.T, dtype=torch.float32))
+        lin.bias.data.copy_(torch.tensor(b, dtype=torch.float32))
+        layers.append(lin)
+        if i < len(Ws) - 1:
+            layers.append(act())
+    return nn.Sequential(*layers)
+
+
+class ExportFbank(nn.Module):
+    """SpeechBrain Fbank (no deltas / context) with only real-valued ops:
+    the STFT is a strided conv1d over windowed cos / -sin kernels, so
+    |X|^2 = re^2 + im^2 without complex tensors."""
+
+    def __init__(self, fbank):
+        super().__init__()
+        if fbank.deltas or fbank.context:
+            raise ValueError("ExportFbank covers plain fbanks only")
+        stft = fbank.compute_STFT
+        self.n_fft = stft.n_fft
+        self.hop = stft.hop_length
+        self.center = stft.center
+        self.pad_mode = stft.pad_mode
+        # torch.stft centres a shorter window inside n_fft
+        left = (self.n_fft - stft.win_length) // 2
+        window = F.pad(stft.window.float(), (left, self.n_fft - stft.win_length - left))
+        k = torch.arange(self.n_fft // 2 + 1, dtype=torch.float64)[:, None]
+        n = torch.arange(self.n_fft, dtype=torch.float64)[None, :]
+        angle = 2 * math.pi * k * n / self.n_fft
+        kernels = torch.cat([torch.cos(angle), -torch.sin(angle)]).float() * window
+        self.register_buffer("kernels", kernels[:, None, :])
+        self.compute_fbanks = fbank.compute_fbanks
+
+    def forward(self, wav):
+        x = wav.unsqueeze(1)
+        if self.center:
+            x = F.pad(x, (self.n_fft // 2, self.n_fft // 2), mode=self.pad_mode)
+        re, im = F.conv1d(x, self.kernels, stride=self.hop).chunk(2, dim=1)
+        power = (re * re + im * im).transpose(1, 2)  # (B, frames, bins), like spectral_magnitude
+        return self.compute_fbanks(power)
+
+
+def check_fbank(export, fbank, wav, tol=1e-2):
+    """Max |diff| in dB between ExportFbank and SpeechBrain's Fbank."""
+    with torch.no_grad():
+        err = float((export(wav) - fbank(wav)).abs().max())
+    if err > tol:
+        raise RuntimeError(f"exportable fbank differs from SpeechBrain's by {err:.3g} dB")
+    return err
+
 
 class ECAPAExportModel(nn.Module):
-    def __init__(self, hdim=100, outdim=4):
+    def __init__(self, head=None, hdim=100, outdim=4, source="speechbrain/spkrec-ecapa-voxceleb"):
         super().__init__()
-        # pull just the embedding model (we don't need the full classifier)
-        self.ecapa = EncoderClassifier.from_hparams(
-            source="speechbrain/spkrec-ecapa-voxceleb",
+        # raw wav in, so we need the fbank front end + input norm too,
+        # not just the embedding model
+        enc = EncoderClassifier.from_hparams(
+            source=source,
+            savedir="pretrained_models/ecapa",
             run_opts={"device": "cpu"}
-        ).mods.embedding_model
+        )
+        self.features = ExportFbank(enc.mods.compute_features)
+        check_fbank(self.features, enc.mods.compute_features, torch.randn(2, 16000) * 0.1)
+        self.norm = enc.mods.mean_var_norm
+        self.ecapa = enc.mods.embedding_model
 
-        self.head = nn.Sequential(
+        self.head = head if head is not None else nn.Sequential(
             nn.Linear(192, hdim),
             nn.ReLU(),
             nn.Linear(hdim, outdim)
@@ -20,14 +116,48 @@ class ECAPAExportModel(nn.Module):
 
     def forward(self, wav):
         with torch.no_grad():
-            x = self.ecapa(wav)
+            feats = self.features(wav)
+            feats = self.norm(feats, torch.ones(wav.shape[0]))
+            x = self.ecapa(feats)
             if x.dim() == 3:
                 x = x.mean(dim=1)
         return self.head(x)
 
+
+def check_exports(model, wav, onnx_path="ecapa_combined.onnx", pt_path="ecapa_combined.pt", tol=1e-3):
+    """Max |p_export - p_eager| per exported file on one clip; raises above `tol`."""
+    x = torch.as_tensor(wav, dtype=torch.float32)[None, :]
+    with torch.no_grad():
+        ref = torch.softmax(model(x), dim=1).numpy()
+        errs = {pt_path: float(np.abs(torch.softmax(torch.jit.load(pt_path)(x), dim=1).numpy() - ref).max())}
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        print("[WARN] onnxruntime not installed, ONNX export not checked")
+    else:
+        sess = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        logits = sess.run(None, {"audio": x.numpy()})[0]
+        errs[onnx_path] = float(np.abs(torch.softmax(torch.from_numpy(logits), dim=1).numpy() - ref).max())
+    for path, err in errs.items():
+        print(f"{path}: max |p - p_eager| = {err:.2e}")
+    bad = {p: e for p, e in errs.items() if e > tol}
+    if bad:
+        raise SystemExit(f"export mismatch above {tol}: {bad}")
+    return errs
+
+
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Export ECAPA + trained head to ONNX / TorchScript")
+    ap.add_argument("--head", default="wakeword_classifier.joblib")
+    ap.add_argument("--scaler", default="wakeword_scaler.joblib")
+    ap.add_argument("--check", default=None, help="wav to compare the exports against the eager model on")
+    args = ap.parse_args()
+
+    clf = joblib.load(args.head)
+    scaler = joblib.load(args.scaler) if os.path.exists(args.scaler) else None
+
     dummy = torch.randn(1, 16000)
-    model = ECAPAExportModel()
+    model = ECAPAExportModel(head=head_from_sklearn(clf, scaler))
     model.eval()
 
     torch.onnx.export(
@@ -36,8 +166,8 @@ if __name__ == "__main__":
         "ecapa_combined.onnx",
         input_names=["audio"],
         output_names=["logits"],
-        dynamic_axes={"audio": {1: "time"}},
-        opset_version=11
+        dynamic_axes={"audio": {0: "batch", 1: "time"}, "logits": {0: "batch"}},
+        opset_version=17
     )
 
     print("ONNX saved as ecapa_combined.onnx")
@@ -45,3 +175,7 @@ if __name__ == "__main__":
     traced = torch.jit.trace(model, dummy)
     traced.save("ecapa_combined.pt")
     print("TorchScript model saved as ecapa_combined.pt")
+
+    # a real clip when given, else 1.5 s of noise at speech level
+    wav = load_audio(args.check) if args.check else np.random.default_rng(0).standard_normal(24000) * 0.1
+    check_exports(model, wav)
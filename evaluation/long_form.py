@@ -0,0 +1,270 @@
+# long_form.py
+# False accepts per hour on long recordings - the production KPI the clip
+# testbenches can't measure.
+#
+#   python evaluation/long_form.py recordings/*.wav --workers 16
+#   python evaluation/long_form.py --background assets/background --hours 24   # noise, looped to 24 h
+#   python evaluation/long_form.py day.flac --binary --scores long_form_scores.npz
+#
+# Every file is cut into segments of whole windows (same WINDOW_S / HOP_S as
+# inference/detector.py). Segments are scored on a process pool, one backend
+# per worker with the CPU threads split between them: a segment is read with
+# one seek, its windows are strided views (no copies until batching) and go
+# through the embedder `--batch` at a time. With the VAD on, frame energies
+# are computed once per segment and the EnergyGate decides per window from
+# slices of them (its noise floor starts fresh per segment).
+#
+# That makes the result close to, not identical with, StreamingDetector on
+# the same audio: the live gate carries its noise floor across the whole
+# stream, and here no window spans two files.
+#
+# The per-window probabilities come back in order and the detector's own
+# Trigger / MultiTrigger (threshold + refractory) run over them on one
+# timeline, files laid end to end. Reported: false accepts, FA/hour (per
+# phrase in multiclass mode), windows scored / gated, wall time and
+# real-time factor. --scores keeps every window's probs, so
+# evaluation/thresholds.py can sweep thresholds against FA/hour without
+# re-embedding.
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "inference"))
+from audio_io import TARGET_SR, resample
+from detector import (BACKEND, HEAD_PATH, HOP_S, LABEL_ENCODER_PATH, MULTI_BACKEND, MULTI_HEAD_PATH,
+                      PHRASE_THRESHOLDS, REFRACTORY_S, THRESH, WINDOW_S, load_backend)
+from streaming import replay_triggers
+from vad import EnergyGate
+
+AUDIO_EXTS = (".wav", ".flac", ".ogg")
+SEGMENT_S = 600  # audio per pool task, in whole windows
+TORCH_BACKENDS = ("speechbrain", "wav2vec2", "torchscript")
+
+# --- filled in per worker ---
+backend = None
+n_classes = 0
+use_vad = True
+batch = 64
+
+
+def list_audio(paths, background=None):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += sorted(os.path.join(p, f) for f in os.listdir(p) if f.lower().endswith(AUDIO_EXTS))
+        else:
+            files.append(p)
+    if background:
+        files += sorted(os.path.join(background, f) for f in os.listdir(background)
+                        if f.lower().endswith(AUDIO_EXTS))
+    return files
+
+
+def num_samples(path):
+    info = sf.info(path)
+    return int(info.frames * TARGET_SR // info.samplerate)
+
+
+def plan_segments(files, win, hop, segment_s=SEGMENT_S, hours=None):
+    """(path, offset, k0, k1) per task: windows k0..k1-1 of the file whose
+    first sample sits at `offset` on the shared timeline. Window k ends at
+    win + k * hop. With `hours` the file list repeats until it's that long."""
+    per = max(1, int(segment_s * TARGET_SR) // hop)
+    lengths = {}
+    for f in files:
+        try:
+            lengths[f] = num_samples(f)
+        except RuntimeError as e:
+            print(f"[SKIP] {f}: {e}")
+    files = [f for f in files if lengths.get(f, 0) >= win]
+    if not files:
+        return [], 0
+
+    segments, offset = [], 0
+    target = int(hours * 3600 * TARGET_SR) if hours else None
+    while True:
+        for f in files:
+            n_win = (lengths[f] - win) // hop + 1
+            segments += [(f, offset, k, min(k + per, n_win)) for k in range(0, n_win, per)]
+            offset += lengths[f]
+            if target is not None and offset >= target:
+                return segments, offset
+        if target is None:
+            return segments, offset
+
+
+def read_span(path, start, stop):
+    """Mono float32 samples [start, stop) at TARGET_SR, one seek."""
+    with sf.SoundFile(path) as f:
+        fs = f.samplerate
+        f.seek(start * fs // TARGET_SR)
+        x = f.read(-(-(stop - start) * fs // TARGET_SR), dtype="float32", always_2d=True)
+    x = x.mean(axis=1) if x.shape[1] > 1 else x[:, 0]
+    x = resample(x, fs, TARGET_SR)
+    if len(x) < stop - start:
+        x = np.pad(x, (0, stop - start - len(x)))
+    return x[:stop - start]
+
+
+def _init_worker(binary, backend_name, threads, vad, batch_size):
+    global backend, n_classes, use_vad, batch
+    if backend_name in TORCH_BACKENDS:  # onnx hosts needn't have torch at all
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    backend = load_backend(backend_name, head=HEAD_PATH if binary else MULTI_HEAD_PATH,
+                           batch_size=batch_size, threads=threads)
+    # warm-up window, and the column count for segments the VAD gates entirely
+    n_classes = backend.predict_proba([np.zeros(int(WINDOW_S * TARGET_SR), dtype=np.float32)]).shape[1]
+    use_vad = vad
+    batch = batch_size
+
+
+def score_segment(task, win, hop):
+    """Runs in a worker. Returns (probs (n, C) float32, scored mask (n,))."""
+    path, _, k0, k1 = task
+    start = k0 * hop
+    x = read_span(path, start, start + win + (k1 - k0 - 1) * hop)
+    windows = np.lib.stride_tricks.sliding_window_view(x, win)[::hop]
+
+    scored = np.ones(len(windows), dtype=bool)
+    if use_vad:
+        gate = EnergyGate()
+        if hop % gate.frame == 0 and win % gate.frame == 0:
+            energy_db, zcr = gate.frame_stats(x)
+            fw, fh = win // gate.frame, hop // gate.frame
+            for i in range(len(windows)):
+                scored[i] = gate.decide(energy_db[i * fh:i * fh + fw], zcr[i * fh:i * fh + fw])
+        else:
+            for i, w in enumerate(windows):
+                scored[i] = gate(w)
+
+    idx = np.flatnonzero(scored)
+    probs = np.zeros((len(windows), n_classes), dtype=np.float32)
+    for i in range(0, len(idx), batch):
+        probs[idx[i:i + batch]] = backend.predict_proba([windows[j] for j in idx[i:i + batch]])
+    return probs, scored
+
+
+def _score(args):
+    return score_segment(*args)
+
+
+def locate(segments, t):
+    """(file, seconds into it) of an absolute sample on the timeline."""
+    best = segments[0]
+    for seg in segments:
+        if seg[1] <= t:
+            best = seg
+        else:
+            break
+    return best[0], (t - best[1]) / TARGET_SR
+
+
+def main():
+    ap = argparse.ArgumentParser(description="False accepts per hour on long-form audio")
+    ap.add_argument("inputs", nargs="*", help="audio files or folders")
+    ap.add_argument("--background", default=None, help="also use every file in this folder, end to end")
+    ap.add_argument("--hours", type=float, default=None, help="repeat the inputs until this much audio")
+    ap.add_argument("--binary", action="store_true", help="single-phrase binary head")
+    ap.add_argument("--backend", default=None)
+    ap.add_argument("--threshold", type=float, default=THRESH, help="binary mode only")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--batch", type=int, default=64, help="windows per embedder call")
+    ap.add_argument("--segment", type=float, default=SEGMENT_S, help="seconds of audio per pool task")
+    ap.add_argument("--no-vad", action="store_true")
+    ap.add_argument("--out", default=None, help="CSV of every false accept")
+    ap.add_argument("--json", default=None, help="write the summary here too")
+    ap.add_argument("--scores", default=None, help="save per-window probs (.npz)")
+    args = ap.parse_args()
+
+    files = list_audio(args.inputs, args.background)
+    if not files:
+        ap.error("no audio given (inputs or --background)")
+    win, hop = int(WINDOW_S * TARGET_SR), int(HOP_S * TARGET_SR)
+    segments, total = plan_segments(files, win, hop, args.segment, args.hours)
+    if not segments:
+        sys.exit("nothing long enough to hold one window")
+    hours = total / TARGET_SR / 3600
+    backend_name = args.backend or (BACKEND if args.binary else MULTI_BACKEND)
+
+    labels, threshold = None, args.threshold
+    if not args.binary:
+        from backends import load_labels
+        labels, threshold = load_labels(MULTI_HEAD_PATH, LABEL_ENCODER_PATH), PHRASE_THRESHOLDS
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    print(f"{hours:.2f} h in {len(segments)} segments, {args.workers} workers x {threads} threads "
+          f"({backend_name}, {WINDOW_S}s window / {HOP_S * 1000:.0f}ms hop)")
+
+    t0 = time.perf_counter()
+    ends, probs, scored = [], [], []
+    done_s = 0.0
+    with ProcessPoolExecutor(args.workers, mp_context=mp.get_context("spawn"), initializer=_init_worker,
+                             initargs=(args.binary, backend_name, threads, not args.no_vad, args.batch)) as ex:
+        for n, (seg, (p, s)) in enumerate(zip(segments, ex.map(_score, [(seg, win, hop) for seg in segments])), 1):
+            _, offset, k0, k1 = seg
+            ends.append(offset + win + np.arange(k0, k1, dtype=np.int64) * hop)
+            probs.append(p)
+            scored.append(s)
+            done_s += (win + (k1 - k0 - 1) * hop) / TARGET_SR
+            if n % 20 == 0 or n == len(segments):
+                wall = time.perf_counter() - t0
+                print(f"   - {n}/{len(segments)} segments, {done_s / 3600:.2f} h, {done_s / wall:.0f}x real time")
+    wall = time.perf_counter() - t0
+
+    ends = np.concatenate(ends)
+    probs = np.concatenate(probs)
+    scored = np.concatenate(scored)
+    fired = replay_triggers(ends, probs, threshold, REFRACTORY_S, labels, scored, TARGET_SR)
+
+    summary = {
+        "hours": round(hours, 4), "files": len(files), "backend": backend_name,
+        "window_s": WINDOW_S, "hop_s": HOP_S, "refractory_s": REFRACTORY_S, "vad": not args.no_vad,
+        "threshold": threshold, "windows": int(len(scored)), "windows_scored": int(scored.sum()),
+        "false_accepts": len(fired), "fa_per_hour": round(len(fired) / hours, 3),
+        "wall_s": round(wall, 2), "rtf": round(wall / (total / TARGET_SR), 5),
+        "x_real_time": round(total / TARGET_SR / wall, 1), "workers": args.workers, "threads": threads,
+    }
+    if labels is not None:
+        summary["fa_per_hour_by_phrase"] = {
+            l: round(sum(1 for _, k, _ in fired if k == i) / hours, 3)
+            for i, l in enumerate(labels) if l in threshold}
+
+    print("\n=== LONG-FORM FALSE ACCEPTS ===")
+    print(f"{summary['hours']:.2f} h, {summary['windows_scored']}/{summary['windows']} windows scored")
+    print(f"False accepts: {len(fired)} -> {summary['fa_per_hour']:.3f} / hour")
+    for l, v in summary.get("fa_per_hour_by_phrase", {}).items():
+        print(f"   {l:<14} {v:.3f} / hour")
+    print(f"Wall {wall:.1f}s, RTF {summary['rtf']:.4f} ({summary['x_real_time']:.0f}x real time)")
+
+    if args.out:
+        with open(args.out, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["file", "t_s", "label", "prob"])
+            for t, k, p in fired:
+                path, t_s = locate(segments, t)
+                w.writerow([path, round(t_s, 2), labels[k] if k is not None else "wakeword", round(p, 4)])
+        print(f"False accepts -> {args.out}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.scores:
+        np.savez(args.scores, ends=ends, probs=probs, scored=scored, hours=hours,
+                 labels=np.array(labels if labels is not None else ["negative", "wakeword"]),
+                 sr=TARGET_SR, refractory_s=REFRACTORY_S)
+        print(f"Window scores -> {args.scores}")
+
+
+if __name__ == "__main__":
+    main()
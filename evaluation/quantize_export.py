@@ -0,0 +1,151 @@
+# quantize_export.py
+# int8 versions of the ECAPA + head export (see ecapacombine.py) and an
+# accuracy-vs-float report on the testbench sets.
+#
+#   python evaluation/ecapacombine.py                     # float artifacts first
+#   python evaluation/quantize_export.py                  # static int8, calibrated
+#   python evaluation/quantize_export.py --mode dynamic   # no calibration data needed
+#
+# ONNX is the only quantized artifact: onnxruntime.quantization covers the
+# Conv1d stack as well as the Linear layers (static QDQ with per-channel
+# weights, calibrated on our own clips, or dynamic). torch's dynamic
+# quantization only reaches nn.Linear, which would leave ECAPA nearly fp32,
+# so the TorchScript export stays float.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import numpy as np
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "inference"))
+sys.path.insert(0, os.path.join(base_dir, "evaluation"))
+from audio_io import load_audio
+from backends import OnnxBackend, predict_files
+import testbench_openwakeword as tb
+
+# --- Config ---
+FLOAT_ONNX = "ecapa_combined.onnx"
+INT8_ONNX = "ecapa_combined_int8.onnx"
+REPORT = "quantization_report.json"
+CALIB_DIRS = [
+    "data/training_data/finalnotwakeword",
+    "data/training_data/finalheyroom",
+    "data/training_data/finalhiroom",
+    "data/training_data/finalwakeupRoom",
+]
+
+
+def calibration_clips(per_dir, seed=0):
+    rng = random.Random(seed)
+    paths = []
+    for d in CALIB_DIRS:
+        if not os.path.isdir(d):
+            print(f"[calib] missing {d}, skipping")
+            continue
+        files = sorted(f for f in os.listdir(d) if f.endswith(".wav"))
+        paths += [os.path.join(d, f) for f in rng.sample(files, min(per_dir, len(files)))]
+    return paths
+
+
+def quantize_onnx(mode, calib_paths):
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    prepped = FLOAT_ONNX.replace(".onnx", "_prep.onnx")
+    quant_pre_process(FLOAT_ONNX, prepped)
+
+    if mode == "dynamic":
+        quantize_dynamic(prepped, INT8_ONNX, weight_type=QuantType.QInt8)
+    else:
+        class ClipReader(CalibrationDataReader):
+            # one clip per step - the graph has a dynamic time axis
+            def __init__(self, paths):
+                self.it = iter(paths)
+
+            def get_next(self):
+                p = next(self.it, None)
+                if p is None:
+                    return None
+                return {"audio": load_audio(p)[None, :]}
+
+        quantize_static(prepped, INT8_ONNX, ClipReader(calib_paths),
+                        quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QInt8, weight_type=QuantType.QInt8)
+    os.remove(prepped)
+    print(f"ONNX int8 saved as {INT8_ONNX} ({mode})")
+
+
+def evaluate(backend):
+    # same sets, threshold and metrics as testbench_openwakeword.py
+    results, probs_all = [], []
+    t0 = time.perf_counter()
+    for d, label in [(tb.positive_dir, "positive"), (tb.negative_dir, "negative")]:
+        paths = [os.path.join(d, f) for f in sorted(os.listdir(d)) if f.endswith(".wav")]
+        probs, ok, failed = predict_files(backend, paths, load_audio)
+        for p, e in failed:
+            print(f"Failed on {os.path.basename(p)}: {e}")
+        if ok:
+            results += tb.to_results(ok, probs[:, 1], label)
+            probs_all.append(probs[:, 1])
+    secs = time.perf_counter() - t0
+    accuracy, correct, total, conf = tb.summarize(results)
+    summary = {
+        "accuracy": round(accuracy, 3),
+        "correct": correct,
+        "total": total,
+        "confusion": {f"{t}->{p}": n for (t, p), n in sorted(conf.items())},
+        "seconds": round(secs, 2),
+        "ms_per_clip": round(1000 * secs / total, 2) if total else None,
+    }
+    return summary, (np.concatenate(probs_all) if probs_all else np.zeros(0))
+
+
+def compare(float_backend, int8_backend, float_path, int8_path):
+    f_sum, f_probs = evaluate(float_backend)
+    q_sum, q_probs = evaluate(int8_backend)
+    same = len(f_probs) == len(q_probs) and len(f_probs) > 0
+    diff = np.abs(f_probs - q_probs) if same else None
+    agree = float(np.mean((f_probs > tb.threshold) == (q_probs > tb.threshold))) if same else None
+    return {
+        "float": dict(f_sum, size_mb=round(os.path.getsize(float_path) / 1e6, 2)),
+        "int8": dict(q_sum, size_mb=round(os.path.getsize(int8_path) / 1e6, 2)),
+        "accuracy_delta": round(q_sum["accuracy"] - f_sum["accuracy"], 3),
+        "decision_agreement": agree,
+        "max_abs_prob_diff": float(diff.max()) if same else None,
+        "mean_abs_prob_diff": float(diff.mean()) if same else None,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["static", "dynamic"], default="static")
+    ap.add_argument("--calib-per-dir", type=int, default=200)
+    ap.add_argument("--skip-report", action="store_true")
+    args = ap.parse_args()
+
+    if not os.path.exists(FLOAT_ONNX):
+        sys.exit(f"{FLOAT_ONNX} not found - run evaluation/ecapacombine.py first")
+
+    calib = calibration_clips(args.calib_per_dir) if args.mode == "static" else []
+    if args.mode == "static":
+        print(f"Calibrating on {len(calib)} clips...")
+    quantize_onnx(args.mode, calib)
+
+    if args.skip_report:
+        sys.exit(0)
+
+    report = {"mode": args.mode, "calibration_clips": len(calib), "threshold": tb.threshold}
+    print("Scoring ONNX float vs int8...")
+    report["onnx"] = compare(OnnxBackend(FLOAT_ONNX), OnnxBackend(INT8_ONNX), FLOAT_ONNX, INT8_ONNX)
+    r = report["onnx"]
+    print(f"onnx acc {r['float']['accuracy']:.2f}% -> {r['int8']['accuracy']:.2f}% | "
+          f"{r['float']['ms_per_clip']} -> {r['int8']['ms_per_clip']} ms/clip | "
+          f"{r['float']['size_mb']} -> {r['int8']['size_mb']} MB | agree {r['decision_agreement']}")
+    with open(REPORT, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {REPORT}")
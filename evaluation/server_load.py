@@ -0,0 +1,164 @@
+# server_load.py
+# Load test for inference/server.py: many concurrent PCM streams from one
+# process, each paced like a live mic (or faster), detections collected per
+# stream.
+#
+#   python inference/server.py &
+#   python evaluation/server_load.py --streams 64 --seconds 60
+#   python evaluation/server_load.py --streams 16 --audio data/samples_xtts/positive --speed 4
+#   python evaluation/server_load.py --unix /run/wakeword.sock --streams 200 --speed 0   # as fast as it takes it
+#
+# Every stream plays its own audio: --audio files / folders dealt round-robin
+# and looped to --seconds (with a second of silence between clips), or quiet
+# noise when none are given. Latency is measured client side, from sending
+# the sample a detection's window ends on to receiving the detection, so it
+# includes batching wait, model time and the socket both ways.
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "inference"))
+from audio_io import TARGET_SR, load_audio
+from server import parse_addr
+
+SR = TARGET_SR
+
+
+def list_audio(paths):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            files += sorted(os.path.join(p, f) for f in os.listdir(p) if f.endswith(".wav"))
+        else:
+            files.append(p)
+    return files
+
+
+def stream_audio(i, files, seconds, seed=0):
+    """int16 PCM for stream i: its share of `files` end to end, or noise."""
+    n = int(seconds * SR)
+    if not files:
+        rng = np.random.default_rng([seed, i])
+        return (rng.standard_normal(n) * 100).astype(np.int16)
+    gap = np.zeros(SR, dtype=np.float32)
+    parts, total, k = [], 0, i
+    while total < n:
+        x = load_audio(files[k % len(files)])
+        parts += [x, gap]
+        total += len(x) + len(gap)
+        k += 1
+    x = np.concatenate(parts)[:n]
+    return np.clip(np.round(x * 32768), -32768, 32767).astype(np.int16)
+
+
+async def run_stream(i, addr, pcm, chunk, speed, delay):
+    await asyncio.sleep(delay)
+    kind, where = parse_addr(addr)
+    if kind == "unix":
+        reader, writer = await asyncio.open_unix_connection(where)
+    else:
+        reader, writer = await asyncio.open_connection(*where)
+    writer.write((json.dumps({"room": f"sim{i}", "format": "s16"}) + "\n").encode())
+    hello = json.loads(await reader.readline())
+    if not hello.get("ok"):
+        raise RuntimeError(f"stream {i} refused: {hello}")
+
+    sent_at = np.zeros(len(pcm) // chunk + 2)  # wall time each chunk went out
+    result = {"stream": i, "detections": [], "latency_ms": []}
+
+    async def receive():
+        async for line in reader:
+            msg = json.loads(line)
+            if msg.get("done"):
+                result.update(windows=msg["windows"], gated=msg["gated"])
+                return
+            k = min((int(msg["t"] * SR) - 1) // chunk, len(sent_at) - 1)  # chunk holding the window's last sample
+            msg["client_ms"] = round((time.perf_counter() - sent_at[k]) * 1000, 1)
+            result["detections"].append(msg)
+            result["latency_ms"].append(msg["client_ms"])
+
+    recv = asyncio.create_task(receive())
+    t0 = time.perf_counter()
+    for k, start in enumerate(range(0, len(pcm), chunk)):
+        if speed > 0:
+            wait = t0 + start / SR / speed - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        writer.write(pcm[start:start + chunk].tobytes())
+        await writer.drain()  # server backpressure shows up here
+        sent_at[k] = time.perf_counter()
+    result["send_s"] = time.perf_counter() - t0
+    writer.write_eof()
+    await recv
+    writer.close()
+    return result
+
+
+async def run(args, audio):
+    chunk = int(args.chunk_ms * SR / 1000)
+    delays = np.linspace(0, args.ramp, len(audio), endpoint=False)
+    return await asyncio.gather(*(run_stream(i, args.addr, pcm, chunk, args.speed, d)
+                                  for i, (pcm, d) in enumerate(zip(audio, delays))), return_exceptions=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Load test the multi-stream detection server")
+    ap.add_argument("--addr", default="127.0.0.1:8765", help="host:port or unix:/path")
+    ap.add_argument("--unix", default=None, help="shorthand for --addr unix:PATH")
+    ap.add_argument("--streams", type=int, default=16)
+    ap.add_argument("--seconds", type=float, default=30.0, help="audio per stream")
+    ap.add_argument("--audio", nargs="*", default=[], help="wav files / folders to play, else noise")
+    ap.add_argument("--speed", type=float, default=1.0, help="x real time per stream, 0 = unpaced")
+    ap.add_argument("--chunk-ms", type=float, default=100.0)
+    ap.add_argument("--ramp", type=float, default=1.0, help="seconds over which streams connect")
+    ap.add_argument("--json", default=None)
+    args = ap.parse_args()
+    if args.unix:
+        args.addr = f"unix:{args.unix}"
+
+    files = list_audio(args.audio)
+    audio = [stream_audio(i, files, args.seconds) for i in range(args.streams)]
+    print(f"{args.streams} streams x {args.seconds:.0f}s -> {args.addr} "
+          f"({'unpaced' if args.speed <= 0 else f'{args.speed:g}x real time'})")
+
+    t0 = time.perf_counter()
+    results = asyncio.run(run(args, audio))
+    wall = time.perf_counter() - t0
+
+    ok = [r for r in results if isinstance(r, dict)]
+    for r in results:
+        if not isinstance(r, dict):
+            print(f"[FAIL] {type(r).__name__}: {r}")
+    lat = np.array([x for r in ok for x in r["latency_ms"]])
+    audio_s = sum(len(a) for a in audio) / SR
+    summary = {
+        "streams": len(ok), "failed": len(results) - len(ok), "audio_s": round(audio_s, 1),
+        "wall_s": round(wall, 2), "x_real_time": round(audio_s / wall, 1),
+        "windows": sum(r.get("windows", 0) for r in ok), "gated": sum(r.get("gated", 0) for r in ok),
+        "detections": int(sum(len(r["detections"]) for r in ok)),
+        "latency_ms": {q: round(float(np.percentile(lat, p)), 1) for q, p in (("p50", 50), ("p95", 95), ("p99", 99))}
+        if len(lat) else None,
+        "slow_streams": sum(r["send_s"] > 1.2 * args.seconds / args.speed for r in ok) if args.speed > 0 else None,
+    }
+    print(f"{summary['streams']} streams done ({summary['failed']} failed), {audio_s / 3600:.2f} h audio "
+          f"in {wall:.1f}s = {summary['x_real_time']}x real time")
+    print(f"{summary['windows']} windows ({summary['gated']} gated), {summary['detections']} detections")
+    if summary["latency_ms"]:
+        print(f"Detection latency p50 {summary['latency_ms']['p50']} ms, p95 {summary['latency_ms']['p95']} ms, "
+              f"p99 {summary['latency_ms']['p99']} ms")
+    if summary["slow_streams"]:
+        print(f"[WARN] {summary['slow_streams']} streams couldn't be sent in real time - server is behind")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"summary": summary, "streams": ok}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
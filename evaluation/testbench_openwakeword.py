@@ -1,9 +1,16 @@
 # testbench_openwakeword.py
 # Testbench to evaluate a custom wakeword model with labeled samples
+#
+#   python evaluation/testbench_openwakeword.py              # single process
+#   python evaluation/testbench_openwakeword.py --workers 16 # sharded over a process pool
+#   python evaluation/testbench_openwakeword.py --shards data/packed/eval  # clips from a pack
 
 import os
+import sys
 import csv
-import soundfile as sf
+import argparse
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from collections import Counter
 from speechbrain.pretrained import EncoderClassifier
@@ -12,75 +19,186 @@ from sklearn.linear_model import LogisticRegression
 import joblib
 import torch
 
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "inference"))
+from batching import ecapa_encoder, embed_files
+from embedding_cache import EmbeddingCache, embed_files_cached, embedder_id
+from backends import make_backend, predict_files
+from audio_io import load_audio
+from audio_shards import open_shards
+
 # --- Config ---
 model_path = "wakeword_classifier.joblib"
 positive_dir = "training_data/heyroom"
 negative_dir = "training_data/not_heyroom"
 output_csv = "custom_model_test_results.csv"
 threshold = 0.5
+batch_size = 32
+cache_dir = "cache/embeddings"  # None disables the embedding cache
+ecapa_dir = "pretrained_models/ecapa"
+backend_name = "speechbrain"  # or "torchscript" / "onnx", see evaluation/ecapacombine.py
+shards_dir = None  # packed corpus (inference/audio_shards.py) holding both dirs, None reads the wavs
+
+# filled in by load_models(), once per process
+model = None
+embedder = None
+backend = None
+cache = None
+shards = None
+pool = None
+n_workers = 1
 
-# --- Load model and scaler ---
-print("Loading model and scaler...")
-model = joblib.load(model_path)
-# --- Load ECAPA embedder ---
-embedder = EncoderClassifier.from_hparams(
-    source="speechbrain/spkrec-ecapa-voxceleb",
-    run_opts={"device": "cpu"},
-    savedir="pretrained_models/ecapa"
-)
+# --- Load model and embedder ---
+def load_models(threads=None):
+    global embedder, backend
+    if threads:
+        torch.set_num_threads(threads)
+    if backend_name != "speechbrain":
+        backend = make_backend(backend_name, threads=threads)
+        return
+    embedder = EncoderClassifier.from_hparams(
+        source="speechbrain/spkrec-ecapa-voxceleb",
+        run_opts={"device": "cpu"},
+        savedir=ecapa_dir
+    )
 
 # --- Embedding extractor ---
+def load(path):
+    return shards.load(path) if shards is not None else load_audio(path)
+
 def extract_embedding(wav_path):
-    signal, sr = sf.read(wav_path)
-    if len(signal.shape) > 1:  # Stereo to mono
-        signal = np.mean(signal, axis=1)
+    signal = load(wav_path)
     emb = embedder.encode_batch(torch.tensor(signal).unsqueeze(0)).squeeze().detach().numpy()
     return emb
 
+def embed_paths(paths):
+    return embed_files(paths, ecapa_encoder(embedder), load=load, batch_size=batch_size)
+
+# --- Process pool workers ---
+def _init_worker(threads, shards_root=None):
+    global shards
+    torch.set_num_interop_threads(1)
+    shards = open_shards(shards_root)
+    load_models(threads)
+
+def _run_shard(paths):
+    # runs inside a worker; errors go back as strings so they always pickle
+    if backend:
+        out, ok, failed = predict_files(backend, paths, load, workers=2)
+    else:
+        out, ok, failed = embed_files(paths, ecapa_encoder(embedder), load=load,
+                                      batch_size=batch_size, workers=2)
+    return out, ok, [(p, str(e)) for p, e in failed]
+
+def run_sharded(paths):
+    # contiguous shards in sorted order and ex.map keeps order, so the merged
+    # result is identical to a single-process run whatever the worker count
+    if not paths:
+        return np.zeros((0, 0), dtype=np.float32), [], []
+    n_shards = n_workers * 4  # a few shards per worker evens out slow files
+    size = max(1, -(-len(paths) // n_shards))
+    parts = list(pool.map(_run_shard, [paths[i:i + size] for i in range(0, len(paths), size)]))
+    parts_ok = [p for p in parts if p[1]]
+    out = np.concatenate([p[0] for p in parts_ok]) if parts_ok else np.zeros((0, 0), dtype=np.float32)
+    ok = [f for p in parts for f in p[1]]
+    failed = [f for p in parts for f in p[2]]
+    return out, ok, failed
+
 # --- Evaluate a directory ---
 def evaluate_dir(directory, label):
     results = []
-    for fname in os.listdir(directory):
-        if fname.endswith(".wav"):
-            path = os.path.join(directory, fname)
-            try:
-                emb = extract_embedding(path)
-                prob = model.predict_proba([emb])[0][1]
-                prediction = "positive" if prob > threshold else "negative"
-                correct = prediction == label
-                results.append((fname, prob, prediction, label, correct))
-            except Exception as e:
-                print(f"Failed on {fname}: {e}")
+    files = shards.listdir(directory) if shards is not None else sorted(os.listdir(directory))
+    paths = [os.path.join(directory, f) for f in files if f.endswith(".wav")]
+    embed_fn = run_sharded if pool else embed_paths
+    if backend_name != "speechbrain":
+        if pool:
+            all_probs, ok, failed = run_sharded(paths)
+        else:
+            all_probs, ok, failed = predict_files(backend, paths, load)
+    elif cache:
+        key_for = shards.key_for if shards is not None else None
+        embs, ok, failed = embed_files_cached(cache, paths, embed_fn, key_for=key_for)
+    else:
+        embs, ok, failed = embed_fn(paths)
+    for path, e in failed:
+        print(f"Failed on {os.path.basename(path)}: {e}")
+    if not ok:
+        return results
+    if backend_name != "speechbrain":
+        probs = all_probs[:, 1]
+    else:
+        probs = model.predict_proba(embs)[:, 1]  # one vectorized call for the whole dir
+    return to_results(ok, probs, label)
+
+def to_results(paths, probs, label):
+    results = []
+    for path, prob in zip(paths, probs):
+        prediction = "positive" if prob > threshold else "negative"
+        correct = prediction == label
+        results.append((os.path.basename(path), float(prob), prediction, label, correct))
     return results
 
-# --- Run tests ---
-print("Evaluating positive samples...")
-positive_results = evaluate_dir(positive_dir, "positive")
+# --- Summary Metrics ---
+def summarize(all_results):
+    total = len(all_results)
+    correct = sum(1 for r in all_results if r[-1])
+    accuracy = correct / total * 100 if total else 0
 
-print("Evaluating negative samples...")
-negative_results = evaluate_dir(negative_dir, "negative")
+    # Confusion matrix
+    conf_matrix = Counter()
+    for _, _, pred, truth, _ in all_results:
+        conf_matrix[(truth, pred)] += 1
+    return accuracy, correct, total, conf_matrix
 
-all_results = positive_results + negative_results
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=1, help="processes to shard files across")
+    ap.add_argument("--shards", default=shards_dir, help="packed corpus to read the clips from")
+    args = ap.parse_args()
+    shards = open_shards(args.shards)
 
-# --- Summary Metrics ---
-total = len(all_results)
-correct = sum(1 for r in all_results if r[-1])
-accuracy = correct / total * 100 if total else 0
-
-# Confusion matrix
-conf_matrix = Counter()
-for _, _, pred, truth, _ in all_results:
-    conf_matrix[(truth, pred)] += 1
-
-print("\n✅ Accuracy: {:.2f}% ({} out of {})".format(accuracy, correct, total))
-print("\nConfusion Matrix:")
-for (truth, pred), count in conf_matrix.items():
-    print(f"{truth} predicted as {pred}: {count}")
-
-# --- Write CSV ---
-with open(output_csv, "w", newline="") as f:
-    writer = csv.writer(f)
-    writer.writerow(["Filename", "Score", "Prediction", "GroundTruth", "Correct"])
-    writer.writerows(all_results)
-
-print(f"\nResults written to {output_csv}")
\ No newline at end of file
+    print("Loading model...")
+    model = joblib.load(model_path)
+    cache = EmbeddingCache(embedder_id("ecapa-voxceleb", ecapa_dir), 192, root=cache_dir) if cache_dir else None
+
+    n_workers = args.workers
+    if n_workers > 1:
+        # one embedder per worker, intra-op threads split so N workers don't
+        # each spin up a full set of torch threads
+        threads = max(1, (os.cpu_count() or 1) // n_workers)
+        print(f"Starting {n_workers} workers x {threads} torch threads...")
+        pool = ProcessPoolExecutor(n_workers, mp_context=mp.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(threads, args.shards))
+    else:
+        load_models()
+
+    # --- Run tests ---
+    print("Evaluating positive samples...")
+    positive_results = evaluate_dir(positive_dir, "positive")
+
+    print("Evaluating negative samples...")
+    negative_results = evaluate_dir(negative_dir, "negative")
+
+    if pool:
+        pool.shutdown()
+
+    all_results = positive_results + negative_results
+
+    if cache:
+        cache.close()
+        print(f"Embedding cache: {cache.stats()}")
+
+    accuracy, correct, total, conf_matrix = summarize(all_results)
+
+    print("\n✅ Accuracy: {:.2f}% ({} out of {})".format(accuracy, correct, total))
+    print("\nConfusion Matrix:")
+    for (truth, pred), count in conf_matrix.items():
+        print(f"{truth} predicted as {pred}: {count}")
+
+    # --- Write CSV ---
+    with open(output_csv, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Filename", "Score", "Prediction", "GroundTruth", "Correct"])
+        writer.writerows(all_results)
+
+    print(f"\nResults written to {output_csv}")
@@ -0,0 +1,342 @@
+# thresholds.py
+# Threshold sweep and operating-point report from stored scores - nothing is
+# re-embedded and no model is loaded.
+#
+#   python evaluation/thresholds.py custom_model_test_results.csv
+#   python evaluation/thresholds.py eval_scores.npz --long long_form_scores.npz --max-fa-per-hour 0.5
+#   python evaluation/thresholds.py wakeword_multiclass_test_scores.npz --long long_form_scores.npz \
+#       --max-fa-per-hour 0.2 --max-miss 0.05 --html thresholds.html
+#
+# Clip scores (what a threshold misses):
+#   .csv  testbench_openwakeword.py output (Score, GroundTruth positive/negative)
+#   .npz  infer_wakeword.py eval_scores.npz (y_true, probs) - binary
+#   .npz  ecapa.py wakeword_multiclass_test_scores.npz (probs (N, C), y_true, labels)
+# Long-form scores (what a threshold false-accepts per hour):
+#   .npz  evaluation/long_form.py --scores (ends, probs, scored, hours, labels)
+#
+# Per class (one vs rest; binary is the single class "wakeword") every
+# distinct score is a threshold: one sort + cumsum gives ROC, DET and PR
+# curves, AUC, AP and the EER. FA/hour is counted exactly with the
+# detector's refractory period. The chosen threshold is the lowest one that
+# meets --max-fa-per-hour (or --max-fpr on clips), i.e. the fewest misses
+# within the false-accept budget; with only --max-miss it's the highest one
+# that keeps the miss rate; with no target, the EER point. Multiclass
+# thresholds are then checked together through MultiTrigger.
+#
+# Writes a compact JSON report (curves thinned to --points) and optionally a
+# self-contained HTML page with SVG plots.
+
+import os
+import sys
+import csv
+import json
+import argparse
+
+import numpy as np
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(base_dir, "inference"))
+from streaming import replay_triggers
+
+NEGATIVE = "not wakeword"
+REFRACTORY_S = 1.0  # used when the long-form file doesn't say
+FA_CEILING = 1000.0  # FA/hour past which lower thresholds aren't swept
+
+
+# --- loading ---
+def load_clip_scores(path, negative=NEGATIVE):
+    """(probs (N, C), y (N,) class index, labels, classes to sweep)."""
+    if path.endswith(".csv"):
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        p = np.array([float(r["Score"]) for r in rows])
+        y = np.array([r["GroundTruth"] == "positive" for r in rows], dtype=int)
+        return np.stack([1 - p, p], axis=1), y, ["negative", "wakeword"], [1]
+    z = np.load(path, allow_pickle=False)
+    probs = np.asarray(z["probs"], dtype=np.float64)
+    y = np.asarray(z["y_true"]).astype(int)
+    if probs.ndim == 1:
+        return np.stack([1 - probs, probs], axis=1), y, ["negative", "wakeword"], [1]
+    labels = [str(l) for l in z["labels"]] if "labels" in z.files else [str(i) for i in range(probs.shape[1])]
+    return probs, y, labels, [i for i, l in enumerate(labels) if l != negative]
+
+
+def load_long(path):
+    z = np.load(path, allow_pickle=False)
+    labels = [str(l) for l in z["labels"]]
+    scored = z["scored"] if "scored" in z.files else np.ones(len(z["ends"]), dtype=bool)
+    refractory = float(z["refractory_s"]) if "refractory_s" in z.files else REFRACTORY_S
+    sr = int(z["sr"]) if "sr" in z.files else 16000
+    return {"ends": z["ends"], "probs": z["probs"], "scored": scored, "hours": float(z["hours"]),
+            "labels": labels, "refractory": int(refractory * sr), "sr": sr}
+
+
+# --- clip curves ---
+def curves(scores, positive):
+    """Every distinct score as an accept threshold (score >= t), descending."""
+    order = np.argsort(-scores, kind="stable")
+    s, pos = scores[order], positive[order]
+    tp, fp = np.cumsum(pos), np.cumsum(~pos)
+    last = np.r_[np.flatnonzero(np.diff(s)), len(s) - 1]  # end of each run of equal scores
+    n_pos, n_neg = max(int(pos.sum()), 1), max(int((~pos).sum()), 1)
+    tp, fp = tp[last], fp[last]
+    tpr, fpr = tp / n_pos, fp / n_neg
+    precision = tp / np.maximum(tp + fp, 1)
+    return {"threshold": s[last], "tpr": tpr, "fpr": fpr, "fnr": 1 - tpr, "precision": precision,
+            "n_pos": int(pos.sum()), "n_neg": int((~pos).sum())}
+
+
+def summary_stats(c):
+    fpr, tpr = np.r_[0.0, c["fpr"]], np.r_[0.0, c["tpr"]]
+    auc = float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+    ap = float(np.sum(np.diff(tpr) * c["precision"]))
+    # first threshold where false accepts overtake misses, interpolated
+    i = int(np.argmax(c["fpr"] >= c["fnr"]))
+    if i == 0:
+        eer, t_eer = float((c["fpr"][0] + c["fnr"][0]) / 2), float(c["threshold"][0])
+    else:
+        d0 = c["fnr"][i - 1] - c["fpr"][i - 1]
+        d1 = c["fpr"][i] - c["fnr"][i]
+        w = d0 / (d0 + d1) if d0 + d1 > 0 else 0.0
+        eer = float(c["fpr"][i - 1] + w * (c["fpr"][i] - c["fpr"][i - 1]))
+        t_eer = float(c["threshold"][i - 1] + w * (c["threshold"][i] - c["threshold"][i - 1]))
+    return {"auc": round(auc, 5), "ap": round(ap, 5), "eer": round(eer, 5), "eer_threshold": round(t_eer, 5)}
+
+
+def at_threshold(c, t):
+    """Clip rates when accepting score >= t."""
+    i = np.searchsorted(-c["threshold"], -t, side="right") - 1  # last threshold >= t
+    if i < 0:
+        return {"miss": 1.0, "fpr": 0.0, "precision": 1.0}
+    return {"miss": round(float(c["fnr"][i]), 5), "fpr": round(float(c["fpr"][i]), 6),
+            "precision": round(float(c["precision"][i]), 5)}
+
+
+# --- long-form FA/hour ---
+def count_fires(t, refractory):
+    """Trigger fires over sorted candidate times: a fire only once `refractory`
+    samples have passed since the last fire. Runs split wherever two
+    candidates are >= refractory apart (that candidate always fires), and a
+    run shorter than the refractory period fires exactly once, so only long
+    dense runs are stepped through."""
+    if len(t) == 0:
+        return 0
+    cut = np.flatnonzero(np.diff(t) >= refractory) + 1
+    starts, stops = np.r_[0, cut], np.r_[cut, len(t)]
+    long_runs = np.flatnonzero(t[stops - 1] - t[starts] >= refractory)
+    n = len(starts) - len(long_runs)
+    for r in long_runs:
+        last = None
+        for x in t[starts[r]:stops[r]]:
+            if last is None or x - last >= refractory:
+                n += 1
+                last = x
+    return n
+
+
+def fa_curve(ends, scores, hours, refractory, grid, ceiling=FA_CEILING):
+    """FA/hour of one score column at each threshold of `grid` (ascending).
+    Swept from the top down and stopped once past `ceiling`; lower thresholds
+    get inf."""
+    order = np.argsort(-scores, kind="stable")
+    s = scores[order]
+    fa = np.full(len(grid), np.inf)
+    for j in range(len(grid) - 1, -1, -1):
+        k = np.searchsorted(-s, -grid[j], side="right")  # windows with score >= grid[j]
+        fa[j] = count_fires(np.sort(ends[order[:k]]), refractory) / hours
+        if fa[j] > ceiling:
+            break
+    return fa
+
+
+# --- choosing ---
+def choose(c, grid=None, fa=None, max_fa=None, max_fpr=None, max_miss=None, eer_t=None):
+    """(threshold, rule). Lowest threshold inside the false-accept budget,
+    else highest keeping the miss rate, else the EER point."""
+    if max_fa is not None and fa is not None:
+        # worst FA/hour at this threshold or any higher one, so the pick holds
+        # even where refractory merging makes the curve wiggle
+        worst = np.maximum.accumulate(fa[::-1])[::-1]
+        ok = np.flatnonzero(worst <= max_fa)
+        t = float(grid[ok[0]]) if len(ok) else 1.0
+        return t, f"fa_per_hour <= {max_fa}"
+    if max_fpr is not None:
+        ok = np.flatnonzero(c["fpr"] <= max_fpr)
+        t = float(c["threshold"][ok[-1]]) if len(ok) else 1.0
+        return t, f"fpr <= {max_fpr}"
+    if max_miss is not None:
+        ok = np.flatnonzero(c["fnr"] <= max_miss)
+        t = float(c["threshold"][ok[0]]) if len(ok) else 0.0
+        return t, f"miss <= {max_miss}"
+    return eer_t, "eer"
+
+
+def thin(c, keys, points):
+    n = len(c["threshold"])
+    idx = np.unique(np.linspace(0, n - 1, min(points, n)).round().astype(int)) if n else []
+    return {k: [round(float(v), 6) for v in np.asarray(c[k])[idx]] for k in keys}
+
+
+def sweep(clip_path, long_path=None, negative=NEGATIVE, max_fa=None, max_fpr=None, max_miss=None,
+          points=200, step=0.001):
+    probs, y, labels, classes = load_clip_scores(clip_path, negative)
+    long = load_long(long_path) if long_path else None
+    grid = np.round(np.arange(0, 1 + step / 2, step), 6)
+    report = {"clips": clip_path, "long_form": long_path, "n_clips": int(len(y)),
+              "targets": {"max_fa_per_hour": max_fa, "max_fpr": max_fpr, "max_miss": max_miss},
+              "classes": {}}
+    if long:
+        report["hours"] = round(long["hours"], 4)
+
+    for k in classes:
+        name = labels[k]
+        c = curves(probs[:, k], y == k)
+        stats = summary_stats(c)
+        fa = fa_at = None
+        if long:
+            col = long["labels"].index(name) if name in long["labels"] else (1 if len(long["labels"]) == 2 else None)
+            if col is None:
+                print(f"[WARN] {name!r} not in the long-form labels {long['labels']}, no FA/hour")
+            else:
+                ok = long["scored"]
+                ends, scores = long["ends"][ok], long["probs"][ok, col]
+                fa = fa_curve(ends, scores, long["hours"], long["refractory"], grid)
+                # exact at the chosen threshold, which needn't be on the grid (EER, --max-miss)
+                fa_at = lambda t: count_fires(np.sort(ends[scores >= t]), long["refractory"]) / long["hours"]
+        t, rule = choose(c, grid, fa, max_fa, max_fpr, max_miss, stats["eer_threshold"])
+        op = {"threshold": round(t, 4), "rule": rule, **at_threshold(c, t)}
+        if fa_at is not None:
+            op["fa_per_hour"] = round(float(fa_at(t)), 3)
+        if max_miss is not None and op["miss"] > max_miss:
+            op["warning"] = f"miss {op['miss']} > {max_miss} at this threshold"
+        entry = {"n_pos": c["n_pos"], "n_neg": c["n_neg"], **stats, "operating_point": op,
+                 "curve": thin(c, ["threshold", "tpr", "fpr", "precision"], points)}
+        if fa is not None:
+            finite = np.isfinite(fa)
+            idx = np.flatnonzero(finite)[::max(1, int(finite.sum()) // points)]
+            entry["fa_curve"] = {"threshold": grid[idx].tolist(), "fa_per_hour": np.round(fa[idx], 3).tolist()}
+        report["classes"][name] = entry
+
+    report["thresholds"] = {n: e["operating_point"]["threshold"] for n, e in report["classes"].items()}
+    if long and len(long["labels"]) > 2:
+        # all phrases at once through the detector's MultiTrigger (shared refractory)
+        th = {n: t for n, t in report["thresholds"].items() if n in long["labels"]}
+        fired = replay_triggers(long["ends"], long["probs"], th, long["refractory"] / long["sr"],
+                                long["labels"], long["scored"], long["sr"])
+        report["combined_fa_per_hour"] = round(len(fired) / long["hours"], 3)
+    return report
+
+
+# --- HTML ---
+def _probit(p):
+    from scipy.special import ndtri
+    return ndtri(np.clip(np.asarray(p, dtype=np.float64), 1e-4, 1 - 1e-4))
+
+
+def svg_plot(title, series, xlabel, ylabel, fx=None, fy=None, xticks=None, yticks=None, w=360, h=280):
+    """Tiny SVG line chart. fx / fy map data to plot space (e.g. probit)."""
+    fx, fy = fx or (lambda v: np.asarray(v, dtype=np.float64)), fy or (lambda v: np.asarray(v, dtype=np.float64))
+    xs = [fx(s[1]) for s in series]
+    ys = [fy(s[2]) for s in series]
+    allx = np.concatenate(xs + ([fx(xticks)] if xticks else []))
+    ally = np.concatenate(ys + ([fy(yticks)] if yticks else []))
+    allx, ally = allx[np.isfinite(allx)], ally[np.isfinite(ally)]
+    x0, x1 = (allx.min(), allx.max()) if len(allx) else (0, 1)
+    y0, y1 = (ally.min(), ally.max()) if len(ally) else (0, 1)
+    x1, y1 = (x1 if x1 > x0 else x0 + 1), (y1 if y1 > y0 else y0 + 1)
+    L, B = 48, 36
+    px = lambda v: L + (v - x0) / (x1 - x0) * (w - L - 10)
+    py = lambda v: h - B - (v - y0) / (y1 - y0) * (h - B - 24)
+    colors = ["#1f77b4", "#d62728", "#2ca02c", "#ff7f0e", "#9467bd"]
+    out = [f'<svg width="{w}" height="{h}" xmlns="http://www.w3.org/2000/svg" font-size="10">',
+           f'<text x="{w / 2}" y="14" text-anchor="middle" font-size="12">{title}</text>',
+           f'<rect x="{L}" y="24" width="{w - L - 10}" height="{h - B - 24}" fill="none" stroke="#999"/>',
+           f'<text x="{w / 2}" y="{h - 4}" text-anchor="middle">{xlabel}</text>',
+           f'<text x="10" y="{h / 2}" transform="rotate(-90 10 {h / 2})" text-anchor="middle">{ylabel}</text>']
+    for t in xticks or []:
+        out.append(f'<text x="{px(float(fx([t])[0])):.1f}" y="{h - B + 12}" text-anchor="middle">{t:g}</text>')
+    for t in yticks or []:
+        out.append(f'<text x="{L - 4}" y="{py(float(fy([t])[0])) + 3:.1f}" text-anchor="end">{t:g}</text>')
+    for i, ((name, _, _), x, y) in enumerate(zip(series, xs, ys)):
+        ok = np.isfinite(x) & np.isfinite(y)
+        pts = " ".join(f"{px(a):.1f},{py(b):.1f}" for a, b in zip(x[ok], y[ok]))
+        col = colors[i % len(colors)]
+        out.append(f'<polyline points="{pts}" fill="none" stroke="{col}" stroke-width="1.5"/>')
+        out.append(f'<text x="{L + 6}" y="{38 + 12 * i}" fill="{col}">{name}</text>')
+    out.append("</svg>")
+    return "".join(out)
+
+
+def write_html(report, path):
+    cls = report["classes"]
+    ser = lambda x, y: [(n, e["curve"][x], e["curve"][y]) for n, e in cls.items()]
+    det = [(n, e["curve"]["fpr"], 1 - np.asarray(e["curve"]["tpr"])) for n, e in cls.items()]
+    ticks = [0.001, 0.01, 0.05, 0.2, 0.5]
+    plots = [
+        svg_plot("ROC", ser("fpr", "tpr"), "false accept rate", "hit rate", xticks=[0, 0.5, 1], yticks=[0, 0.5, 1]),
+        svg_plot("DET", det, "false accept rate", "miss rate", _probit, _probit, ticks, ticks),
+        svg_plot("Precision / recall", ser("tpr", "precision"), "recall", "precision",
+                 xticks=[0, 0.5, 1], yticks=[0, 0.5, 1]),
+    ]
+    fa = [(n, e["fa_curve"]["threshold"], e["fa_curve"]["fa_per_hour"]) for n, e in cls.items() if "fa_curve" in e]
+    if fa:
+        log = lambda v: np.log10(np.asarray(v, dtype=np.float64) + 0.01)
+        plots.append(svg_plot(f"False accepts / hour ({report['hours']:.1f} h)", fa, "threshold", "FA / hour",
+                              fy=log, xticks=[0, 0.5, 1], yticks=[0, 0.1, 1, 10, 100]))
+    rows = "".join(
+        f"<tr><td>{n}</td><td>{e['n_pos']}/{e['n_neg']}</td><td>{e['auc']}</td><td>{e['ap']}</td>"
+        f"<td>{e['eer']:.4f} @ {e['eer_threshold']:.3f}</td><td><b>{e['operating_point']['threshold']}</b></td>"
+        f"<td>{e['operating_point']['rule']}</td><td>{e['operating_point']['miss']}</td>"
+        f"<td>{e['operating_point']['fpr']}</td><td>{e['operating_point'].get('fa_per_hour', '')}</td></tr>"
+        for n, e in cls.items())
+    combined = (f"<p>All phrases together (MultiTrigger): <b>{report['combined_fa_per_hour']}</b> FA/hour</p>"
+                if "combined_fa_per_hour" in report else "")
+    html = (f"<!doctype html><meta charset=utf-8><title>Wakeword thresholds</title>"
+            f"<body style='font-family:sans-serif'><h2>Wakeword thresholds</h2>"
+            f"<p>{report['clips']} ({report['n_clips']} clips)"
+            f"{' + ' + report['long_form'] if report['long_form'] else ''}</p>"
+            f"<table border=1 cellpadding=4 cellspacing=0><tr><th>class</th><th>pos/neg</th><th>AUC</th>"
+            f"<th>AP</th><th>EER</th><th>threshold</th><th>rule</th><th>miss</th><th>FPR</th><th>FA/h</th></tr>"
+            f"{rows}</table>{combined}<div>{''.join(plots)}</div></body>")
+    with open(path, "w") as f:
+        f.write(html)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Threshold sweep / operating points from stored scores")
+    ap.add_argument("scores", help="clip scores: testbench .csv, eval_scores.npz or multiclass test .npz")
+    ap.add_argument("--long", default=None, help="long_form.py --scores file, for FA/hour")
+    ap.add_argument("--negative", default=NEGATIVE, help="multiclass: the non-wakeword class")
+    ap.add_argument("--max-fa-per-hour", type=float, default=None)
+    ap.add_argument("--max-fpr", type=float, default=None, help="false-accept budget on clips instead")
+    ap.add_argument("--max-miss", type=float, default=None)
+    ap.add_argument("--points", type=int, default=200, help="points per curve in the report")
+    ap.add_argument("--json", default="thresholds.json")
+    ap.add_argument("--html", default=None)
+    args = ap.parse_args()
+    if args.max_fa_per_hour is not None and not args.long:
+        ap.error("--max-fa-per-hour needs --long scores")
+
+    report = sweep(args.scores, args.long, args.negative, args.max_fa_per_hour, args.max_fpr,
+                   args.max_miss, args.points)
+    for name, e in report["classes"].items():
+        op = e["operating_point"]
+        fa = f", {op['fa_per_hour']} FA/h" if "fa_per_hour" in op else ""
+        print(f"{name:<14} AUC {e['auc']:.4f}  AP {e['ap']:.4f}  EER {e['eer']:.4f} @ {e['eer_threshold']:.3f} | "
+              f"threshold {op['threshold']} ({op['rule']}): miss {op['miss']:.4f}, FPR {op['fpr']:.5f}{fa}")
+        if "warning" in op:
+            print(f"   [WARN] {op['warning']}")
+    if "combined_fa_per_hour" in report:
+        print(f"All phrases together: {report['combined_fa_per_hour']} FA/hour")
+    print(f"thresholds: {json.dumps(report['thresholds'])}")
+
+    with open(args.json, "w") as f:
+        json.dump(report, f, separators=(",", ":"))
+    print(f"Report -> {args.json}")
+    if args.html:
+        write_html(report, args.html)
+        print(f"HTML -> {args.html}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""audio_io.py
+Shared audio loading for the eval / training scripts.
+
+- resamplers are built once per (src, dst) rate and reused, instead of a new
+  torchaudio Resample (and new filter design) for every file
+- stereo is downmixed to mono
+- optional float16 output to halve RAM when holding lots of clips
+- AudioPrefetcher decodes on a thread pool ahead of the consumer, so the
+  model isn't sitting idle waiting on disk (soundfile and torch both drop
+  the GIL while working)
+- torch / torchaudio are only imported when a file actually needs
+  resampling, so 16 kHz-only callers (the ONNX backend) never load them
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+import numpy as np
+import soundfile as sf
+
+TARGET_SR = 16000
+# bump when load_audio's output changes (decoder, downmix, resampler) -
+# embedding caches are versioned on it
+FRONTEND = "sf-mono-torchaudio-sinc-v1"
+
+
+@lru_cache(maxsize=None)
+def get_resampler(src, dst):
+    import torchaudio
+    return torchaudio.transforms.Resample(orig_freq=src, new_freq=dst)
+
+
+def resample(x, src, dst=TARGET_SR):
+    if src == dst:
+        return x
+    import torch
+    with torch.inference_mode():
+        y = get_resampler(src, dst)(torch.from_numpy(np.ascontiguousarray(x, dtype=np.float32)))
+    return y.numpy()
+
+
+def load_audio(path, sr=TARGET_SR, dtype=np.float32):
+    """Decode to a mono 1-D array at `sr`."""
+    x, fs = sf.read(path, dtype="float32", always_2d=True)
+    x = x.mean(axis=1) if x.shape[1] > 1 else x[:, 0]
+    x = resample(x, fs, sr)
+    return x.astype(dtype, copy=False)
+
+
+class AudioPrefetcher:
+    """Iterate (path, audio, error) in input order while up to `prefetch`
+    files are decoded ahead on `workers` threads."""
+
+    def __init__(self, paths, load=load_audio, workers=4, prefetch=64):
+        self.paths = paths
+        self.load = load
+        self.workers = workers
+        self.prefetch = max(1, prefetch)
+
+    def __iter__(self):
+        it = iter(self.paths)
+        with ThreadPoolExecutor(self.workers) as ex:
+            pending = deque((p, ex.submit(self.load, p)) for p in islice(it, self.prefetch))
+            try:
+                while pending:
+                    p, fut = pending.popleft()
+                    nxt = next(it, None)
+                    if nxt is not None:
+                        pending.append((nxt, ex.submit(self.load, nxt)))
+                    try:
+                        yield p, fut.result(), None
+                    except Exception as e:
+                        yield p, None, e
+            finally:
+                for _, fut in pending:
+                    fut.cancel()
+
+    def __len__(self):
+        return len(self.paths)
+
+
+def iter_chunks(paths, load=load_audio, chunk=256, workers=4):
+    """Yield (waves, ok_paths, failed) chunks. The next chunk keeps decoding
+    in the background while the caller works on the current one."""
+    waves, ok, failed = [], [], []
+    for p, x, err in AudioPrefetcher(paths, load, workers, prefetch=chunk):
+        if err is not None:
+            failed.append((p, err))
+        else:
+            waves.append(x)
+            ok.append(p)
+        if len(waves) >= chunk:
+            yield waves, ok, failed
+            waves, ok, failed = [], [], []
+    if waves or failed:
+        yield waves, ok, failed
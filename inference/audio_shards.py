@@ -0,0 +1,282 @@
+"""audio_shards.py
+Packed audio corpus: many small wavs in a few big int16 blobs.
+
+Walking tens of thousands of 1-3 s wavs is dominated by open/stat/header
+parsing, not by reading samples. A pack holds every clip as 16 kHz int16 PCM
+back to back, plus one index:
+
+    <root>/meta.json          sr, dtype
+    <root>/blob-00000.pcm16   raw int16 samples, read back with np.memmap
+    <root>/index.tsv          blob, offset, length, label, sha1, key, size, mtime_ns, source
+
+`source` is the wav the clip was packed from and sha1/size/mtime_ns are that
+file's at pack time. `key` is the content hash the embedding cache and the
+feature store see: the source sha1 when the source already was 16 kHz mono
+int16 (the packed samples are exactly what load_audio gives for the loose
+file, so their entries are shared), else the sha1 of the packed PCM, since
+resampling / re-quantizing made it different audio. Reading a clip is a
+slice of a memmap - no copy until it's converted to float.
+
+    python inference/audio_shards.py pack data/packed/train data/training_data/final*
+    python inference/audio_shards.py info data/packed/train
+
+Scripts take `--shards <root>` and then list / load clips through it instead
+of the directories (`shards.listdir(d)`, `shards.load(path)`).
+"""
+
+import hashlib
+import io
+import json
+import os
+
+import numpy as np
+import soundfile as sf
+
+from audio_io import TARGET_SR, AudioPrefetcher, resample
+
+BLOB_BYTES = 1 << 30
+
+
+class AudioShards:
+    def __init__(self, root):
+        self.root = root
+        with open(os.path.join(root, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.sr = self.meta["sr"]
+        self._load_index()
+        self._blobs = {}
+
+    def _load_index(self):
+        blob, offset, length, label, sha1, key, size, mtime, source = [], [], [], [], [], [], [], [], []
+        path = os.path.join(self.root, "index.tsv")
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 8:  # packed before the key column: hash the PCM on demand
+                        parts.insert(5, "")
+                    if len(parts) != 9:
+                        continue  # torn last line, see embedding_cache.py
+                    blob.append(int(parts[0]))
+                    offset.append(int(parts[1]))
+                    length.append(int(parts[2]))
+                    label.append(parts[3])
+                    sha1.append(parts[4])
+                    key.append(parts[5] or None)
+                    size.append(int(parts[6]))
+                    mtime.append(int(parts[7]))
+                    source.append(parts[8])
+        self.blob = np.array(blob, dtype=np.int32)
+        self.offset = np.array(offset, dtype=np.int64)
+        self.length = np.array(length, dtype=np.int64)
+        self.labels = label
+        self.sha1 = sha1
+        self.keys = key
+        self.size = size
+        self.mtime_ns = mtime
+        self.sources = source
+        # newest entry wins when a source was re-packed
+        self._by_source = {s: i for i, s in enumerate(source)}
+        self._by_dir = {}
+        for s, i in self._by_source.items():
+            self._by_dir.setdefault(os.path.normpath(os.path.dirname(s)), []).append(os.path.basename(s))
+
+    # memmaps don't pickle cheaply - DataLoader / process pool workers reopen them
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_blobs"] = {}
+        return state
+
+    def _blob(self, b):
+        mm = self._blobs.get(b)
+        if mm is None:
+            mm = self._blobs[b] = np.memmap(blob_path(self.root, b), dtype=np.int16, mode="r")
+        return mm
+
+    def __len__(self):
+        return len(self._by_source)
+
+    # --- by index ---
+    def view(self, i):
+        """int16 samples of clip i, a view into the blob."""
+        o = self.offset[i]
+        return self._blob(self.blob[i])[o:o + self.length[i]]
+
+    def audio(self, i, dtype=np.float32):
+        return self.view(i).astype(dtype) / np.float32(32768)
+
+    def key(self, i):
+        """Content hash of clip i for the caches (see the module docstring)."""
+        if self.keys[i] is None:
+            self.keys[i] = hashlib.sha1(self.view(i).tobytes()).hexdigest()
+        return self.keys[i]
+
+    # --- by source path, drop-in for the directory walkers ---
+    def __contains__(self, path):
+        return os.path.normpath(path) in self._by_source
+
+    def index_of(self, path):
+        return self._by_source[os.path.normpath(path)]
+
+    def load(self, path, sr=TARGET_SR, dtype=np.float32):
+        """Same contract as audio_io.load_audio, served from the pack."""
+        x = self.audio(self.index_of(path))
+        return resample(x, self.sr, sr).astype(dtype, copy=False)
+
+    def listdir(self, directory):
+        """Basenames of the clips packed from `directory`, sorted."""
+        return sorted(self._by_dir.get(os.path.normpath(directory), []))
+
+    def num_samples(self, path):
+        return int(self.length[self.index_of(path)])
+
+    def stat(self, path):
+        """(size, mtime_ns, content key) for FeatureStore.delta."""
+        i = self.index_of(path)
+        return self.size[i], self.mtime_ns[i], self.key(i)
+
+    def key_for(self, path, sr=TARGET_SR):
+        # EmbeddingCache.key_for format; equal to the loose file's key only
+        # when packing didn't change the samples
+        return f"{self.key(self.index_of(path))}:{sr}"
+
+
+def blob_path(root, b):
+    return os.path.join(root, f"blob-{b:05d}.pcm16")
+
+
+def open_shards(root):
+    return AudioShards(root) if root else None
+
+
+def _read_clip(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    st = os.stat(path)
+    with sf.SoundFile(io.BytesIO(data)) as snd:
+        fs = snd.samplerate
+        lossless = fs == TARGET_SR and snd.channels == 1 and snd.subtype == "PCM_16"
+        x = snd.read(dtype="float32", always_2d=True)
+    x = x.mean(axis=1) if x.shape[1] > 1 else x[:, 0]
+    x = resample(x, fs, TARGET_SR)
+    pcm = np.clip(np.round(x * 32768), -32768, 32767).astype(np.int16)
+    sha1 = hashlib.sha1(data).hexdigest()
+    key = sha1 if lossless else hashlib.sha1(pcm.tobytes()).hexdigest()
+    return pcm, sha1, key, st.st_size, st.st_mtime_ns
+
+
+def pack(root, dirs, workers=8, blob_bytes=BLOB_BYTES):
+    """Append every .wav of `dirs` ("dir" or "dir:label", label defaults to
+    the folder name) to the pack at `root`. Clips whose source size + mtime
+    haven't changed since they were packed are skipped."""
+    os.makedirs(root, exist_ok=True)
+    meta_path = os.path.join(root, "meta.json")
+    if not os.path.exists(meta_path):
+        with open(meta_path, "w") as f:
+            json.dump({"sr": TARGET_SR, "dtype": "int16"}, f)
+    shards = AudioShards(root)
+
+    todo, label_of = [], {}
+    for spec in dirs:
+        d, _, label = spec.partition(":")
+        label = label or os.path.basename(os.path.normpath(d))
+        for f in sorted(os.listdir(d)):
+            if not f.endswith(".wav"):
+                continue
+            p = os.path.normpath(os.path.join(d, f))
+            if p in shards:
+                st = os.stat(p)
+                i = shards.index_of(p)
+                if (shards.size[i], shards.mtime_ns[i]) == (st.st_size, st.st_mtime_ns):
+                    continue
+            todo.append(p)
+            label_of[p] = label
+    print(f"{len(todo)} clips to pack into {root} ({len(shards)} already there)")
+
+    # continue the last blob right after its last indexed clip: drop any
+    # samples a killed run wrote without index lines, including whole blobs
+    # it rolled over to
+    b = int(shards.blob.max()) if len(shards.blob) else 0
+    in_b = shards.blob == b
+    pos = int((shards.offset[in_b] + shards.length[in_b]).max()) if in_b.any() else 0
+    for f in os.listdir(root):
+        if f.startswith("blob-") and f.endswith(".pcm16") and int(f[5:-6]) > b:
+            os.remove(os.path.join(root, f))
+    failed = 0
+    blob_f = _open_blob(root, b, pos)
+    index_path = os.path.join(root, "index.tsv")
+    if os.path.exists(index_path) and os.path.getsize(index_path):
+        with open(index_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+        if torn:
+            with open(index_path, "a") as f:
+                f.write("\n")  # a torn last line stays its own (skipped) line
+    index_f = open(index_path, "a")
+    pending = []
+    try:
+        for n, (p, res, err) in enumerate(AudioPrefetcher(todo, _read_clip, workers, prefetch=256), 1):
+            if err is not None:
+                print(f"[FAIL] {p}: {err}")
+                failed += 1
+                continue
+            pcm, sha1, key, size, mtime = res
+            if pos and (pos + len(pcm)) * 2 > blob_bytes:
+                pending = _commit(blob_f, index_f, pending)
+                blob_f.close()
+                b, pos = b + 1, 0
+                blob_f = _open_blob(root, b, pos)
+            blob_f.write(pcm.tobytes())
+            pending.append(f"{b}\t{pos}\t{len(pcm)}\t{label_of[p]}\t{sha1}\t{key}\t{size}\t{mtime}\t{p}\n")
+            pos += len(pcm)
+            if n % 1000 == 0:
+                pending = _commit(blob_f, index_f, pending)
+                print(f"   - {n}/{len(todo)}")
+        _commit(blob_f, index_f, pending)
+    finally:
+        blob_f.close()
+        index_f.close()
+    print(f"Packed {len(todo) - failed} clips, {failed} failed")
+    return AudioShards(root)
+
+
+def _open_blob(root, b, pos):
+    """Blob b for writing at sample `pos`, anything after it cut off."""
+    path = blob_path(root, b)
+    f = open(path, "r+b" if os.path.exists(path) else "wb")
+    f.truncate(pos * 2)
+    f.seek(pos * 2)
+    return f
+
+
+def _commit(blob_f, index_f, pending):
+    # samples on disk before the index lines that point at them
+    blob_f.flush()
+    os.fsync(blob_f.fileno())
+    index_f.writelines(pending)
+    index_f.flush()
+    return []
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Pack wav folders into int16 shards")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack")
+    p.add_argument("root")
+    p.add_argument("dirs", nargs="+", help="wav folder, optionally folder:label")
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--blob-mb", type=int, default=BLOB_BYTES >> 20)
+    p = sub.add_parser("info")
+    p.add_argument("root")
+    args = ap.parse_args()
+
+    if args.cmd == "pack":
+        pack(args.root, args.dirs, args.workers, args.blob_mb << 20)
+    shards = AudioShards(args.root)
+    hours = shards.length[list(shards._by_source.values())].sum() / shards.sr / 3600
+    print(f"{shards.root}: {len(shards)} clips, {hours:.2f} h, "
+          f"{len(set(shards.blob.tolist()))} blobs")
+    for d in sorted(shards._by_dir):
+        print(f"  {d}: {len(shards._by_dir[d])}")
@@ -0,0 +1,189 @@
+"""augment.py
+Online waveform augmentation for the training feature pipeline.
+
+Instead of rendering noisy / sped-up copies to disk, each training clip is
+augmented on the fly inside the DataLoader workers:
+
+- background noise from a NoiseBank at a random SNR (exact, RMS based)
+- speed: time-stretch without changing pitch (WSOLA)
+- pitch: resample + time-stretch back, so duration is kept
+- gain in dB
+- time shift, zero-filled
+
+Every draw comes from a Generator seeded by (seed, key), where key names the
+clip + variant (e.g. "path#aug3"), so a variant is the same whichever worker
+makes it and in whatever order.
+"""
+
+import hashlib
+import json
+import os
+import zlib
+
+import numpy as np
+
+from audio_io import TARGET_SR, load_audio
+
+NOISE_CACHE = "cache/noise_bank"
+
+
+class NoiseBank:
+    """All noise wavs of a folder decoded once into one contiguous float32
+    array (peak-normalized per file), shared by the online augmenter and
+    scripts/backgroundnoise.py.
+
+    The array is cached as <cache_dir>/<sr>.npy with a names / offsets /
+    lengths index and rebuilt when the noise files change. It is opened as a
+    memmap, so DataLoader and process-pool workers share it through the page
+    cache (pickling a bank sends only its paths)."""
+
+    def __init__(self, noise_dir, sr=TARGET_SR, cache_dir=NOISE_CACHE):
+        self.noise_dir = noise_dir
+        self.sr = sr
+        self.data_path = os.path.join(cache_dir, f"{sr}.npy")
+        index_path = os.path.join(cache_dir, f"{sr}.json")
+        files = sorted(f for f in os.listdir(noise_dir) if f.endswith(".wav"))
+        stamp = [[f, os.path.getsize(os.path.join(noise_dir, f)), os.path.getmtime(os.path.join(noise_dir, f))]
+                 for f in files]
+        index = None
+        if os.path.exists(index_path) and os.path.exists(self.data_path):
+            with open(index_path) as f:
+                index = json.load(f)
+            if index.get("stamp") != stamp:
+                index = None
+        if index is None:
+            index = self._build(files, stamp, index_path)
+        self.names = index["names"]
+        self.offsets = np.array(index["offsets"], dtype=np.int64)
+        self.lengths = np.array(index["lengths"], dtype=np.int64)
+        self._data = None
+
+    def _build(self, files, stamp, index_path):
+        chunks, names = [], []
+        for f in files:
+            x = load_audio(os.path.join(self.noise_dir, f), self.sr)
+            peak = np.abs(x).max() if len(x) else 0.0
+            if peak > 0:
+                chunks.append(x / peak)
+                names.append(f)
+        if not chunks:
+            raise ValueError(f"no usable noise wavs in {self.noise_dir}")
+        lengths = [len(c) for c in chunks]
+        os.makedirs(os.path.dirname(self.data_path) or ".", exist_ok=True)
+        tmp = self.data_path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.concatenate(chunks).astype(np.float32))
+        os.replace(tmp, self.data_path)
+        index = {"sr": self.sr, "names": names, "offsets": np.r_[0, np.cumsum(lengths)[:-1]].tolist(),
+                 "lengths": lengths, "stamp": stamp}
+        with open(index_path, "w") as f:
+            json.dump(index, f)
+        print(f"Noise bank: {len(names)} files, {sum(lengths) / self.sr / 60:.1f} min -> {self.data_path}")
+        return index
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = np.load(self.data_path, mmap_mode="r")
+        return self._data
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_data"] = None  # workers reopen the memmap
+        return state
+
+    def segment(self, k, start, n):
+        """n samples of noise file k from `start` (a fraction of the room
+        left in the file); short files are tiled from that phase."""
+        off, length = self.offsets[k], self.lengths[k]
+        src = self.data[off:off + length]
+        if length >= n:
+            s = int(start * (length - n + 1))
+            return np.array(src[s:s + n])
+        idx = (int(start * length) + np.arange(n)) % length
+        return np.asarray(src)[idx]
+
+    def sample(self, n, rng):
+        k = rng.integers(len(self.lengths))
+        off, length = self.offsets[k], self.lengths[k]
+        start = rng.integers(length)
+        idx = (start + np.arange(n)) % length  # tiles short noise
+        return self.data[off + idx]
+
+
+def time_stretch(x, rate, frame=512, tol=128):
+    """WSOLA: output is len(x) / rate samples long at the original pitch."""
+    if rate == 1.0 or len(x) < 2 * frame:
+        return x
+    hop = frame // 2
+    win = np.hanning(frame).astype(np.float32)
+    n_out = int(len(x) / rate)
+    xp = np.pad(x, (tol, frame + tol))
+    out = np.zeros(n_out + frame, dtype=np.float32)
+    norm = np.zeros_like(out)
+    prev = 0  # input position of the last copied frame (in padded coords, minus tol)
+    for k in range(0, n_out, hop):
+        nominal = int(k * rate)
+        if k == 0:
+            pos = nominal
+        else:
+            # pick the offset whose frame best continues the previous one
+            target = xp[tol + prev + hop: tol + prev + hop + frame]
+            lo = nominal
+            seg = xp[lo: lo + frame + 2 * tol]
+            corr = np.correlate(seg, target, mode="valid")
+            pos = lo - tol + int(np.argmax(corr))
+        pos = min(max(pos, 0), len(x))
+        out[k:k + frame] += xp[tol + pos: tol + pos + frame] * win
+        norm[k:k + frame] += win
+        prev = pos
+    norm[norm < 1e-3] = 1.0
+    return (out / norm)[:n_out]
+
+
+def resample_linear(x, rate):
+    """Play back `rate` times faster (pitch and tempo both change)."""
+    n = int(len(x) / rate)
+    return np.interp(np.arange(n) * rate, np.arange(len(x)), x).astype(np.float32)
+
+
+class Augmenter:
+    def __init__(self, noise=None, snr=(5.0, 20.0), speed=(0.9, 1.1), pitch=(-2.0, 2.0),
+                 gain_db=(-6.0, 6.0), shift_s=0.2, p_noise=0.8, p_speed=0.5, p_pitch=0.5,
+                 p_gain=1.0, p_shift=0.5, seed=0, sr=TARGET_SR):
+        self.noise = noise
+        self.config = dict(snr=snr, speed=speed, pitch=pitch, gain_db=gain_db, shift_s=shift_s,
+                           p_noise=p_noise if noise is not None else 0.0, p_speed=p_speed,
+                           p_pitch=p_pitch, p_gain=p_gain, p_shift=p_shift, seed=seed, sr=sr,
+                           noise_files=list(noise.names) if noise is not None else [])
+        self.__dict__.update({k: v for k, v in self.config.items() if k != "noise_files"})
+
+    @property
+    def recipe_id(self):
+        """Short hash of the settings - features of a different recipe go elsewhere."""
+        return hashlib.sha1(json.dumps(self.config, sort_keys=True).encode()).hexdigest()[:10]
+
+    def rng_for(self, key):
+        return np.random.default_rng([self.seed, zlib.crc32(key.encode())])
+
+    def __call__(self, x, key):
+        rng = self.rng_for(key)
+        y = np.asarray(x, dtype=np.float32)
+        if rng.random() < self.p_pitch:
+            r = 2 ** (rng.uniform(*self.pitch) / 12)
+            y = time_stretch(resample_linear(y, r), 1 / r)
+        if rng.random() < self.p_speed:
+            y = time_stretch(y, rng.uniform(*self.speed))
+        if rng.random() < self.p_shift:
+            s = int(rng.uniform(-self.shift_s, self.shift_s) * self.sr)
+            y = np.concatenate([np.zeros(s, np.float32), y[:len(y) - s]]) if s >= 0 else \
+                np.concatenate([y[-s:], np.zeros(-s, np.float32)])
+        if rng.random() < self.p_noise:
+            n = self.noise.sample(len(y), rng)
+            rms_y = np.sqrt(np.mean(np.square(y, dtype=np.float64)))
+            rms_n = np.sqrt(np.mean(np.square(n, dtype=np.float64)))
+            if rms_y > 0 and rms_n > 0:
+                y = y + n * (rms_y / (rms_n * 10 ** (rng.uniform(*self.snr) / 20)))
+        if rng.random() < self.p_gain:
+            y = y * 10 ** (rng.uniform(*self.gain_db) / 20)
+        return np.clip(y, -1.0, 1.0).astype(np.float32)
@@ -0,0 +1,214 @@
+"""backends.py
+Interchangeable inference engines for ECAPA + wakeword head.
+
+Every backend takes a list of 1-D float32 clips at 16 kHz and returns class
+probabilities (N, n_classes), the same thing sklearn's predict_proba gives,
+so callers can switch engines from config without touching anything else:
+
+    speechbrain  - EncoderClassifier + sklearn head (+ optional scaler)
+    wav2vec2     - torchaudio WAV2VEC2_BASE mean-pooled (what evaluation/ecapa.py
+                   trains the 4-class MLP on) + sklearn head
+    torchscript  - ecapa_combined.pt from evaluation/ecapacombine.py
+    onnx         - ecapa_combined.onnx on ONNX Runtime CPU, full graph opts
+
+Head paths go through heads.load_head, so a converted `.npz` next to the
+joblib (see heads.py) is used instead of sklearn when it exists; the scaler
+is skipped only when the .npz says it was folded in.
+
+The exported models carry their own fbank front end and (scaler-folded)
+head, and end in logits laid out so softmax == predict_proba. Heavy imports
+live inside the constructors so the ONNX path never pulls in torch.
+"""
+
+import os
+
+import numpy as np
+
+from heads import load_head
+from metrics import NULL_METRICS
+
+BACKENDS = ("speechbrain", "wav2vec2", "torchscript", "onnx")
+
+
+def softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def same_length_groups(waves):
+    # exported graphs take (B, T) with no lengths, so only batch exact-equal
+    # lengths together - streaming windows always are
+    groups = {}
+    for i, w in enumerate(waves):
+        groups.setdefault(len(w), []).append(i)
+    return groups.values()
+
+
+class Backend:
+    name = None
+    metrics = NULL_METRICS  # set to a metrics.Metrics for per-stage spans
+
+    def predict_proba(self, waves):
+        raise NotImplementedError
+
+
+class SpeechBrainBackend(Backend):
+    name = "speechbrain"
+
+    def __init__(self, encoder="speechbrain/spkrec-ecapa-voxceleb", head="wakeword_classifier.joblib",
+                 scaler="wakeword_scaler.joblib", savedir="pretrained_models/ecapa", batch_size=32):
+        from batching import ecapa_encoder
+
+        if isinstance(encoder, str):
+            from speechbrain.pretrained import EncoderClassifier
+            encoder = EncoderClassifier.from_hparams(source=encoder, savedir=savedir, run_opts={"device": "cpu"})
+        self.encoder = encoder
+        self.encode = ecapa_encoder(encoder)
+        self.batch_size = batch_size
+        self._set_head(head, scaler)
+
+    def _set_head(self, head, scaler):
+        folded = False
+        if isinstance(head, str):
+            head, folded = load_head(head)
+        if folded:
+            scaler = None  # already folded into the .npz weights
+        elif isinstance(scaler, str):
+            import joblib
+            scaler = joblib.load(scaler) if os.path.exists(scaler) else None
+        self.head = head
+        self.scaler = scaler
+
+    def embed(self, waves):
+        from batching import embed_batch
+        return embed_batch(self.encode, waves, self.batch_size)
+
+    def classify(self, embs):
+        if self.scaler is not None:
+            with self.metrics.span("scaler"):
+                embs = self.scaler.transform(embs)
+        with self.metrics.span("head"):
+            return self.head.predict_proba(embs)
+
+    def predict_proba(self, waves):
+        with self.metrics.span("embed"):
+            embs = self.embed(waves)
+        return self.classify(embs)
+
+
+class Wav2Vec2Backend(SpeechBrainBackend):
+    name = "wav2vec2"
+
+    def __init__(self, head="wakeword_multiclass_classifier.joblib", scaler=None, batch_size=32,
+                 model_dir="pretrained_models/wav2vec2"):
+        from batching import load_wav2vec2, wav2vec2_encoder
+
+        self.encoder = load_wav2vec2(model_dir)
+        self.encode = wav2vec2_encoder(self.encoder)
+        self.batch_size = batch_size
+        self._set_head(head, scaler)
+
+
+class TorchScriptBackend(Backend):
+    name = "torchscript"
+
+    def __init__(self, path="ecapa_combined.pt", threads=None):
+        import torch
+        if threads:
+            torch.set_num_threads(threads)
+        self.torch = torch
+        self.model = torch.jit.load(path, map_location="cpu").eval()
+
+    def predict_proba(self, waves):
+        out = np.zeros((len(waves), 0), dtype=np.float32)
+        for idx in same_length_groups(waves):
+            x = self.torch.from_numpy(np.stack([waves[i] for i in idx]).astype(np.float32))
+            with self.torch.inference_mode(), self.metrics.span("model"):
+                logits = self.model(x).numpy()
+            if out.shape[1] == 0:
+                out = np.zeros((len(waves), logits.shape[1]), dtype=np.float32)
+            out[idx] = softmax(logits)
+        return out
+
+
+class OnnxBackend(Backend):
+    name = "onnx"
+
+    def __init__(self, path="ecapa_combined.onnx", threads=None):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.sess = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_name = self.sess.get_inputs()[0].name
+
+    def predict_proba(self, waves):
+        out = np.zeros((len(waves), 0), dtype=np.float32)
+        for idx in same_length_groups(waves):
+            x = np.stack([waves[i] for i in idx]).astype(np.float32)
+            with self.metrics.span("model"):
+                logits = self.sess.run(None, {self.input_name: x})[0]
+            if out.shape[1] == 0:
+                out = np.zeros((len(waves), logits.shape[1]), dtype=np.float32)
+            out[idx] = softmax(logits)
+        return out
+
+
+def make_backend(name, **kwargs):
+    if name == "speechbrain":
+        return SpeechBrainBackend(**kwargs)
+    if name == "wav2vec2":
+        return Wav2Vec2Backend(**kwargs)
+    if name == "torchscript":
+        return TorchScriptBackend(**kwargs)
+    if name == "onnx":
+        return OnnxBackend(**kwargs)
+    raise ValueError(f"unknown backend {name!r}, pick one of {BACKENDS}")
+
+
+def load_labels(head, label_encoder="wakeword_label_encoder.joblib"):
+    """Class names in predict_proba column order, e.g. ["hey room", "hi room", ...]."""
+    import joblib
+
+    if isinstance(head, str):
+        head, _ = load_head(head)
+    if getattr(head, "labels", None):
+        return list(head.labels)  # converted heads carry their names
+    if isinstance(label_encoder, str):
+        label_encoder = joblib.load(label_encoder)
+    return [str(c) for c in label_encoder.inverse_transform(head.classes_)]
+
+
+def predict_files(backend, paths, load=None, chunk=256, workers=4):
+    """Score files through any backend. Returns (probs, ok_paths, failed)."""
+    from audio_io import iter_chunks, load_audio
+
+    probs, ok, failed = [], [], []
+    for waves, names, bad in iter_chunks(paths, load or load_audio, chunk, workers):
+        failed.extend(bad)
+        if waves:
+            probs.append(backend.predict_proba(waves))
+            ok.extend(names)
+    probs = np.concatenate(probs) if probs else np.zeros((0, 2), dtype=np.float32)
+    return probs, ok, failed
+
+
+if __name__ == "__main__":
+    # parity check: python inference/backends.py a.wav b.wav ...
+    import sys
+    from audio_io import load_audio
+
+    waves = [load_audio(p) for p in sys.argv[1:]]
+    ref = None
+    for name in ("speechbrain", "torchscript", "onnx"):  # same head, comparable
+        try:
+            probs = make_backend(name).predict_proba(waves)
+        except Exception as e:
+            print(f"{name:<12} unavailable: {e}")
+            continue
+        if ref is None:
+            ref = probs
+        print(f"{name:<12} max |diff| vs first = {np.abs(probs - ref).max():.2e}")
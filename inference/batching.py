@@ -0,0 +1,136 @@
+"""batching.py
+Batched embedding for the eval loops.
+
+Clips are sorted by length and cut into buckets, each bucket is zero-padded to
+its longest clip and passed with relative `wav_lens`, so ECAPA's attentive
+statistics pooling (and the input mean/var norm) only look at real samples.
+Encoders that can't mask padding (wav2vec2) set `fixed_samples` instead:
+every clip is cropped / padded to that length first (the detector's window),
+so batches are full and need no padding, and training features look like
+the live ones. Embeddings come back in the original order.
+"""
+
+import os
+
+import numpy as np
+import torch
+
+from audio_io import iter_chunks, load_audio
+
+WAV2VEC2_DIR = "pretrained_models/wav2vec2"
+WAV2VEC2_WINDOW_S = 1.5  # = detector.WINDOW_S, what the live head sees
+
+
+def length_buckets(lengths, batch_size=32, max_samples=None):
+    """Index lists of similar-length clips, at most `batch_size` each.
+
+    `max_samples` caps batch_size * longest clip so one long outlier doesn't
+    blow up a whole padded batch.
+    """
+    order = np.argsort(lengths, kind="stable")
+    buckets, cur = [], []
+    for i in order:
+        longest = lengths[i]  # sorted, so the newcomer is the longest
+        if cur and (len(cur) >= batch_size or (max_samples and (len(cur) + 1) * longest > max_samples)):
+            buckets.append(cur)
+            cur = []
+        cur.append(int(i))
+    if cur:
+        buckets.append(cur)
+    return buckets
+
+
+def fit_length(x, n):
+    """Exactly `n` samples: shorter clips are zero-padded on both sides,
+    longer ones cropped to their loudest `n` samples - the window the
+    detector would have fired on."""
+    if len(x) == n:
+        return x
+    if len(x) < n:
+        left = (n - len(x)) // 2
+        return np.pad(x, (left, n - len(x) - left))
+    energy = np.concatenate([[0.0], np.cumsum(np.square(x, dtype=np.float64))])
+    start = int(np.argmax(energy[n:] - energy[:-n]))
+    return x[start:start + n]
+
+
+def pad_batch(waves):
+    lens = torch.tensor([len(w) for w in waves], dtype=torch.float32)
+    x = torch.zeros(len(waves), int(lens.max()))
+    for i, w in enumerate(waves):
+        x[i, :len(w)] = torch.as_tensor(w, dtype=torch.float32)
+    return x, lens / lens.max()
+
+
+def ecapa_encoder(embedder):
+    # SpeechBrain EncoderClassifier -> (B, 192)
+    def encode(x, wav_lens):
+        return embedder.encode_batch(x, wav_lens).squeeze(1)
+    return encode
+
+
+def load_wav2vec2(model_dir=WAV2VEC2_DIR):
+    """torchaudio WAV2VEC2_BASE with its weights kept in `model_dir` rather
+    than the torch.hub cache. The first online run downloads them there;
+    with HF_HUB_OFFLINE=1 (detector.py on a device) a missing file is an
+    error instead of a download attempt."""
+    import torchaudio
+
+    bundle = torchaudio.pipelines.WAV2VEC2_BASE
+    ckpt = os.path.join(model_dir, os.path.basename(getattr(bundle, "_path", "wav2vec2_fairseq_base_ls960.pth")))
+    if not os.path.exists(ckpt) and os.environ.get("HF_HUB_OFFLINE") == "1":
+        raise FileNotFoundError(f"wav2vec2 weights not found at {ckpt} and running offline - run "
+                                f"python -c \"import sys; sys.path.insert(0, 'inference'); "
+                                f"import batching; batching.load_wav2vec2()\" once with network, "
+                                f"or copy the file there")
+    return bundle.get_model(dl_kwargs={"model_dir": model_dir}).eval()
+
+
+def wav2vec2_encoder(model, window_s=WAV2VEC2_WINDOW_S):
+    # torchaudio wav2vec2 -> (B, 768), mean over the frames. The base model's
+    # group-norm feature extractor normalizes over the whole padded input, so
+    # batch padding would shift every feature: fixed_samples makes every clip
+    # one detector window long, so batches never pad and embed exactly like
+    # the detector's batch-1 windows
+    def encode(x, wav_lens):
+        lengths = (wav_lens * x.shape[1]).round().long()
+        feats, out_lens = model(x, lengths)
+        mask = torch.arange(feats.shape[1])[None, :] < out_lens[:, None]
+        summed = (feats * mask[..., None]).sum(dim=1)
+        return summed / out_lens[:, None].clamp(min=1)
+    encode.fixed_samples = int(window_s * 16000)
+    return encode
+
+
+def embed_batch(encode, waves, batch_size=32, max_samples=None):
+    """Embed a list of 1-D float arrays, returns (N, D) in input order."""
+    if not waves:
+        return np.zeros((0, 0), dtype=np.float32)
+    fixed = getattr(encode, "fixed_samples", None)
+    if fixed:
+        waves = [fit_length(w, fixed) for w in waves]
+    out = [None] * len(waves)
+    for idx in length_buckets([len(w) for w in waves], batch_size, max_samples):
+        x, wav_lens = pad_batch([waves[i] for i in idx])
+        with torch.inference_mode():
+            e = encode(x, wav_lens)
+        e = e.float().numpy()
+        for j, i in enumerate(idx):
+            out[i] = e[j]
+    return np.stack(out)
+
+
+def embed_files(paths, encode, load=load_audio, batch_size=32, chunk=1024, workers=4):
+    """Load + embed files `chunk` at a time so RAM stays bounded. Decoding of
+    the next chunk runs on `workers` threads while this one is embedded.
+
+    Returns (embeddings, ok_paths, failed) where failed is [(path, error)].
+    """
+    embs, ok, failed = [], [], []
+    for waves, names, bad in iter_chunks(paths, load, chunk, workers):
+        failed.extend(bad)
+        if waves:
+            embs.append(embed_batch(encode, waves, batch_size))
+            ok.extend(names)
+    embs = np.concatenate(embs) if embs else np.zeros((0, 0), dtype=np.float32)
+    return embs, ok, failed
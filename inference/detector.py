@@ -0,0 +1,140 @@
+"""detector.py
+Minimal always-on wakeword detector - the thing that runs on the room box.
+
+    python inference/detector.py                  # all 3 phrases, 4-class head
+    python inference/detector.py --binary         # single phrase, binary ECAPA head
+    python inference/detector.py --binary --backend onnx
+
+Only what listening needs is imported, and only when it's needed: no
+matplotlib, no sklearn metrics, no hub lookups (ECAPA loads from
+pretrained_models/ecapa, wav2vec2 from pretrained_models/wav2vec2). One
+warm-up window runs before the mic opens so the first real window isn't
+paying for lazy init, and the cold-start breakdown is printed. Evaluation / plotting live in infer_wakeword.py and the testbench.
+
+The default multi-phrase mode runs one embedding per window through the
+4-class head and fires per phrase with its own threshold, instead of one
+binary pipeline per phrase.
+"""
+
+import time
+
+_T0 = time.perf_counter()
+
+import argparse
+import os
+
+import numpy as np
+
+from metrics import NULL_METRICS, Metrics
+from streaming import StreamingDetector
+from vad import EnergyGate
+
+# quick config — just edit here
+MODEL_DIR = "pretrained_models/ecapa"
+HEAD_PATH = "wakeword_classifier.joblib"
+SCALER_PATH = "wakeword_scaler.joblib"
+BACKEND = "speechbrain"  # binary mode: or "torchscript" / "onnx"
+THRESH = 0.5
+# multi-phrase mode
+MULTI_HEAD_PATH = "wakeword_multiclass_classifier.joblib"
+LABEL_ENCODER_PATH = "wakeword_label_encoder.joblib"
+MULTI_BACKEND = "wav2vec2"  # the shipped 4-class head was trained on wav2vec2 features
+W2V_DIR = "pretrained_models/wav2vec2"
+PHRASE_THRESHOLDS = {"hey room": 0.6, "hi room": 0.6, "wake up room": 0.6}
+WINDOW_S = 1.5
+HOP_S = 0.1
+REFRACTORY_S = 1.0
+USE_VAD = True
+# embedding size per backend that can feed the multiclass head
+EMBED_DIMS = {"speechbrain": 192, "wav2vec2": 768}
+
+
+def load_backend(name, head=HEAD_PATH, batch_size=1, threads=None):
+    # never reach out to the hub from a device
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    from backends import make_backend
+
+    if name == "speechbrain":
+        return make_backend(name, encoder=MODEL_DIR, savedir=MODEL_DIR,
+                            head=head, scaler=SCALER_PATH, batch_size=batch_size)
+    if name == "wav2vec2":
+        return make_backend(name, head=head, batch_size=batch_size, model_dir=W2V_DIR)
+    return make_backend(name, threads=threads)
+
+
+def load_multi_backend(name, batch_size=1, threads=None):
+    """(backend, labels) for multi-phrase mode. Exported engines end in the
+    binary head, and the 4-class head only fits the embedder it was trained
+    on, so any other pairing stops here instead of scoring garbage."""
+    if name not in EMBED_DIMS:
+        raise SystemExit(f"backend '{name}' has no multiclass head (exports are binary) - "
+                         f"use {' / '.join(EMBED_DIMS)} or --binary")
+    from backends import load_labels
+    backend = load_backend(name, head=MULTI_HEAD_PATH, batch_size=batch_size, threads=threads)
+    n_in = getattr(backend.head, "n_features_in_", EMBED_DIMS[name])
+    if n_in != EMBED_DIMS[name]:
+        raise SystemExit(f"{MULTI_HEAD_PATH} takes {n_in}-dim features but '{name}' embeds "
+                         f"{EMBED_DIMS[name]} - use the backend it was trained on ({MULTI_BACKEND})")
+    return backend, load_labels(backend.head, LABEL_ENCODER_PATH)
+
+
+def warm_up(backend, window_s=WINDOW_S, sr=16000):
+    x = np.zeros(int(window_s * sr), dtype=np.float32)
+    backend.predict_proba([x])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Live wakeword detector")
+    ap.add_argument("--binary", action="store_true", help="single-phrase binary head")
+    ap.add_argument("--backend", default=None)
+    ap.add_argument("--threshold", type=float, default=THRESH, help="binary mode only")
+    ap.add_argument("--seconds", type=float, default=None, help="stop after N seconds")
+    ap.add_argument("--device", default=None, help="sounddevice input device")
+    ap.add_argument("--no-vad", action="store_true")
+    ap.add_argument("--metrics-port", type=int, default=None, help="Prometheus text on 127.0.0.1:PORT/metrics")
+    ap.add_argument("--metrics-log", type=float, default=None, help="JSON metrics line every N seconds")
+    args = ap.parse_args()
+
+    backend_name = args.backend or (BACKEND if args.binary else MULTI_BACKEND)
+
+    t_imports = time.perf_counter()
+    if args.binary:
+        backend = load_backend(backend_name)
+        labels, threshold = None, args.threshold
+        score_fn = lambda audio: backend.predict_proba([audio])[0, 1]
+    else:
+        backend, labels = load_multi_backend(backend_name)
+        threshold = PHRASE_THRESHOLDS
+        score_fn = lambda audio: backend.predict_proba([audio])[0]
+    t_load = time.perf_counter()
+    warm_up(backend)
+    t_warm = time.perf_counter()
+
+    metrics = NULL_METRICS
+    if args.metrics_port or args.metrics_log:
+        metrics = Metrics()
+        metrics.set("cold_start_seconds", round(t_warm - _T0, 3))
+        backend.metrics = metrics
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+            print(f"[metrics] http://127.0.0.1:{args.metrics_port}/metrics")
+        if args.metrics_log:
+            metrics.log_every(args.metrics_log, lambda line: print(f"[metrics] {line}", flush=True))
+    print(f"[startup] imports {t_imports - _T0:.2f}s | load {t_load - t_imports:.2f}s | "
+          f"warm-up {t_warm - t_load:.2f}s | cold start {t_warm - _T0:.2f}s ({backend_name})")
+
+    def report(d):
+        phrase = f" '{d.label}'" if d.label else ""
+        print(f"[Wake]{phrase} t={d.t:.2f}s p={d.prob:.4f} (score {d.score_ms:.0f}ms, lag {d.lag_ms:.0f}ms)", flush=True)
+
+    det = StreamingDetector(score_fn, window=WINDOW_S, hop=HOP_S, threshold=threshold,
+                            refractory=REFRACTORY_S, on_detect=report, device=args.device,
+                            gate=EnergyGate() if USE_VAD and not args.no_vad else None, labels=labels,
+                            metrics=metrics)
+    print(f"Listening ({WINDOW_S}s window / {HOP_S * 1000:.0f}ms hop), Ctrl+C to stop...")
+    det.run(args.seconds)
+    print(f"{det.windows} windows scored, {det.gated} gated, {det.skipped} skipped, {det.overflows} overflows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""embedding_cache.py
+On-disk embedding store shared by the eval / training scripts.
+
+Entries are keyed by (sha1 of the audio file bytes, sample rate) inside one
+directory per embedder id, so re-running an eval on unchanged audio skips
+decoding and the embedder entirely. A file is only re-hashed when its size or
+mtime moved since files.tsv saw it (as in FeatureStore.delta), so a repeat
+run costs one stat per clip, not a full read. Build the id with
+embedder_id(): it appends a hash of the model files and the audio front end
+("ecapa-voxceleb@3f9a1c20b7"), so new weights or a changed load_audio start
+a fresh directory instead of serving stale vectors. Layout:
+
+    <root>/<embedder_id>/vectors.f32   append-only float32 rows, read via np.memmap
+    <root>/<embedder_id>/index.tsv     key, row, last-used timestamp
+    <root>/<embedder_id>/meta.json     dim
+    <root>/files.tsv                   path, size, mtime_ns, sha1 of hashed files
+
+Once vectors.f32 grows past `max_bytes` the least recently used rows are
+dropped and the file is compacted (on flush/close).
+
+The on-disk conventions here are shared with feature_store.py and
+audio_shards.py: indexes are append-only TSV, so a crash mid-write leaves at
+most a torn last line, which readers skip because its field count is off;
+and meta.json records what the data was made with, so reopening a store
+with a different model raises instead of mixing vectors.
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from audio_io import FRONTEND
+
+DEFAULT_ROOT = "cache/embeddings"
+
+
+def file_sha1(path, bufsize=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            b = f.read(bufsize)
+            if not b:
+                break
+            h.update(b)
+    return h.hexdigest()
+
+
+def embedder_id(name, model_dir=None, frontend=FRONTEND):
+    """"name@<hash>" over `frontend` and every file in `model_dir`
+    (hyperparams.yaml, *.ckpt). A missing dir only hashes the front end."""
+    h = hashlib.sha1(frontend.encode())
+    if model_dir and os.path.isdir(model_dir):
+        for f in sorted(os.listdir(model_dir)):
+            path = os.path.join(model_dir, f)
+            if os.path.isfile(path):
+                h.update(f"{f}\t{file_sha1(path)}\n".encode())
+    return f"{name}@{h.hexdigest()[:10]}"
+
+
+class EmbeddingCache:
+    def __init__(self, embedder_id, dim, root=DEFAULT_ROOT, max_bytes=2 << 30):
+        self.embedder_id = embedder_id
+        self.dim = int(dim)
+        self.max_bytes = max_bytes
+        self.dir = os.path.join(root, embedder_id)
+        self.data_path = os.path.join(self.dir, "vectors.f32")
+        self.index_path = os.path.join(self.dir, "index.tsv")
+        self.files_path = os.path.join(root, "files.tsv")
+        os.makedirs(self.dir, exist_ok=True)
+
+        meta_path = os.path.join(self.dir, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["dim"] != self.dim:
+                raise ValueError(f"cache {self.dir} holds dim {meta['dim']}, asked for {self.dim}")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"embedder_id": embedder_id, "dim": self.dim}, f)
+
+        self.index = {}  # key -> [row, last_used]
+        self._load_index()
+        self.files = None  # abs path -> (size, mtime_ns, sha1), loaded on first key_for
+        self._new_files = []
+        self._mm = None
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- storage ---
+    @property
+    def rows(self):
+        if not os.path.exists(self.data_path):
+            return 0
+        return os.path.getsize(self.data_path) // (4 * self.dim)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        rows = self.rows
+        with open(self.index_path) as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 3:
+                    continue  # torn last line
+                row = int(parts[1])
+                if row < rows:
+                    self.index[parts[0]] = [row, float(parts[2])]
+
+    def _load_files(self):
+        self.files = {}
+        if not os.path.exists(self.files_path):
+            return
+        with open(self.files_path) as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 4 or len(parts[3]) != 40:
+                    continue  # torn last line
+                self.files[parts[0]] = (int(parts[1]), int(parts[2]), parts[3])  # newest line wins
+
+    def _vectors(self):
+        rows = self.rows
+        if self._mm is None or self._mm.shape[0] != rows:
+            self._mm = np.memmap(self.data_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+        return self._mm
+
+    # --- public api ---
+    def key_for(self, path, sr=16000):
+        if self.files is None:
+            self._load_files()
+        st = os.stat(path)
+        path = os.path.abspath(path)
+        known = self.files.get(path)
+        if known is not None and known[:2] == (st.st_size, st.st_mtime_ns):
+            return f"{known[2]}:{sr}"
+        entry = (st.st_size, st.st_mtime_ns, file_sha1(path))
+        self.files[path] = entry
+        self._new_files.append((path,) + entry)
+        return f"{entry[2]}:{sr}"
+
+    def get(self, key):
+        hit = self.index.get(key)
+        if hit is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        hit[1] = time.time()
+        self._dirty = True
+        return np.array(self._vectors()[hit[0]])
+
+    def get_many(self, keys):
+        """Returns (embeddings (N, dim), found mask). Missing rows are zeros."""
+        out = np.zeros((len(keys), self.dim), dtype=np.float32)
+        found = np.zeros(len(keys), dtype=bool)
+        rows = []
+        now = time.time()
+        for i, k in enumerate(keys):
+            hit = self.index.get(k)
+            if hit is not None:
+                hit[1] = now
+                found[i] = True
+                rows.append(hit[0])
+        if rows:
+            out[found] = self._vectors()[np.array(rows)]
+            self._dirty = True
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+        return out, found
+
+    def put_many(self, keys, embs):
+        embs = np.ascontiguousarray(embs, dtype=np.float32).reshape(len(keys), self.dim)
+        start = self.rows
+        # data first, then index - a crash in between just leaves orphan rows
+        with open(self.data_path, "ab") as f:
+            f.write(embs.tobytes())
+        now = time.time()
+        with open(self.index_path, "a") as f:
+            for i, k in enumerate(keys):
+                self.index[k] = [start + i, now]
+                f.write(f"{k}\t{start + i}\t{now:.3f}\n")
+
+    def put(self, key, emb):
+        self.put_many([key], np.asarray(emb)[None])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "embedder": self.embedder_id,
+            "entries": len(self.index),
+            "bytes": self.rows * 4 * self.dim,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def flush(self):
+        if self._new_files:
+            with open(self.files_path, "a") as f:
+                f.writelines("\t".join(map(str, e)) + "\n" for e in self._new_files)
+            self._new_files = []
+        if self.rows * 4 * self.dim > self.max_bytes:
+            self._evict()
+        elif self._dirty:
+            self._write_index(self.index)
+        self._dirty = False
+
+    close = flush
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    # --- eviction ---
+    def _write_index(self, index):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w") as f:
+            for k, (row, used) in index.items():
+                f.write(f"{k}\t{row}\t{used:.3f}\n")
+        os.replace(tmp, self.index_path)
+
+    def _evict(self):
+        # keep the most recently used entries down to 90% of the budget
+        keep_n = int(0.9 * self.max_bytes) // (4 * self.dim)
+        by_age = sorted(self.index.items(), key=lambda kv: kv[1][1], reverse=True)
+        keep = by_age[:keep_n]
+        self.evictions += len(self.index) - len(keep)
+
+        vec = self._vectors()
+        tmp = self.data_path + ".tmp"
+        new_index = {}
+        with open(tmp, "wb") as f:
+            for new_row, (k, (row, used)) in enumerate(keep):
+                f.write(np.asarray(vec[row], dtype=np.float32).tobytes())
+                new_index[k] = [new_row, used]
+        self._mm = None
+        del vec
+        os.replace(tmp, self.data_path)
+        self._write_index(new_index)
+        self.index = new_index
+
+
+def embed_files_cached(cache, paths, embed_fn, sr=16000, key_for=None):
+    """Drop-in for batching.embed_files that only embeds cache misses.
+
+    `embed_fn(paths)` must return (embeddings, ok_paths, failed) like
+    embed_files does. Output keeps the order of `paths`. `key_for` overrides
+    cache.key_for, e.g. AudioShards.key_for when the clips come from a pack.
+    """
+    key_for = key_for or cache.key_for
+    keys, hashed, failed = [], [], []
+    for p in paths:
+        try:
+            keys.append(key_for(p, sr))
+            hashed.append(p)
+        except (OSError, KeyError) as e:
+            failed.append((p, e))
+
+    cached, found = cache.get_many(keys)
+    todo = [p for p, f in zip(hashed, found) if not f]
+    fresh = {}
+    if todo:
+        embs, ok, bad = embed_fn(todo)
+        failed.extend(bad)
+        if ok:
+            key_of = dict(zip(hashed, keys))
+            cache.put_many([key_of[p] for p in ok], embs)
+            fresh = dict(zip(ok, embs))
+
+    out, ok_paths = [], []
+    for p, e, f in zip(hashed, cached, found):
+        if f:
+            out.append(e)
+        elif p in fresh:
+            out.append(fresh[p])
+        else:
+            continue
+        ok_paths.append(p)
+    out = np.stack(out) if out else np.zeros((0, cache.dim), dtype=np.float32)
+    return out, ok_paths, failed
@@ -0,0 +1,205 @@
+"""feature_store.py
+Sharded on-disk training features, written incrementally.
+
+Embeddings are appended in fixed-size shards so extraction never holds more
+than one shard in RAM, and a crash only loses the shard being filled.
+Layout per store:
+
+    <root>/meta.json       embedder id + dim
+    <root>/shard-00000.npy float32 (rows, dim), read back with mmap_mode="r"
+    <root>/manifest.tsv    shard, row, label, path, size, mtime_ns, sha1 - one
+                           line per embedded clip
+    <root>/failed.tsv      path, error - clips that could not be decoded
+
+A shard is written to a temp file and renamed before its manifest lines are
+appended, so every manifest line points at a complete shard. On restart the
+manifest says which paths are done; a shard that made it to disk without its
+manifest lines is simply overwritten.
+
+`delta(paths)` compares the files on disk against the manifest: same size and
+mtime is trusted, otherwise the file is hashed and only re-embedded if the
+content really changed. A re-embedded clip gets a new manifest line and the
+newest line per path wins.
+"""
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from embedding_cache import file_sha1
+
+
+class FeatureStore:
+    def __init__(self, root, embedder_id, dim, shard_size=4096):
+        self.root = root
+        self.embedder_id = embedder_id
+        self.dim = int(dim)
+        self.shard_size = shard_size
+        self.manifest_path = os.path.join(root, "manifest.tsv")
+        self.failed_path = os.path.join(root, "failed.tsv")
+        os.makedirs(root, exist_ok=True)
+
+        meta_path = os.path.join(root, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta["embedder_id"] != embedder_id or meta["dim"] != self.dim:
+                raise ValueError(f"store {root} holds {meta['embedder_id']} dim {meta['dim']}, "
+                                 f"asked for {embedder_id} dim {self.dim}")
+        else:
+            with open(meta_path, "w") as f:
+                json.dump({"embedder_id": embedder_id, "dim": self.dim}, f)
+
+        self.entries = []  # (shard, row, label, path, size, mtime_ns, sha1)
+        self._load_manifest()
+        self.next_shard = max((e[0] for e in self.entries), default=-1) + 1
+        self._buf, self._buf_labels, self._buf_paths, self._buf_stats = [], [], [], []
+        self._buffered = 0
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path) as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) != 7 or len(parts[6]) != 40:
+                    continue  # torn last line, see embedding_cache.py
+                self.entries.append((int(parts[0]), int(parts[1]), parts[2], parts[3],
+                                     int(parts[4]), int(parts[5]), parts[6]))
+
+    def shard_path(self, shard):
+        return os.path.join(self.root, f"shard-{shard:05d}.npy")
+
+    # --- delta ---
+    def latest(self):
+        """path -> newest manifest entry."""
+        return {e[3]: e for e in self.entries}
+
+    def delta(self, paths, workers=8, sources=None, stat=None):
+        """Which of `paths` need embedding. Returns (todo, stats) where stats
+        maps every readable path to (size, mtime_ns, sha1); files are only
+        hashed when they are new or their size/mtime moved.
+
+        `sources` (parallel to paths) is the file to stat/hash when the
+        manifest key isn't a file itself, e.g. "clip.wav#aug2" -> "clip.wav".
+        `stat(source)` -> (size, mtime_ns, sha1) replaces os.stat + hashing
+        when that's already known, e.g. AudioShards.stat for packed clips.
+        """
+        latest = self.latest()
+
+        def check(p, src):
+            if stat is not None:
+                try:
+                    st = tuple(stat(src))
+                except KeyError:
+                    return p, None, False
+                old = latest.get(p)
+                return p, st, old is None or old[6] != st[2]
+            try:
+                st = os.stat(src)
+            except OSError:
+                return p, None, False
+            old = latest.get(p)
+            if old is not None and old[4] == st.st_size and old[5] == st.st_mtime_ns:
+                return p, old[4:], False
+            sha1 = file_sha1(src)
+            changed = old is None or old[6] != sha1
+            return p, (st.st_size, st.st_mtime_ns, sha1), changed
+
+        todo, stats = [], {}
+        with ThreadPoolExecutor(workers) as ex:
+            for p, st, changed in ex.map(check, paths, paths if sources is None else sources):
+                if st is None:
+                    continue
+                stats[p] = st
+                if changed:
+                    todo.append(p)
+        return todo, stats
+
+    # --- writing ---
+    def add(self, embs, labels, paths, stats):
+        """`stats` are the (size, mtime_ns, sha1) tuples from delta()."""
+        embs = np.asarray(embs, dtype=np.float32).reshape(len(paths), self.dim)
+        self._buf.append(embs)
+        self._buf_labels.extend(labels)
+        self._buf_paths.extend(paths)
+        self._buf_stats.extend(stats)
+        self._buffered += len(paths)
+        if self._buffered >= self.shard_size:
+            self.flush()
+
+    def add_failed(self, failed):
+        if not failed:
+            return
+        with open(self.failed_path, "a") as f:
+            for p, err in failed:
+                f.write(f"{p}\t{str(err).splitlines()[0] if str(err) else type(err).__name__}\n")
+
+    def flush(self):
+        if not self._buffered:
+            return
+        shard = self.next_shard
+        path = self.shard_path(shard)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.save(f, np.concatenate(self._buf))
+        os.replace(tmp, path)
+
+        new = [(shard, row, lbl, p) + tuple(st) for row, (lbl, p, st)
+               in enumerate(zip(self._buf_labels, self._buf_paths, self._buf_stats))]
+        with open(self.manifest_path, "a") as f:
+            f.writelines("\t".join(map(str, e)) + "\n" for e in new)
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries.extend(new)
+        self.next_shard += 1
+        self._buf, self._buf_labels, self._buf_paths, self._buf_stats = [], [], [], []
+        self._buffered = 0
+
+    close = flush
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    # --- reading ---
+    def __len__(self):
+        return len(self.latest())
+
+    def select(self, paths=None):
+        """Newest entry per path, in manifest order, optionally only for
+        `paths` (e.g. the clips still on disk)."""
+        latest = self.latest()
+        if paths is not None:
+            keep = set(paths)
+            latest = {p: e for p, e in latest.items() if p in keep}
+        return sorted(latest.values(), key=lambda e: (e[0], e[1]))
+
+    def iter_shards(self, entries=None):
+        """(X, entries) per shard, X memory-mapped (no copy until used)."""
+        by_shard = {}
+        for e in (self.select() if entries is None else entries):
+            by_shard.setdefault(e[0], []).append(e)
+        for s in sorted(by_shard):
+            es = by_shard[s]
+            X = np.load(self.shard_path(s), mmap_mode="r")
+            rows = np.array([e[1] for e in es])
+            if len(rows) == X.shape[0] and (rows == np.arange(len(rows))).all():
+                yield X, es
+            else:
+                yield X[rows], es
+
+    def load(self, entries=None):
+        """(X (N, dim) float32, labels, paths, sha1s) for `entries` (default:
+        newest entry per path), filled shard by shard into one array."""
+        entries = self.select() if entries is None else sorted(entries, key=lambda e: (e[0], e[1]))
+        X = np.empty((len(entries), self.dim), dtype=np.float32)
+        i = 0
+        for xs, _ in self.iter_shards(entries):
+            X[i:i + len(xs)] = xs
+            i += len(xs)
+        return (X, np.array([e[2] for e in entries]), [e[3] for e in entries], [e[6] for e in entries])
@@ -0,0 +1,170 @@
+"""heads.py
+Pure-NumPy wakeword heads extracted from the sklearn joblib models.
+
+sklearn's predict_proba does a round of input validation per call and the
+scaler is a separate transform - a lot of overhead around what is really a
+192x1 (or 768x100x4) matmul. The converter folds the StandardScaler into the
+first layer and saves the weights to a small .npz, and NumpyHead evaluates a
+whole (N, D) batch with one matmul chain. No sklearn needed at runtime.
+
+    python inference/heads.py wakeword_classifier.joblib --scaler wakeword_scaler.joblib
+    python inference/heads.py wakeword_multiclass_classifier.joblib --labels wakeword_label_encoder.joblib
+
+Conversion always re-checks the .npz against sklearn's predict_proba and
+refuses to write it if they disagree.
+"""
+
+import os
+
+import numpy as np
+
+ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0, out=x),
+    "tanh": np.tanh,
+    "logistic": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "identity": lambda x: x,
+}
+
+
+def fold_sklearn(clf, scaler=None):
+    """(weights, biases, hidden activation, output) for a LogisticRegression or
+    MLPClassifier. Weights are (in, out) so a layer is x @ W + b. `output` is
+    "softmax", "ovr" (per-class sigmoid then normalize) - binary models are
+    turned into 2-column logits [0, z] so softmax gives [1 - s(z), s(z)].
+    """
+    if hasattr(clf, "coefs_"):
+        Ws = [np.asarray(w, dtype=np.float64) for w in clf.coefs_]
+        bs = [np.asarray(b, dtype=np.float64) for b in clf.intercepts_]
+        act = clf.activation
+        output = "softmax"
+    else:
+        Ws = [np.asarray(clf.coef_, dtype=np.float64).T]
+        bs = [np.asarray(clf.intercept_, dtype=np.float64)]
+        act = "identity"
+        multi = getattr(clf, "multi_class", "auto")
+        ovr = multi == "ovr" or getattr(clf, "solver", "") == "liblinear"  # liblinear is always OvR
+        output = "ovr" if ovr and Ws[0].shape[1] > 1 else "softmax"
+
+    if scaler is not None:
+        # ((x - m) / s) @ W + b  ==  x @ (W / s[:, None]) + (b - (m / s) @ W)
+        scale = np.asarray(scaler.scale_ if scaler.scale_ is not None else np.ones(Ws[0].shape[0]))
+        mean = np.asarray(scaler.mean_ if getattr(scaler, "with_mean", True) and scaler.mean_ is not None
+                          else np.zeros_like(scale))
+        bs[0] = bs[0] - (mean / scale) @ Ws[0]
+        Ws[0] = Ws[0] / scale[:, None]
+
+    if Ws[-1].shape[1] == 1:
+        Ws[-1] = np.concatenate([np.zeros_like(Ws[-1]), Ws[-1]], axis=1)
+        bs[-1] = np.concatenate([np.zeros_like(bs[-1]), bs[-1]])
+    return Ws, bs, act, output
+
+
+class NumpyHead:
+    def __init__(self, Ws, bs, activation="identity", output="softmax", classes=None, labels=None,
+                 scaler_folded=False):
+        self.Ws = [np.ascontiguousarray(w, dtype=np.float32) for w in Ws]
+        self.bs = [np.ascontiguousarray(b, dtype=np.float32) for b in bs]
+        self.activation = activation
+        self.output = output
+        self.classes_ = np.arange(self.Ws[-1].shape[1]) if classes is None else np.asarray(classes)
+        self.labels = None if labels is None else [str(l) for l in labels]
+        self.n_features_in_ = self.Ws[0].shape[0]
+        self.scaler_folded = bool(scaler_folded)  # takes raw embeddings, skip the scaler
+
+    @classmethod
+    def from_sklearn(cls, clf, scaler=None, labels=None):
+        Ws, bs, act, output = fold_sklearn(clf, scaler)
+        return cls(Ws, bs, act, output, classes=clf.classes_, labels=labels, scaler_folded=scaler is not None)
+
+    @classmethod
+    def load(cls, path):
+        z = np.load(path, allow_pickle=False)
+        n = int(z["n_layers"])
+        labels = z["labels"] if "labels" in z.files else None
+        folded = bool(z["scaler_folded"]) if "scaler_folded" in z.files else False
+        return cls([z[f"W{i}"] for i in range(n)], [z[f"b{i}"] for i in range(n)],
+                   str(z["activation"]), str(z["output"]), z["classes"], labels, folded)
+
+    def save(self, path):
+        arrays = {f"W{i}": w for i, w in enumerate(self.Ws)}
+        arrays.update({f"b{i}": b for i, b in enumerate(self.bs)})
+        if self.labels is not None:
+            arrays["labels"] = np.array(self.labels)
+        np.savez(path, n_layers=len(self.Ws), activation=self.activation, output=self.output,
+                 classes=self.classes_, scaler_folded=self.scaler_folded, **arrays)
+
+    def logits(self, X):
+        h = np.asarray(X, dtype=np.float32)
+        if h.ndim == 1:
+            h = h[None, :]
+        act = ACTIVATIONS[self.activation]
+        last = len(self.Ws) - 1
+        for i, (W, b) in enumerate(zip(self.Ws, self.bs)):
+            h = h @ W + b
+            if i < last:
+                h = act(h)
+        return h
+
+    def predict_proba(self, X):
+        z = self.logits(X).astype(np.float64)
+        if self.output == "ovr":
+            p = 1.0 / (1.0 + np.exp(-z))
+            return p / p.sum(axis=1, keepdims=True)
+        z -= z.max(axis=1, keepdims=True)
+        e = np.exp(z)
+        return e / e.sum(axis=1, keepdims=True)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.logits(X), axis=1)]
+
+
+def load_head(path):
+    """sklearn joblib or converted .npz - prefers a converted sibling
+    (`foo.joblib` -> `foo.npz`) when one exists. Returns (head, scaler_folded):
+    only a .npz converted with --scaler already includes the scaler."""
+    npz = os.path.splitext(path)[0] + ".npz"
+    if path.endswith(".npz") or os.path.exists(npz):
+        head = NumpyHead.load(npz if not path.endswith(".npz") else path)
+        return head, head.scaler_folded
+    import joblib
+    return joblib.load(path), False
+
+
+def check(head, clf, scaler=None, dim=None, n=512, seed=0, extra=None):
+    """Max |p_numpy - p_sklearn| over random + optional real embeddings."""
+    dim = dim or head.n_features_in_
+    X = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    if extra is not None and len(extra):
+        X = np.concatenate([X, np.asarray(extra, dtype=np.float32)])
+    Xs = scaler.transform(X) if scaler is not None else X
+    return float(np.abs(head.predict_proba(X) - clf.predict_proba(Xs)).max())
+
+
+if __name__ == "__main__":
+    import argparse
+    import joblib
+
+    ap = argparse.ArgumentParser(description="Convert a sklearn wakeword head to a NumPy .npz")
+    ap.add_argument("model")
+    ap.add_argument("--scaler", default=None, help="StandardScaler joblib to fold in")
+    ap.add_argument("--labels", default=None, help="LabelEncoder joblib, stores class names")
+    ap.add_argument("-o", "--out", default=None)
+    ap.add_argument("--tol", type=float, default=1e-5)
+    args = ap.parse_args()
+
+    clf = joblib.load(args.model)
+    scaler = joblib.load(args.scaler) if args.scaler and os.path.exists(args.scaler) else None
+    labels = None
+    if args.labels:
+        le = joblib.load(args.labels)
+        labels = le.inverse_transform(clf.classes_)
+    head = NumpyHead.from_sklearn(clf, scaler, labels)
+
+    err = check(head, clf, scaler)
+    print(f"max |p_numpy - p_sklearn| = {err:.2e} over 512 random inputs")
+    if err > args.tol:
+        raise SystemExit(f"mismatch above tolerance {args.tol}, not writing")
+
+    out = args.out or os.path.splitext(args.model)[0] + ".npz"
+    head.save(out)
+    print(f"{type(clf).__name__} {[w.shape for w in head.Ws]} -> {out} ({os.path.getsize(out) / 1e3:.1f} kB)")
@@ -1,70 +1,129 @@
+# eval / plotting tool. The live detector is inference/detector.py
+#   python inference/infer_wakeword.py          # eval, then plot
+#   python inference/infer_wakeword.py eval     # eval only, scores -> SCORES_PATH
+#   python inference/infer_wakeword.py plot     # plot saved scores, no models loaded
+#   python inference/infer_wakeword.py listen   # same as inference/detector.py
 import os
-import torch
-import torchaudio
+import sys
 import joblib
 import numpy as np
-from sklearn.metrics import classification_report, roc_auc_score
-from speechbrain.pretrained import EncoderClassifier
-import matplotlib.pyplot as plt
-import sounddevice as sd
+from audio_io import load_audio
+from audio_shards import open_shards
+from embedding_cache import EmbeddingCache, embed_files_cached, embedder_id
+from backends import SpeechBrainBackend, make_backend, predict_files
 
 # quick config — just edit here
 POS_DIR = "training_data/heyroom"
 NEG_DIR = "training_data/not_heyroom"
 THRESH = 0.5
+BATCH = 32
+CACHE_DIR = "cache/embeddings"  # set to None to always re-embed
+ECAPA_DIR = "pretrained_models/ecapa"
+BACKEND = "speechbrain"  # or "torchscript" / "onnx" (export with evaluation/ecapacombine.py)
+SCORES_PATH = "eval_scores.npz"
+SHARDS_DIR = None  # packed corpus (audio_shards.py) holding POS_DIR / NEG_DIR, None reads the wavs
 
-# load trained stuff
-model = joblib.load("wakeword_classifier.joblib")
-try:
-    scaler = joblib.load("wakeword_scaler.joblib")
-    use_scaler = True
-except:
-    scaler = None
-    use_scaler = False
+model = scaler = classifier = backend = None
+use_scaler = False
 
-# speaker-agnostic embedding model
-classifier = EncoderClassifier.from_hparams(source="speechbrain/spkrec-ecapa-voxceleb")
+# load trained stuff - only for the commands that need it
+def load_models():
+    # torch / speechbrain only here, so `listen` hands off to detector.py
+    # without paying for them
+    from speechbrain.pretrained import EncoderClassifier
+    global model, scaler, use_scaler, classifier, backend
+    model = joblib.load("wakeword_classifier.joblib")
+    try:
+        scaler = joblib.load("wakeword_scaler.joblib")
+        use_scaler = True
+    except:
+        scaler = None
+        use_scaler = False
+
+    # speaker-agnostic embedding model
+    classifier = EncoderClassifier.from_hparams(source="speechbrain/spkrec-ecapa-voxceleb", savedir=ECAPA_DIR)
+
+    if BACKEND == "speechbrain":
+        backend = SpeechBrainBackend(encoder=classifier, head=model, scaler=scaler, batch_size=BATCH)
+    else:
+        backend = make_backend(BACKEND)
 
 def embed(wav_path):
-    x, fs = torchaudio.load(wav_path)
-    if fs != 16000:
-        x = torchaudio.transforms.Resample(fs, 16000)(x)
+    import torch
+    x = torch.from_numpy(load_audio(wav_path)).unsqueeze(0)
     with torch.no_grad():
         emb = classifier.encode_batch(x)
     return emb.squeeze().numpy()
 
 def classify(embedding):
     if use_scaler:
-        embedding = scaler.transform([embedding])
+        embedding = scaler.transform([embedding])[0]
     prob = model.predict_proba([embedding])[0][1]
     pred = int(prob >= THRESH)
     return prob, pred
 
+def classify_batch(embeddings):
+    # same as classify() but one predict_proba call for the whole (N, D) array
+    if use_scaler:
+        embeddings = scaler.transform(embeddings)
+    probs = model.predict_proba(embeddings)[:, 1]
+    return probs, (probs >= THRESH).astype(int)
+
 # main eval loop
 def run_eval():
+    from sklearn.metrics import classification_report, roc_auc_score
+    from batching import ecapa_encoder, embed_files
+
     probs = []
     y_pred = []
     y_true = []
 
+    shards = open_shards(SHARDS_DIR)
+    load = shards.load if shards is not None else load_audio
+    encode = ecapa_encoder(classifier)
+    embed_fn = lambda paths: embed_files(paths, encode, load=load, batch_size=BATCH)
+    cache = EmbeddingCache(embedder_id("ecapa-voxceleb", ECAPA_DIR), 192, root=CACHE_DIR) if CACHE_DIR else None
     for label, folder in [("pos", POS_DIR), ("neg", NEG_DIR)]:
         y = 1 if label == "pos" else 0
-        for f in os.listdir(folder):
-            if not f.endswith(".wav"): continue
-            try:
-                p, pred = classify(embed(os.path.join(folder, f)))
-                y_true.append(y)
-                y_pred.append(pred)
-                probs.append(p)
-                print(f"{f} -> {p:.4f} | pred={pred} | true={y}")
-            except Exception as e:
-                print(f"[FAIL] {f}: {e}")
+        files = shards.listdir(folder) if shards is not None else sorted(os.listdir(folder))
+        paths = [os.path.join(folder, f) for f in files if f.endswith(".wav")]
+        if BACKEND != "speechbrain":
+            # exported engines go wav -> probs directly, nothing to cache
+            all_probs, ok, failed = predict_files(backend, paths, load)
+        elif cache:
+            key_for = shards.key_for if shards is not None else None
+            embs, ok, failed = embed_files_cached(cache, paths, embed_fn, key_for=key_for)
+        else:
+            embs, ok, failed = embed_fn(paths)
+        for path, e in failed:
+            print(f"[FAIL] {os.path.basename(path)}: {e}")
+        if not ok:
+            continue
+        if BACKEND == "speechbrain":
+            p, pred = classify_batch(embs)
+        else:
+            p = all_probs[:, 1]
+            pred = (p >= THRESH).astype(int)
+        for path, pi, yi in zip(ok, p, pred):
+            y_true.append(y)
+            y_pred.append(int(yi))
+            probs.append(float(pi))
+            print(f"{os.path.basename(path)} -> {pi:.4f} | pred={yi} | true={y}")
+
+    if cache:
+        cache.close()
+        print(f"[cache] {cache.stats()}")
 
     print("\n== Metrics ==")
     print(classification_report(y_true, y_pred))
     print(f"ROC AUC: {roc_auc_score(y_true, probs):.4f}")
+    np.savez(SCORES_PATH, y_true=np.array(y_true), probs=np.array(probs))
+    print(f"Scores saved to {SCORES_PATH}")
     return y_true, probs
 
 def mic_check(seconds=2):
+    import sounddevice as sd
+    import torch
     print(f"Listening for {seconds}s...")
     fs = 16000
     rec = sd.rec(int(seconds * fs), samplerate=fs, channels=1, dtype='float32')
@@ -74,13 +133,14 @@ def mic_check(seconds=2):
         emb = classifier.encode_batch(audio)
     emb_np = emb.squeeze().numpy()
     if use_scaler:
-        emb_np = scaler.transform([emb_np])
+        emb_np = scaler.transform([emb_np])[0]
     prob = model.predict_proba([emb_np])[0][1]
     pred = int(prob >= THRESH)
     print(f"[Mic] {prob:.4f} → {'Wakeword' if pred else 'Nope'}")
     return prob, pred
 
 def plot_probs(probs, y_true):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(8, 4))
     plt.hist(probs, bins=50, alpha=0.7)
     plt.axvline(THRESH, color='r', linestyle='--')
@@ -104,5 +164,16 @@ def plot_probs(probs, y_true):
     plt.show()
 
 if __name__ == "__main__":
-    y_true, probs = run_eval()
-    plot_probs(probs, y_true)
\ No newline at end of file
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "all"
+    if cmd == "listen":
+        import detector
+        sys.argv = sys.argv[:1] + sys.argv[2:]
+        detector.main()
+    elif cmd == "plot":
+        saved = np.load(SCORES_PATH)
+        plot_probs(saved["probs"], saved["y_true"])
+    else:
+        load_models()
+        y_true, probs = run_eval()
+        if cmd != "eval":
+            plot_probs(probs, y_true)
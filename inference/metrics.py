@@ -0,0 +1,170 @@
+"""metrics.py
+Lightweight hot-path instrumentation for the live detector.
+
+Counters, gauges and fixed-bucket latency histograms kept in plain dicts:
+a span is two perf_counter() calls and a bisect, cheap enough to leave on in
+production. Export either as Prometheus text on localhost
+(`serve(port)` -> http://127.0.0.1:<port>/metrics) or as one JSON log line
+every N seconds (`log_every(n)`).
+
+Code that takes a `metrics` argument defaults to NULL_METRICS, which has the
+same methods and does nothing, so call sites don't need `if metrics:`.
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "t0")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, (time.perf_counter() - self.t0) * 1000)
+
+
+class Metrics:
+    def __init__(self, prefix="wakeword"):
+        self.prefix = prefix
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self.hists = {}  # name -> [bucket counts (+inf last), sum_ms, count]
+        self.started = time.time()
+
+    def inc(self, name, n=1):
+        self.counters[name] += n
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, ms):
+        h = self.hists.get(name)
+        if h is None:
+            h = self.hists[name] = [[0] * (len(BUCKETS_MS) + 1), 0.0, 0]
+        h[0][bisect_left(BUCKETS_MS, ms)] += 1
+        h[1] += ms
+        h[2] += 1
+
+    def span(self, name):
+        return _Span(self, name)
+
+    # --- export ---
+    def snapshot(self):
+        stages = {}
+        for name, (buckets, total, count) in dict(self.hists).items():
+            stages[name] = {"count": count, "mean_ms": round(total / count, 3) if count else 0.0,
+                            "p50_ms": self._quantile(buckets, count, 0.5),
+                            "p99_ms": self._quantile(buckets, count, 0.99)}
+        return {"ts": round(time.time(), 3), "uptime_s": round(time.time() - self.started, 1),
+                "counters": dict(self.counters), "gauges": dict(self.gauges), "stages": stages}
+
+    @staticmethod
+    def _quantile(buckets, count, q):
+        # upper bound of the bucket holding the q-th observation
+        if not count:
+            return None
+        seen = 0
+        for i, c in enumerate(buckets):
+            seen += c
+            if seen >= q * count:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else float("inf")
+        return float("inf")
+
+    def prometheus_text(self):
+        p = self.prefix
+        # runs on the HTTP thread while the hot path keeps adding keys:
+        # copy first (dict() of a dict is atomic under the GIL) so sorting
+        # can't hit "dictionary changed size during iteration"
+        counters, gauges = dict(self.counters), dict(self.gauges)
+        hists = {name: (list(h[0]), h[1], h[2]) for name, h in dict(self.hists).items()}
+        lines = []
+        for name, v in sorted(counters.items()):
+            lines += [f"# TYPE {p}_{name}_total counter", f"{p}_{name}_total {v}"]
+        for name, v in sorted(gauges.items()):
+            lines += [f"# TYPE {p}_{name} gauge", f"{p}_{name} {v}"]
+        if hists:
+            lines.append(f"# TYPE {p}_stage_seconds histogram")
+        for name, (buckets, total, count) in sorted(hists.items()):
+            cum = 0
+            for le, c in zip(BUCKETS_MS, buckets):
+                cum += c
+                lines.append(f'{p}_stage_seconds_bucket{{stage="{name}",le="{le / 1000:g}"}} {cum}')
+            lines.append(f'{p}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {count}')
+            lines.append(f'{p}_stage_seconds_sum{{stage="{name}"}} {total / 1000:.6f}')
+            lines.append(f'{p}_stage_seconds_count{{stage="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9464, host="127.0.0.1"):
+        """Prometheus endpoint on a daemon thread. Returns the server."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # no per-scrape noise on stdout
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def log_every(self, seconds=60, write=print):
+        """One JSON line every `seconds` on a daemon thread."""
+        def loop():
+            while True:
+                time.sleep(seconds)
+                write(json.dumps(self.snapshot()))
+
+        t = threading.Thread(target=loop, daemon=True)
+        t.start()
+        return t
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class NullMetrics:
+    _span = _NullSpan()
+
+    def inc(self, name, n=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def observe(self, name, ms):
+        pass
+
+    def span(self, name):
+        return self._span
+
+
+NULL_METRICS = NullMetrics()
@@ -0,0 +1,310 @@
+"""server.py
+One detector process for many rooms: an asyncio server that takes concurrent
+PCM streams over TCP or a Unix socket and scores all of them through one
+shared embedder + multiclass head.
+
+    python inference/server.py                          # 127.0.0.1:8765, 4-class head
+    python inference/server.py --unix /run/wakeword.sock --max-batch 64 --max-wait-ms 20
+    python evaluation/server_load.py --streams 64       # load test
+
+Protocol, per connection:
+
+    client -> {"room": "kitchen", "format": "s16"}\\n   (or "f32"; mono 16 kHz little-endian)
+    server -> {"ok": true, "labels": [...], "window_s": 1.5, "hop_s": 0.1}\\n
+    client -> raw PCM, any chunk size, until it closes its write side
+    server -> {"t": 12.3, "label": "hey room", "prob": 0.91, "lag_ms": 41.0}\\n  per detection
+    server -> {"done": true, "windows": ..., "gated": ..., "detections": ...}\\n  then closes
+
+Every stream keeps its own ring buffer, VAD gate and trigger (threshold +
+refractory, same as detector.py). Whole windows from all streams go into one
+queue; the batcher takes up to --max-batch of them, waiting at most
+--max-wait-ms after the first, and runs the backend on a single inference
+thread while the event loop keeps reading sockets. Probabilities go back to
+each stream's trigger in order. The queue is bounded, so when the model
+can't keep up the server stops reading and TCP pushes back on the clients.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from detector import (BACKEND, HOP_S, MULTI_BACKEND, PHRASE_THRESHOLDS, REFRACTORY_S, THRESH, USE_VAD,
+                      WINDOW_S, load_backend, load_multi_backend, warm_up)
+from metrics import NULL_METRICS, Metrics
+from streaming import MultiTrigger, RingBuffer, Trigger
+from vad import EnergyGate
+
+SR = 16000
+FORMATS = {"s16": (np.int16, 1 / 32768), "f32": (np.float32, 1.0)}
+READ_BYTES = 1 << 16
+
+Item = namedtuple("Item", ["stream", "end", "audio", "t_ready"])
+
+
+def parse_addr(addr):
+    """"unix:/path" or "host:port" -> ("unix", path) / ("tcp", (host, port))."""
+    if addr.startswith("unix:"):
+        return "unix", addr[5:]
+    host, _, port = addr.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+
+class Batcher:
+    """Cross-stream dynamic batching in front of one backend."""
+
+    def __init__(self, backend, max_batch=32, max_wait_ms=20.0, queue_size=None, metrics=NULL_METRICS):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue(queue_size or 8 * max_batch)
+        self.metrics = metrics
+        self.pool = ThreadPoolExecutor(1, thread_name_prefix="infer")  # one model call at a time
+        self.batches = 0
+        self.windows = 0
+
+    async def submit(self, item):
+        await self.queue.put(item)  # blocks the stream's reader when full
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        items = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(items) < self.max_batch:
+            try:
+                items.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return items
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        m = self.metrics
+        while True:
+            items = await self._collect()
+            t0 = time.perf_counter()
+            m.observe("batch_wait", (t0 - items[0].t_ready) * 1000)
+            try:
+                probs = await loop.run_in_executor(self.pool, self.backend.predict_proba,
+                                                   [it.audio for it in items])
+            except Exception as e:  # keep serving the other streams
+                print(f"[ERR] batch of {len(items)} failed: {type(e).__name__}: {e}", flush=True)
+                for it in items:
+                    it.stream.done_one()
+                continue
+            m.observe("model", (time.perf_counter() - t0) * 1000)
+            self.batches += 1
+            self.windows += len(items)
+            m.inc("batches")
+            m.inc("windows", len(items))
+            m.set("last_batch_size", len(items))
+            m.set("queue_depth", self.queue.qsize())
+            for it, p in zip(items, probs):
+                try:
+                    it.stream.on_scores(it.end, p, it.t_ready)
+                except Exception as e:  # one bad stream mustn't stop the batcher
+                    print(f"[ERR] {it.stream.name}: {type(e).__name__}: {e}", flush=True)
+                    it.stream.done_one()
+
+
+class StreamSession:
+    """One connection: buffering, gating, triggering and replies."""
+
+    def __init__(self, name, writer, batcher, labels, threshold, gate, fmt="s16", metrics=NULL_METRICS):
+        self.name = name
+        self.writer = writer
+        self.batcher = batcher
+        self.labels = labels
+        self.dtype, self.scale = FORMATS[fmt]
+        self.width = np.dtype(self.dtype).itemsize
+        self.win = int(WINDOW_S * SR)
+        self.hop = int(HOP_S * SR)
+        self.ring = RingBuffer(4 * self.win)
+        self.next_end = self.win
+        self.gate = gate
+        self.trigger = Trigger(threshold, REFRACTORY_S, SR) if labels is None else \
+            MultiTrigger(labels, threshold, REFRACTORY_S, SR)
+        self.metrics = metrics
+        self._rest = b""
+        self.pending = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.windows = self.gated = self.detections = 0
+
+    async def feed(self, data):
+        data = self._rest + data
+        n = len(data) // self.width * self.width
+        self._rest = data[n:]
+        if not n:
+            return
+        self.ring.write(np.frombuffer(data[:n], dtype=self.dtype).astype(np.float32) * self.scale)
+        while self.ring.written >= self.next_end:
+            end = self.next_end
+            self.next_end += self.hop
+            audio = self.ring.read(self.win, end)
+            if audio is None:
+                continue
+            self.windows += 1
+            if self.gate is not None and not self.gate(audio):
+                self.gated += 1
+                self.metrics.inc("windows_gated")
+                continue
+            self.pending += 1
+            self._idle.clear()
+            await self.batcher.submit(Item(self, end, audio, time.perf_counter()))
+
+    def on_scores(self, end, probs, t_ready):
+        if self.labels is None:
+            hit, label, prob = self.trigger.update(end, float(probs[1])), None, float(probs[1])
+        else:
+            k = self.trigger.update(end, probs)
+            hit = k is not None
+            label, prob = (self.labels[k], float(probs[k])) if hit else (None, 0.0)
+        if hit:
+            self.detections += 1
+            self.metrics.inc("triggers")
+            lag_ms = (time.perf_counter() - t_ready) * 1000
+            self.send({"t": round(end / SR, 3), "label": label, "prob": round(prob, 4), "lag_ms": round(lag_ms, 1)})
+        self.done_one()
+
+    def done_one(self):
+        self.pending -= 1
+        if self.pending == 0:
+            self._idle.set()
+
+    def send(self, msg):
+        if not self.writer.is_closing():
+            self.writer.write((json.dumps(msg) + "\n").encode())
+
+    async def drain(self):
+        await self._idle.wait()
+
+
+class DetectionServer:
+    def __init__(self, backend, labels, threshold, max_batch=32, max_wait_ms=20.0, vad=True,
+                 metrics=NULL_METRICS):
+        self.labels = labels
+        self.threshold = threshold
+        self.vad = vad
+        self.metrics = metrics
+        self.batcher = Batcher(backend, max_batch, max_wait_ms, metrics=metrics)
+        self.streams = 0
+        self._n = 0
+
+    async def handle(self, reader, writer):
+        self._n += 1
+        name = f"stream{self._n}"
+        session = None
+        try:
+            try:
+                hello = json.loads((await reader.readline()) or b"{}")
+                if not isinstance(hello, dict):
+                    raise ValueError(f"hello must be a JSON object, got {hello!r}")
+                fmt = hello.get("format", "s16")
+                if fmt not in FORMATS or int(hello.get("sr", SR)) != SR:
+                    raise ValueError(f"need mono {SR} Hz {'/'.join(FORMATS)}, got {hello}")
+            except (ValueError, TypeError) as e:
+                writer.write((json.dumps({"ok": False, "error": str(e)}) + "\n").encode())
+                await writer.drain()
+                return
+            name = str(hello.get("room", name))
+            session = StreamSession(name, writer, self.batcher, self.labels, self.threshold,
+                                    EnergyGate() if self.vad else None, fmt, self.metrics)
+            session.send({"ok": True, "labels": self.labels, "window_s": WINDOW_S, "hop_s": HOP_S})
+            self.streams += 1
+            self.metrics.set("streams", self.streams)
+            while True:
+                data = await reader.read(READ_BYTES)
+                if not data:
+                    break
+                await session.feed(data)
+            await session.drain()
+            session.send({"done": True, "windows": session.windows, "gated": session.gated,
+                          "detections": session.detections})
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if session is not None:
+                self.streams -= 1
+                self.metrics.set("streams", self.streams)
+            writer.close()
+
+    async def serve(self, addr):
+        kind, where = parse_addr(addr)
+        if kind == "unix":
+            if os.path.exists(where):
+                os.remove(where)
+            server = await asyncio.start_unix_server(self.handle, where)
+        else:
+            server = await asyncio.start_server(self.handle, *where)
+        batcher = asyncio.create_task(self.batcher.run())
+        print(f"Serving on {addr} (batch <= {self.batcher.max_batch}, "
+              f"wait <= {self.batcher.max_wait * 1000:.0f} ms)", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Multi-stream wakeword detection server")
+    ap.add_argument("--addr", default="127.0.0.1:8765", help="host:port or unix:/path")
+    ap.add_argument("--unix", default=None, help="shorthand for --addr unix:PATH")
+    ap.add_argument("--binary", action="store_true", help="single-phrase binary head")
+    ap.add_argument("--backend", default=None)
+    ap.add_argument("--threshold", type=float, default=THRESH, help="binary mode only")
+    ap.add_argument("--max-batch", type=int, default=32)
+    ap.add_argument("--max-wait-ms", type=float, default=20.0, help="deadline after a batch's first window")
+    ap.add_argument("--threads", type=int, default=None, help="torch / runtime threads for the model")
+    ap.add_argument("--no-vad", action="store_true")
+    ap.add_argument("--metrics-port", type=int, default=None)
+    ap.add_argument("--metrics-log", type=float, default=None)
+    args = ap.parse_args()
+
+    name = args.backend or (BACKEND if args.binary else MULTI_BACKEND)
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+    if args.binary:
+        backend = load_backend(name, batch_size=args.max_batch, threads=args.threads)
+        labels, threshold = None, args.threshold
+    else:
+        backend, labels = load_multi_backend(name, batch_size=args.max_batch, threads=args.threads)
+        threshold = PHRASE_THRESHOLDS
+    warm_up(backend)
+
+    metrics = NULL_METRICS
+    if args.metrics_port or args.metrics_log:
+        metrics = Metrics()
+        backend.metrics = metrics
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+        if args.metrics_log:
+            metrics.log_every(args.metrics_log, lambda line: print(f"[metrics] {line}", flush=True))
+
+    server = DetectionServer(backend, labels, threshold, args.max_batch, args.max_wait_ms,
+                             vad=USE_VAD and not args.no_vad, metrics=metrics)
+    try:
+        asyncio.run(server.serve(f"unix:{args.unix}" if args.unix else args.addr))
+    except KeyboardInterrupt:
+        pass
+    print(f"{server.batcher.windows} windows in {server.batcher.batches} batches")
+
+
+if __name__ == "__main__":
+    main()
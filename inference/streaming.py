@@ -0,0 +1,255 @@
+"""streaming.py
+Continuous wakeword detection on a live mic stream.
+
+The sounddevice callback only copies samples into a ring buffer; a separate
+scoring loop pulls the latest `window` seconds every `hop` seconds and runs
+the scorer on it. Windows overlap, so a phrase that straddles a block edge is
+still seen whole by at least one window. An optional `gate` (see vad.py) is
+asked first and silent windows never reach the scorer.
+
+With `labels` the scorer returns one probability per class instead of a
+single P(wakeword) and `threshold` is a {label: threshold} dict, so a single
+embedding per window covers every phrase; the detection says which fired.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from metrics import NULL_METRICS
+
+Detection = namedtuple("Detection", ["t", "prob", "score_ms", "lag_ms", "label"], defaults=[None])
+
+
+class RingBuffer:
+    """Single-producer / single-consumer float32 ring.
+
+    The writer (audio callback) first publishes the range it is about to
+    overwrite in `reserved`, fills the slots and only then bumps `written`;
+    the reader only ever reads and re-checks `reserved` after copying. No
+    locks, so the callback never blocks on the scoring thread.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.buf = np.zeros(self.capacity, dtype=np.float32)
+        self.written = 0  # total samples ever written (absolute index)
+        self.reserved = 0  # end of the write in progress, >= written
+
+    def write(self, x):
+        x = np.asarray(x, dtype=np.float32).reshape(-1)
+        n = len(x)
+        if n > self.capacity:
+            # nobody can read that far back anyway
+            self.written += n - self.capacity
+            x = x[-self.capacity:]
+            n = self.capacity
+        self.reserved = self.written + n
+        start = self.written % self.capacity
+        end = start + n
+        if end <= self.capacity:
+            self.buf[start:end] = x
+        else:
+            split = self.capacity - start
+            self.buf[start:] = x[:split]
+            self.buf[:end - self.capacity] = x[split:]
+        self.written += n
+
+    def read(self, n, end=None):
+        """Copy out the `n` samples ending at absolute index `end`.
+
+        Returns None if they're not available yet or already overwritten.
+        """
+        written = self.written
+        if end is None:
+            end = written
+        start = end - n
+        if start < 0 or end > written or written - start > self.capacity:
+            return None
+        idx = np.arange(start, end) % self.capacity
+        out = self.buf[idx]
+        # the writer may have lapped us while we copied, or been mid-write
+        # (slots filled, `written` not bumped yet): anything it touched more
+        # than capacity - n past our end overlaps the copy
+        if self.reserved - end > self.capacity - n:
+            return None
+        return out
+
+
+class Trigger:
+    """Threshold + refractory period, in samples so it works offline too."""
+
+    def __init__(self, threshold=0.5, refractory=1.0, sr=16000):
+        self.threshold = threshold
+        self.refractory = int(refractory * sr)
+        self.last_fire = None
+
+    def update(self, t, prob):
+        if prob < self.threshold:
+            return False
+        if self.last_fire is not None and t - self.last_fire < self.refractory:
+            return False
+        self.last_fire = t
+        return True
+
+
+class MultiTrigger:
+    """Per-class thresholds with one shared refractory period (one utterance,
+    one event). Classes without a threshold - e.g. "not wakeword" - never fire.
+    update() returns the index of the fired class or None."""
+
+    def __init__(self, labels, thresholds, refractory=1.0, sr=16000):
+        self.labels = list(labels)
+        self.thresholds = np.array([thresholds.get(l, np.inf) for l in self.labels])
+        self.refractory = int(refractory * sr)
+        self.last_fire = None
+
+    def update(self, t, probs):
+        probs = np.asarray(probs, dtype=np.float64)
+        over = probs >= self.thresholds
+        if not over.any():
+            return None
+        if self.last_fire is not None and t - self.last_fire < self.refractory:
+            return None
+        self.last_fire = t
+        return int(np.argmax(np.where(over, probs, -np.inf)))
+
+
+def replay_triggers(ends, probs, threshold, refractory=1.0, labels=None, scored=None, sr=16000):
+    """Trigger / MultiTrigger over stored window scores (offline, e.g. hours
+    of audio). `ends` are window end samples in time order, `probs` (N, C);
+    binary mode uses column 1. Windows under every threshold never change a
+    trigger's state, so only the candidates are stepped through.
+    Returns [(end sample, class index or None, prob)]."""
+    probs = np.asarray(probs)
+    ok = np.ones(len(ends), dtype=bool) if scored is None else np.asarray(scored, dtype=bool)
+    if labels is None:
+        trig = Trigger(threshold, refractory, sr)
+        cand = np.flatnonzero(ok & (probs[:, 1] >= threshold))
+        return [(int(ends[i]), None, float(probs[i, 1])) for i in cand if trig.update(ends[i], probs[i, 1])]
+    trig = MultiTrigger(labels, threshold, refractory, sr)
+    cand = np.flatnonzero(ok & (probs >= trig.thresholds).any(axis=1))
+    fired = []
+    for i in cand:
+        k = trig.update(ends[i], probs[i])
+        if k is not None:
+            fired.append((int(ends[i]), k, float(probs[i, k])))
+    return fired
+
+
+class StreamingDetector:
+    def __init__(self, score_fn, sr=16000, window=1.5, hop=0.1, threshold=0.5,
+                 refractory=1.0, buffer_seconds=10.0, on_detect=None, device=None, gate=None,
+                 labels=None, metrics=NULL_METRICS):
+        self.score_fn = score_fn  # float32 window -> P(wakeword), or per-class probs with `labels`
+        self.gate = gate  # float32 window -> bool, False skips the scorer
+        self.sr = sr
+        self.win = int(window * sr)
+        self.hop = int(hop * sr)
+        self.device = device
+        self.on_detect = on_detect
+        self.metrics = metrics
+        self.labels = labels
+        if labels is None:
+            self.trigger = Trigger(threshold, refractory, sr)
+        else:
+            self.trigger = MultiTrigger(labels, threshold, refractory, sr)
+        self.ring = RingBuffer(max(int(buffer_seconds * sr), 2 * self.win))
+        self._new_audio = threading.Event()
+        self._next_end = self.win
+
+        # counters, read from outside for logging
+        self.windows = 0
+        self.gated = 0
+        self.skipped = 0  # hops dropped because scoring fell behind
+        self.overflows = 0
+        self.detections = []
+
+    # --- audio side ---
+    def _callback(self, indata, frames, time_info, status):
+        if status:
+            self.overflows += 1
+            self.metrics.inc("input_overflows")
+        with self.metrics.span("capture"):
+            self.ring.write(indata[:, 0])
+        self._new_audio.set()
+
+    def feed(self, samples):
+        """Push audio by hand (files, tests) instead of the mic callback."""
+        self.ring.write(samples)
+        self._new_audio.set()
+
+    # --- scoring side ---
+    def poll(self):
+        """Score every complete hop that's pending. Returns new detections."""
+        fired = []
+        m = self.metrics
+        while self.ring.written >= self._next_end:
+            behind = self.ring.written - self._next_end
+            m.set("queue_depth_ms", round(behind / self.sr * 1000, 1))
+            if behind > self.hop:
+                # can't keep up - jump to the newest full hop, latency matters more
+                jump = (behind // self.hop) * self.hop
+                self.skipped += jump // self.hop
+                m.inc("skipped_windows", jump // self.hop)
+                self._next_end += jump
+            end = self._next_end
+            self._next_end += self.hop
+
+            audio = self.ring.read(self.win, end)
+            if audio is None:
+                self.skipped += 1
+                m.inc("skipped_windows")
+                continue
+            if self.gate is not None:
+                with m.span("vad"):
+                    speech = self.gate(audio)
+                if not speech:
+                    self.gated += 1
+                    m.inc("windows_gated")
+                    continue
+            t0 = time.perf_counter()
+            score = self.score_fn(audio)
+            score_ms = (time.perf_counter() - t0) * 1000
+            m.observe("score", score_ms)
+            self.windows += 1
+            m.inc("windows")
+
+            if self.labels is None:
+                label = None
+                hit = self.trigger.update(end, float(score))
+                prob = float(score)
+            else:
+                k = self.trigger.update(end, score)
+                hit = k is not None
+                label = self.labels[k] if hit else None
+                prob = float(score[k]) if hit else 0.0
+
+            if hit:
+                m.inc("triggers")
+                lag_ms = (self.ring.written - end) / self.sr * 1000 + score_ms
+                det = Detection(end / self.sr, prob, score_ms, lag_ms, label)
+                self.detections.append(det)
+                fired.append(det)
+                if self.on_detect:
+                    self.on_detect(det)
+        return fired
+
+    def run(self, seconds=None):
+        """Listen on the mic until Ctrl+C (or `seconds` if given)."""
+        import sounddevice as sd
+
+        stop_at = None if seconds is None else time.monotonic() + seconds
+        with sd.InputStream(samplerate=self.sr, channels=1, dtype="float32",
+                            blocksize=self.hop, device=self.device,
+                            callback=self._callback):
+            try:
+                while stop_at is None or time.monotonic() < stop_at:
+                    self._new_audio.wait(timeout=0.5)
+                    self._new_audio.clear()
+                    self.poll()
+            except KeyboardInterrupt:
+                pass
+        return self.detections
@@ -0,0 +1,88 @@
+"""vad.py
+Cheap voice-activity gate that runs before the embedder.
+
+A window is split into 20 ms frames; a frame counts as speech-like when its
+energy clears the threshold and its zero-crossing rate isn't noise-like
+(hiss / fan noise crosses zero far more often than voiced speech). The
+threshold is max(abs_db, noise_floor + margin_db). The noise floor follows
+the quietest frames (20th percentile) of every window, falling quickly and
+rising slowly, so steady low-ZCR noise like fan or HVAC hum that first
+passes as voiced is learned and closes the gate again, while speech (which
+has pauses between syllables) barely moves it. A window passes if it has at
+least `min_speech` seconds of speech-like frames.
+"""
+
+import numpy as np
+
+
+class EnergyGate:
+    def __init__(self, sr=16000, frame_ms=20, abs_db=-50.0, margin_db=10.0,
+                 max_zcr=0.35, min_speech=0.15, floor_alpha=0.05, floor_alpha_down=0.3):
+        self.frame = int(sr * frame_ms / 1000)
+        self.abs_db = abs_db
+        self.margin_db = margin_db
+        self.max_zcr = max_zcr
+        self.min_frames = max(1, int(min_speech * 1000 / frame_ms))
+        self.floor_alpha = floor_alpha
+        self.floor_alpha_down = floor_alpha_down
+        self.noise_floor = None
+
+        self.windows = 0
+        self.gated = 0
+
+    @property
+    def gated_fraction(self):
+        return self.gated / self.windows if self.windows else 0.0
+
+    def frame_stats(self, audio):
+        n = len(audio) // self.frame
+        frames = np.asarray(audio[:n * self.frame], dtype=np.float32).reshape(n, self.frame)
+        energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame - 1)
+        return energy_db, zcr
+
+    def threshold(self):
+        if self.noise_floor is None:
+            return self.abs_db
+        return max(self.abs_db, self.noise_floor + self.margin_db)
+
+    def is_speech(self, audio):
+        return self._speech(*self.frame_stats(audio))
+
+    def _speech(self, energy_db, zcr):
+        if len(energy_db) == 0:
+            return False
+        voiced = (energy_db > self.threshold()) & (zcr <= self.max_zcr)
+        return int(voiced.sum()) >= self.min_frames
+
+    def __call__(self, audio):
+        """True -> run the embedder, False -> skip this window."""
+        return self.decide(*self.frame_stats(audio))
+
+    def decide(self, energy_db, zcr):
+        """__call__ on precomputed frame stats, e.g. slices of a long
+        recording's frame_stats() when windows hop by whole frames."""
+        self.windows += 1
+        speech = self._speech(energy_db, zcr)
+        if not speech:
+            self.gated += 1
+        self._update_floor(energy_db)
+        return speech
+
+    def _update_floor(self, energy_db):
+        # every window, not just gated ones: noise loud enough to pass as
+        # voiced must still be learned or the gate never closes on it
+        if not len(energy_db):
+            return
+        quiet = float(np.percentile(energy_db, 20))
+        if self.noise_floor is None:
+            self.noise_floor = quiet
+        else:
+            alpha = self.floor_alpha_down if quiet < self.noise_floor else self.floor_alpha
+            self.noise_floor += alpha * (quiet - self.noise_floor)
+
+    def stats(self):
+        return {"windows": self.windows, "gated": self.gated,
+                "gated_fraction": round(self.gated_fraction, 4),
+                "noise_floor_db": None if self.noise_floor is None else round(self.noise_floor, 1)}
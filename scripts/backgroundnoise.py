@@ -1,94 +1,154 @@
+# backgroundnoise.py
+# Mix background noise from assets/background into half of each sample dir.
+#
+#   python scripts/backgroundnoise.py --workers 8 --seed 0
+#
+# All noise files are decoded once into one contiguous float32 bank
+# (inference/augment.py NoiseBank, cached as cache/noise_bank/<sr>.npy +
+# index - the same bank the online augmenter uses), which the worker
+# processes memory-map, so nothing is re-listed or re-decoded per clip. Every
+# random draw (noise file, offset, SNR, speed) happens up front in NumPy from
+# one seed; workers mix batches of clips in the array domain with the noise
+# scaled to the exact target SNR, and write int16 wavs. Rate changes go
+# through audio_io.resample; the +-5% speed change keeps pitch, like the
+# pydub speedup it replaces, via augment.time_stretch (WSOLA). Same CSV logs
+# as before.
+
 import os
+import sys
 import csv
-import random
-from pydub import AudioSegment
-from pydub.effects import speedup
+import argparse
+import numpy as np
+import soundfile as sf
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "inference"))
+from audio_io import resample
+from augment import NoiseBank, time_stretch
 
 skipped_log_path = "background_overlay_skipped.csv"
+log_path = "background_overlay_log.csv"
 
-def overlay_background_noise(clean_path, noise_dir, output_path, snr_db, log_writer=None, fname=""):
-    clean = AudioSegment.from_wav(clean_path)
-    noise_files = [f for f in os.listdir(noise_dir) if f.endswith(".wav")]
-    if not noise_files:
-        print(f"[WARN] No noise in {noise_dir}, skipping")
-        return
+sample_dirs = {
+    "data/training_data/heyroom": "data/training_data/finalheyroom",
+    "data/training_data/archived_notwakeword": "data/training_data/finalnotwakeword"
+}
 
-    noise_path = os.path.join(noise_dir, random.choice(noise_files))
-    noise = AudioSegment.from_wav(noise_path)
+noise_dir = "assets/background"
+bank_dir = "cache/noise_bank"
 
-    clean = clean.normalize()
-    noise = noise.normalize()
+SR = 16000
+SNR_RANGE = (5, 15)
+SPEED_RANGE = (0.95, 1.05)
+MIN_MS, MAX_MS = 500, 3000
+PEAK = 10 ** (-0.1 / 20)  # pydub normalize() headroom
 
-    dur = len(clean)
-    speed_factor = 1.0 if dur < 1000 else random.uniform(0.95, 1.05)
-    clean = speedup(clean, playback_speed=speed_factor)
 
-    if len(noise) < len(clean):
-        noise *= ((len(clean) // len(noise)) + 1)
-    noise = noise[:len(clean)]
+def peak_normalize(x):
+    peak = np.abs(x).max() if len(x) else 0.0
+    return x * (PEAK / peak) if peak > 0 else x
 
-    if len(noise) > len(clean):
-        shift = random.randint(0, len(noise) - len(clean))
-        noise = noise[shift:shift + len(clean)]
 
-    noise += random.uniform(-5, 0)
+def plan(files, bank, rng):
+    """All random draws for a list of (fname, in_path, out_path), vectorized."""
+    n = len(files)
+    noise = rng.integers(0, len(bank.lengths), n)
+    return [{"fname": f, "in": i, "out": o, "noise": int(k),
+             "start": float(u), "snr": float(s), "speed": float(v)}
+            for (f, i, o), k, u, s, v in zip(files, noise, rng.random(n),
+                                              rng.uniform(*SNR_RANGE, n), rng.uniform(*SPEED_RANGE, n))]
 
-    clean_rms = clean.rms
-    target_noise_rms = clean_rms / (10 ** (snr_db / 20))
-    if noise.rms > 0:
-        adjust = 20 * (random.random() - 0.5)
-        noise = noise - (noise.rms - target_noise_rms) + adjust
 
-    combined = clean.overlay(noise)
+# --- worker side ---
+_bank = None
 
-    if len(combined) < 500 or len(combined) > 3000:
-        print(f"[SKIP] {fname} - duration {len(combined)}ms")
-        if log_writer:
-            with open(skipped_log_path, mode='a', newline='') as skipped_file:
-                writer = csv.writer(skipped_file)
-                writer.writerow([fname, f"Duration {len(combined)}ms", dur, clean.rms])
-        clean.export(output_path, format="wav")
-        return
 
-    combined.export(output_path, format="wav")
-    if log_writer:
-        log_writer.writerow([fname, os.path.basename(noise_path), round(snr_db, 2), clean.rms, noise.rms, len(clean)])
+def _init_worker(bank):
+    global _bank
+    _bank = bank  # reopens the memmap, shared through the page cache
 
-sample_dirs = {
-    "data/training_data/heyroom": "data/training_data/finalheyroom",
-    "data/training_data/archived_notwakeword": "data/training_data/finalnotwakeword"
-}
 
-noise_dir = "assets/background"
+def mix_one(job):
+    clean, fs = sf.read(job["in"], dtype="float32", always_2d=True)
+    clean = peak_normalize(clean.mean(axis=1))
+    dur = 1000 * len(clean) / fs
+    if dur >= 1000:
+        clean = time_stretch(clean, job["speed"])
+
+    noise = _bank.segment(job["noise"], job["start"], int(np.ceil(len(clean) * _bank.sr / fs)) + 1)
+    noise = resample(noise, _bank.sr, fs)[:len(clean)]
+
+    clean_rms = float(np.sqrt(np.mean(np.square(clean, dtype=np.float64))))
+    noise_rms = float(np.sqrt(np.mean(np.square(noise, dtype=np.float64))))
+    out_ms = 1000 * len(clean) / fs
+    if out_ms < MIN_MS or out_ms > MAX_MS:
+        sf.write(job["out"], clean, fs, subtype="PCM_16")
+        return job, "skipped", out_ms, dur, clean_rms, 0.0
+
+    # exact SNR: 20 log10(rms_clean / rms_noise) == snr
+    gain = clean_rms / (noise_rms * 10 ** (job["snr"] / 20)) if noise_rms > 0 else 0.0
+    mixed = np.clip(clean + gain * noise, -1.0, 1.0)
+    sf.write(job["out"], mixed, fs, subtype="PCM_16")
+    return job, "ok", out_ms, dur, clean_rms, noise_rms * gain
+
+
+def mix_batch(jobs):
+    results = []
+    for job in jobs:
+        try:
+            results.append(mix_one(job))
+        except Exception as e:
+            results.append((job, f"{type(e).__name__}: {e}", 0, 0, 0, 0))
+    return results
 
-with open("background_overlay_log.csv", 'w', newline='') as log_file:
-    log_writer = csv.writer(log_file)
-    log_writer.writerow(["Filename", "Noise Used", "SNR (dB)", "Clean RMS", "Noise RMS", "Duration (ms)"])
 
-with open(skipped_log_path, 'w', newline='') as skipped_file:
-    skipped_writer = csv.writer(skipped_file)
-    skipped_writer.writerow(["Filename", "Reason", "Clean Duration (ms)", "Clean RMS"])
+def main():
+    ap = argparse.ArgumentParser(description="Overlay background noise on half of each sample dir")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--batch", type=int, default=64, help="clips per worker task")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--fraction", type=float, default=0.5)
+    args = ap.parse_args()
 
-with open("background_overlay_log.csv", 'a', newline='') as log_file:
-    log_writer = csv.writer(log_file)
+    if not os.path.isdir(noise_dir):
+        raise SystemExit(f"No noise in {noise_dir}")
+    bank = NoiseBank(noise_dir, SR, bank_dir)
+    rng = np.random.default_rng(args.seed)
 
+    jobs = []
     for src_dir, out_dir in sample_dirs.items():
         os.makedirs(out_dir, exist_ok=True)
-        files = [f for f in os.listdir(src_dir) if f.endswith(".wav")]
-        to_process = random.sample(files, len(files) // 2)
+        files = sorted(f for f in os.listdir(src_dir) if f.endswith(".wav"))
+        picked = rng.choice(len(files), int(len(files) * args.fraction), replace=False)
+        jobs += plan([(files[i], os.path.join(src_dir, files[i]), os.path.join(out_dir, files[i]))
+                      for i in sorted(picked)], bank, rng)
+
+    # pcm16 rms like pydub's AudioSegment.rms, so the logs read the same as before
+    scale = 32768
+    with open(log_path, "w", newline="") as log_file, \
+            open(skipped_log_path, "w", newline="") as skipped_file, \
+            ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(bank,)) as ex:
+        log_writer = csv.writer(log_file)
+        log_writer.writerow(["Filename", "Noise Used", "SNR (dB)", "Clean RMS", "Noise RMS", "Duration (ms)"])
+        skipped_writer = csv.writer(skipped_file)
+        skipped_writer.writerow(["Filename", "Reason", "Clean Duration (ms)", "Clean RMS"])
+
+        futs = [ex.submit(mix_batch, jobs[i:i + args.batch]) for i in range(0, len(jobs), args.batch)]
         done = 0
-        tries = 0
-        max_tries = len(to_process) * 30
-
-        while done < len(to_process) and tries < max_tries:
-            fname = random.choice(files)
-            in_path = os.path.join(src_dir, fname)
-            out_path = os.path.join(out_dir, fname)
-            snr = random.uniform(5, 15)
-            try:
-                overlay_background_noise(in_path, noise_dir, out_path, snr, log_writer, fname)
-                print(f"[OK] {out_path}")
-                done += 1
-            except Exception as e:
-                print(f"[FAIL] {fname}: {e}")
-            tries += 1
\ No newline at end of file
+        for fut in as_completed(futs):
+            for job, status, out_ms, dur, clean_rms, noise_rms in fut.result():
+                if status == "ok":
+                    log_writer.writerow([job["fname"], bank.names[job["noise"]], round(job["snr"], 2),
+                                         round(clean_rms * scale), round(noise_rms * scale), round(out_ms)])
+                    done += 1
+                elif status == "skipped":
+                    print(f"[SKIP] {job['fname']} - duration {out_ms:.0f}ms")
+                    skipped_writer.writerow([job["fname"], f"Duration {out_ms:.0f}ms", round(dur),
+                                             round(clean_rms * scale)])
+                else:
+                    print(f"[FAIL] {job['fname']}: {status}")
+            print(f"[OK] {done}/{len(jobs)} mixed")
+
+
+if __name__ == "__main__":
+    main()
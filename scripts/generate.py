@@ -0,0 +1,556 @@
+"""
+generate.py
+
+One TTS generation engine for all the synthetic data (XTTS v2, YourTTS,
+MeloTTS + OpenVoice tone conversion), driven by a declarative job list.
+
+    python scripts/generate.py scripts/generation_jobs.yml
+    python scripts/generate.py scripts/generation_jobs.yml --only xtts_pos --workers 6
+
+- every clip is one task: (engine, phrase, speaker, output file), phrases and
+  augmentation are drawn from an RNG seeded by the task, so a re-run makes
+  the same clip
+- tasks run on a process pool; each worker loads each engine once and keeps
+  it, and runs a speaker's clips back to back so conditioning is computed
+  once (scripts/speaker_cache.py)
+- clips are written to a unique temp file in <out_dir>/.generate-tmp/ and
+  renamed into place, nothing shares a temp.wav and a killed run never leaves
+  a half file among the clips; leftovers of a killed worker are swept at the
+  next start (no *.wav lister looks inside the scratch dir)
+- a journal (one line per finished clip: ok / dropped / failed, and the
+  phrase it says) lets a crashed or stopped run resume; only failed clips
+  are retried, and a clip whose file is there but says another phrase (an
+  active job over an older passive run, or the reverse) is made again
+- nothing is deleted up front, use --clean to empty a job's out_dir first
+
+Job file (YAML):
+
+    defaults:            # merged into every job
+      language: en
+      augment: true      # +-5% pitch / speed like the old scripts
+      min_ms: 500        # drop clips outside [min_ms, max_ms] after augmenting
+      max_ms: 3000
+    jobs:
+      - name: xtts_pos
+        engine: xtts                  # xtts | yourtts | openvoice
+        phrases: ["Hey Room", "Hi Room"]  # one picked at random per clip
+        speakers: all                 # or [speaker1, speaker3]
+        count: 100                    # clips per speaker
+        out_dir: data/training_data/heyroom
+        file: "xtts_{speaker}_{i:03}.wav"   # also {n} (speaker number), {engine}
+
+Active jobs (negatives): instead of drawing a phrase at random for every
+clip, a job with an `active:` block first makes `pilot` clips for every
+phrase x speaker pair and scores them with the current classifier. The rest
+of the budget (count x speakers) goes to the `top` share of pairs with the
+highest false-accept score, in proportion to it - the pairs the model
+already rejects get nothing more. The allocation is saved next to the
+journal (<job>.plan.json), so a resumed run finishes the same plan even if
+the model changed in between; --redo re-scores.
+
+      - name: xtts_neg
+        ...
+        active:
+          pilot: 3                    # clips per phrase x speaker scored first
+          backend: wav2vec2           # inference/backends.py engine
+          head: wakeword_multiclass_classifier.joblib
+          negative: not wakeword      # false-accept score = 1 - p(negative)
+          top: 0.25                   # share of pairs that get the rest
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import numpy as np
+import yaml
+
+REF_DIR = "reference_voices"
+JOURNAL = "cache/generation/journal.tsv"
+DEFAULTS = {"language": "en", "augment": True, "min_ms": 500, "max_ms": 3000,
+            "speakers": "all", "file": "{engine}_{speaker}_{i:03}.wav", "options": {}}
+ACTIVE = {"pilot": 3, "backend": "wav2vec2", "head": "wakeword_multiclass_classifier.joblib",
+          "label_encoder": "wakeword_label_encoder.joblib", "negative": "not wakeword", "top": 0.25}
+SCRATCH_DIR = ".generate-tmp"  # per out_dir, same filesystem so os.replace stays a rename
+INFERENCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "inference")
+
+
+# --- engines (one instance per worker process) ---
+class XttsEngine:
+    def __init__(self, device, options):
+        import torch.serialization
+        from TTS.api import TTS
+        from TTS.tts.configs.xtts_config import XttsConfig
+        torch.serialization.add_safe_globals([XttsConfig])
+        self.tts = TTS(model_name="tts_models/multilingual/multi-dataset/xtts_v2",
+                       progress_bar=False, gpu=device == "cuda")
+
+    def synth(self, text, ref, path, language, rng):
+        from speaker_cache import xtts_latents, xtts_to_file
+        xtts_to_file(self.tts, text, xtts_latents(self.tts, ref), path, language=language)
+
+
+class YourTtsEngine:
+    def __init__(self, device, options):
+        from TTS.api import TTS
+        from speaker_cache import cache_speaker_encoder
+        self.tts = cache_speaker_encoder(TTS(model_name="tts_models/multilingual/multi-dataset/your_tts",
+                                             progress_bar=False, gpu=device == "cuda"))
+
+    def synth(self, text, ref, path, language, rng):
+        self.tts.tts_to_file(text=text, speaker_wav=ref, language=language, file_path=path)
+
+
+class OpenVoiceEngine:
+    # MeloTTS base voice, then OpenVoice converts its tone color to the reference speaker
+    def __init__(self, device, options):
+        import nltk
+        import torch
+        from melo.api import TTS
+        from openvoice.api import ToneColorConverter
+
+        nltk.download("averaged_perceptron_tagger_eng", quiet=True)
+        ckpt = options.get("converter", "openvoice/checkpoints_v2/converter")
+        self.converter = ToneColorConverter(f"{ckpt}/config.json", device=device)
+        self.converter.load_ckpt(f"{ckpt}/checkpoint.pth")
+        self.tts = TTS(language=options.get("melo_language", "EN"), device=device)
+        self.spk_id = self.tts.hps.data.spk2id[options.get("base_speaker", "EN_INDIA")]
+        se = options.get("source_se", "openvoice/checkpoints_v2/base_speakers/ses/en-india.pth")
+        self.source_se = torch.load(se, map_location=device)
+        self.speed = options.get("speed", [0.95, 1.05])
+
+    def synth(self, text, ref, path, language, rng):
+        from speaker_cache import openvoice_se
+        tgt_se = openvoice_se(ref, self.converter, vad=False)
+        fd, raw = tempfile.mkstemp(suffix=".wav", prefix="raw-", dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            self.tts.tts_to_file(text, self.spk_id, raw, speed=rng.uniform(*self.speed))
+            if os.path.getsize(raw) < 1000:
+                raise RuntimeError("melo produced no audio")
+            self.converter.convert(audio_src_path=raw, src_se=self.source_se, tgt_se=tgt_se,
+                                   output_path=path, message="@MyShell")
+        finally:
+            os.remove(raw)
+
+
+ENGINES = {"xtts": XttsEngine, "yourtts": YourTtsEngine, "openvoice": OpenVoiceEngine}
+
+
+# --- job list -> tasks ---
+def load_jobs(path, only=None):
+    with open(path) as f:
+        spec = yaml.safe_load(f)
+    defaults = dict(DEFAULTS, **(spec.get("defaults") or {}))
+    jobs = []
+    for i, job in enumerate(spec["jobs"]):
+        job = dict(defaults, **job)
+        job["id"] = job.get("name") or f"job{i}"
+        if job["engine"] not in ENGINES:
+            raise ValueError(f"job {job['id']}: unknown engine {job['engine']!r}, have {sorted(ENGINES)}")
+        if only and job["id"] not in only:
+            continue
+        if job.get("active"):
+            job["active"] = dict(ACTIVE, **job["active"]) if isinstance(job["active"], dict) else dict(ACTIVE)
+        jobs.append(job)
+    return jobs
+
+
+def resolve_speakers(speakers, ref_dir=REF_DIR):
+    if speakers == "all":
+        found = glob.glob(os.path.join(ref_dir, "speaker*.wav"))
+        # speaker2 before speaker10
+        found.sort(key=lambda p: (len(os.path.basename(p)), os.path.basename(p)))
+        return [(os.path.splitext(os.path.basename(p))[0], p) for p in found]
+    out = []
+    for s in speakers:
+        p = s if s.endswith(".wav") else os.path.join(ref_dir, f"{s}.wav")
+        if not os.path.exists(p):
+            print(f"[WARN] reference voice {p} not found, skipping")
+            continue
+        out.append((os.path.splitext(os.path.basename(p))[0], p))
+    return out
+
+
+def _task(job, speaker, ref, i, text):
+    n = "".join(c for c in speaker if c.isdigit())
+    fname = job["file"].format(engine=job["engine"], speaker=speaker, n=n, i=i)
+    return {
+        "job": job["id"], "engine": job["engine"], "options": job["options"],
+        "text": text, "speaker": speaker, "ref": ref,
+        "out": os.path.join(job["out_dir"], fname), "language": job["language"],
+        "augment": job["augment"], "min_ms": job["min_ms"], "max_ms": job["max_ms"],
+        "seed": f"{job['id']}:{speaker}:{i}",
+    }
+
+
+def job_phrases(job):
+    return list(dict.fromkeys(job.get("phrases") or [job["phrase"]]))
+
+
+def expand(job):
+    """One task dict per clip, grouped speaker by speaker."""
+    phrases = job.get("phrases") or [job["phrase"]]
+    tasks = []
+    for speaker, ref in resolve_speakers(job["speakers"]):
+        for i in range(job["count"]):
+            rng = random.Random(f"{job['id']}:{speaker}:{i}")
+            tasks.append(dict(_task(job, speaker, ref, i, rng.choice(phrases)), passive=True))
+    return tasks
+
+
+# --- active jobs: pilot, score, spend the rest where the model is fooled ---
+def expand_pilot(job):
+    """`pilot` clips per phrase x speaker, clip numbers 0 .. phrases*pilot-1."""
+    pilot = job["active"]["pilot"]
+    tasks = []
+    for speaker, ref in resolve_speakers(job["speakers"]):
+        for k, text in enumerate(job_phrases(job)):
+            tasks += [_task(job, speaker, ref, k * pilot + j, text) for j in range(pilot)]
+    return tasks
+
+
+def expand_plan(job, plan):
+    """Follow-up clips of a plan, numbered on from each speaker's pilots."""
+    refs = dict(resolve_speakers(job["speakers"]))
+    start = len(job_phrases(job)) * job["active"]["pilot"]
+    nxt, tasks = defaultdict(lambda: start), []
+    for speaker, text, n in plan["counts"]:
+        if speaker not in refs:
+            continue
+        for _ in range(n):
+            tasks.append(_task(job, speaker, refs[speaker], nxt[speaker], text))
+            nxt[speaker] += 1
+    return tasks
+
+
+def allocate(scores, budget, top=0.25):
+    """Split `budget` clips over the highest-scoring `top` share of pairs,
+    in proportion to their score (largest remainder, so it sums exactly).
+    All-zero scores fall back to an even split over every pair."""
+    keys = sorted(scores, key=lambda k: -scores[k])
+    if budget <= 0 or not keys:
+        return {}
+    keys = keys[:max(1, int(np.ceil(top * len(keys))))]
+    w = np.array([scores[k] for k in keys], dtype=np.float64)
+    if w.sum() <= 0:
+        keys = sorted(scores)
+        w = np.ones(len(keys))
+    share = budget * w / w.sum()
+    counts = np.floor(share).astype(int)
+    counts[np.argsort(counts - share)[:budget - counts.sum()]] += 1
+    return {k: int(c) for k, c in zip(keys, counts) if c}
+
+
+class PilotScorer:
+    """False-accept score of a clip: 1 - p(negative class) from the
+    classifier the data is for (binary heads: p(positive))."""
+
+    def __init__(self, backend, head, label_encoder, negative):
+        if INFERENCE_DIR not in sys.path:
+            sys.path.insert(0, INFERENCE_DIR)
+        from backends import load_labels, make_backend
+
+        kwargs = {"head": head} if backend in ("speechbrain", "wav2vec2") else {}
+        self.backend = make_backend(backend, **kwargs)
+        self.neg = 0
+        head = getattr(self.backend, "head", None)
+        if head is not None:
+            try:
+                labels = load_labels(head, label_encoder)
+            except (OSError, ValueError, AttributeError):
+                labels = None
+            if labels and len(labels) > 2:
+                if negative not in labels:
+                    raise ValueError(f"negative class {negative!r} not in {labels}")
+                self.neg = labels.index(negative)
+
+    def __call__(self, paths):
+        from backends import predict_files
+
+        probs, ok, failed = predict_files(self.backend, paths)
+        for p, e in failed:
+            print(f"[WARN] pilot {p} not scored: {e}")
+        return dict(zip(ok, (1.0 - probs[:, self.neg]).tolist()))
+
+
+def plan_path(job, journal):
+    return os.path.join(os.path.dirname(journal) or ".", f"{job['id']}.plan.json")
+
+
+def make_plan(job, pilots, done, scorer):
+    """Score the job's finished pilot clips, average per phrase x speaker and
+    allocate what's left of the budget."""
+    cfg = job["active"]
+    ok = [t for t in pilots if is_done(t, done, ("ok",))]
+    fa = scorer([t["out"] for t in ok])
+    per_pair = defaultdict(list)
+    for t in pilots:
+        per_pair[(t["speaker"], t["text"])]  # every pair competes, even with no clip scored
+    for t in ok:
+        if t["out"] in fa:
+            per_pair[(t["speaker"], t["text"])].append(fa[t["out"]])
+    scores = {k: float(np.mean(v)) if v else 0.0 for k, v in per_pair.items()}
+    budget = job["count"] * len({t["speaker"] for t in pilots}) - len(pilots)
+    counts = allocate(scores, budget, cfg["top"])
+    return {"pilot": cfg["pilot"], "budget": budget,
+            "scores": [[s, p, round(v, 4)] for (s, p), v in sorted(scores.items())],
+            "counts": [[s, p, n] for (s, p), n in sorted(counts.items(), key=lambda kv: -kv[1])]}
+
+
+def print_plan(job, plan, n=8):
+    print(f"[{job['id']}] {plan['budget']} clips over {len(plan['counts'])} of "
+          f"{len(plan['scores'])} phrase x speaker pairs")
+    score = {(s, p): v for s, p, v in plan["scores"]}
+    for s, p, c in plan["counts"][:n]:
+        print(f"   {c:>5}  {s:<12} {p!r:<20} fa {score[(s, p)]:.3f}")
+
+
+# --- journal ---
+def read_journal(path):
+    """{out: (status, text)}, last line wins. Lines from before the text
+    column have text None - those runs were all passive."""
+    done = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                parts = line.rstrip("\n").split("\t")
+                if len(parts) >= 2:
+                    done[parts[0]] = (parts[1], parts[4] if len(parts) >= 5 else None)
+    return done
+
+
+def _clean(text):
+    return text.replace("\t", " ").replace("\n", " ")
+
+
+def is_done(task, done, statuses=("ok", "dropped")):
+    """The journal has this exact clip (same file and phrase) as one of
+    `statuses`, and an ok clip's file still exists."""
+    status, text = done.get(task["out"], (None, None))
+    if status not in statuses or (status == "ok" and not os.path.exists(task["out"])):
+        return False
+    if text is None:
+        return bool(task.get("passive"))
+    return text == _clean(task["text"])
+
+
+# --- worker side ---
+_engines = {}
+_device = "cpu"
+
+
+def _init_worker(threads, device):
+    global _device
+    import torch
+    torch.set_num_threads(threads)
+    _device = device
+
+
+def _engine(name, options):
+    key = (name, repr(sorted(options.items())))
+    if key not in _engines:
+        _engines[key] = ENGINES[name](_device, options)
+    return _engines[key]
+
+
+def postprocess(src, dst, task, rng):
+    """Optional pitch/speed augmentation + duration filter, written to dst.
+    Returns the clip length in ms, or None if it was dropped."""
+    if not (task["augment"] or task["min_ms"] or task["max_ms"]):
+        os.replace(src, dst)
+        return -1  # untouched, length not measured
+
+    from pydub import AudioSegment
+
+    audio = AudioSegment.from_wav(src)
+    if task["augment"]:
+        pitch = rng.uniform(0.95, 1.05)
+        speed = rng.uniform(0.95, 1.05)
+        audio = audio._spawn(audio.raw_data, overrides={"frame_rate": int(audio.frame_rate * pitch)})
+        audio = audio.set_frame_rate(16000)
+        try:
+            audio = audio.speedup(playback_speed=speed)
+        except Exception:
+            pass
+    dur = len(audio)
+    if (task["min_ms"] and dur < task["min_ms"]) or (task["max_ms"] and dur > task["max_ms"]):
+        return None
+    audio.export(dst, format="wav")
+    return dur
+
+
+def scratch_dir(out_dir):
+    return os.path.join(out_dir, SCRATCH_DIR)
+
+
+def sweep_tmp(out_dirs):
+    """Remove temp files a killed worker left behind, including the
+    .tts-/.out-/.raw-*.wav ones older runs made right in out_dir."""
+    n = 0
+    for d in out_dirs:
+        if not os.path.isdir(d):
+            continue
+        tmp = scratch_dir(d)
+        if os.path.isdir(tmp):
+            n += len(os.listdir(tmp))
+            shutil.rmtree(tmp)
+        for f in os.listdir(d):
+            if f.startswith((".tts-", ".out-", ".raw-")) and f.endswith(".wav"):
+                os.remove(os.path.join(d, f))
+                n += 1
+    if n:
+        print(f"Removed {n} stale temp files")
+
+
+def run_tasks(tasks):
+    """Runs in a worker. Returns [(out, status, ms, message, text)]."""
+    results = []
+    for task in tasks:
+        out_dir = os.path.dirname(task["out"]) or "."
+        tmp_dir = scratch_dir(out_dir)
+        os.makedirs(tmp_dir, exist_ok=True)
+        rng = random.Random(task["seed"] + ":aug")
+        fd, raw = tempfile.mkstemp(suffix=".wav", prefix="tts-", dir=tmp_dir)
+        os.close(fd)
+        fd, final = tempfile.mkstemp(suffix=".wav", prefix="out-", dir=tmp_dir)
+        os.close(fd)
+        t0 = time.perf_counter()
+        try:
+            _engine(task["engine"], task["options"]).synth(task["text"], task["ref"], raw, task["language"], rng)
+            if os.path.getsize(raw) < 1000:
+                raise RuntimeError("TTS wrote no audio")
+            dur = postprocess(raw, final, task, rng)
+            if dur is None:
+                results.append((task["out"], "dropped", 0, "duration out of range", task["text"]))
+            else:
+                os.replace(final, task["out"])
+                results.append((task["out"], "ok", round((time.perf_counter() - t0) * 1000), "", task["text"]))
+        except Exception as e:
+            msg = f"{type(e).__name__}: {e}".replace("\t", " ").replace("\n", " ")
+            results.append((task["out"], "failed", 0, msg, task["text"]))
+        finally:
+            for p in (raw, final):
+                if os.path.exists(p):
+                    os.remove(p)
+    return results
+
+
+def chunks(tasks, size):
+    # keep a chunk on one engine + speaker so a worker reuses its conditioning
+    groups = defaultdict(list)
+    for t in tasks:
+        groups[(t["job"], t["speaker"])].append(t)
+    for group in groups.values():
+        for i in range(0, len(group), size):
+            yield group[i:i + size]
+
+
+def run(jobs, workers=2, chunk=8, journal=JOURNAL, redo=False, device="cpu"):
+    os.makedirs(os.path.dirname(journal), exist_ok=True)
+    sweep_tmp(sorted({j["out_dir"] for j in jobs}))
+    done = {} if redo else read_journal(journal)
+    passive = [j for j in jobs if not j.get("active")]
+    active = [j for j in jobs if j.get("active")]
+    if passive:
+        execute([t for job in passive for t in expand(job)], done, workers, chunk, journal, device)
+    if not active:
+        return
+
+    pilots = {job["id"]: expand_pilot(job) for job in active}
+    print(f"Active jobs {[j['id'] for j in active]}: pilot round")
+    execute([t for job in active for t in pilots[job["id"]]], done, workers, chunk, journal, device)
+    done = read_journal(journal)
+
+    follow, scorers = [], {}
+    for job in active:
+        path = plan_path(job, journal)
+        plan = None
+        if not redo and os.path.exists(path):
+            with open(path) as f:
+                plan = json.load(f)
+            if plan.get("pilot") != job["active"]["pilot"]:
+                plan = None
+        if plan is None:
+            cfg = job["active"]
+            key = (cfg["backend"], cfg["head"], cfg["label_encoder"], cfg["negative"])
+            if key not in scorers:
+                scorers[key] = PilotScorer(*key)
+            plan = make_plan(job, pilots[job["id"]], done, scorers[key])
+            tmp = path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(plan, f)
+            os.replace(tmp, path)
+        print_plan(job, plan)
+        follow += expand_plan(job, plan)
+    scorers.clear()  # free the classifier before the TTS workers start
+    execute(follow, done, workers, chunk, journal, device)
+
+
+def execute(tasks, done, workers=2, chunk=8, journal=JOURNAL, device="cpu"):
+    """Run whatever of `tasks` the journal doesn't have as ok / dropped."""
+    todo = [t for t in tasks if not is_done(t, done)]
+    print(f"{len(tasks)} clips, {len(tasks) - len(todo)} already done, {len(todo)} to go")
+    if not todo:
+        return
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    counts = defaultdict(int)
+    t0 = time.perf_counter()
+    with open(journal, "a") as jf, ProcessPoolExecutor(workers, mp_context=get_context("spawn"),
+                                                       initializer=_init_worker,
+                                                       initargs=(threads, device)) as ex:
+        futs = [ex.submit(run_tasks, c) for c in chunks(todo, chunk)]
+        for fut in as_completed(futs):
+            for out, status, ms, msg, text in fut.result():
+                jf.write(f"{out}\t{status}\t{ms}\t{msg}\t{_clean(text)}\n")
+                counts[status] += 1
+                if status == "failed":
+                    print(f"[FAIL] {out}: {msg}")
+            jf.flush()
+            n = sum(counts.values())
+            rate = n / (time.perf_counter() - t0)
+            print(f"   - {n}/{len(todo)} ({dict(counts)}) {rate:.2f} clips/s, "
+                  f"eta {(len(todo) - n) / rate / 60:.0f} min")
+    print(f"Done: {dict(counts)}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Run TTS generation jobs")
+    ap.add_argument("jobs", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            "generation_jobs.yml"))
+    ap.add_argument("--only", default=None, help="comma separated job names")
+    ap.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 4),
+                    help="processes, each holds its own copy of the models")
+    ap.add_argument("--chunk", type=int, default=8, help="clips per task sent to a worker")
+    ap.add_argument("--journal", default=JOURNAL)
+    ap.add_argument("--device", default="cpu")
+    ap.add_argument("--redo", action="store_true", help="ignore the journal")
+    ap.add_argument("--clean", action="store_true", help="empty each job's out_dir before starting")
+    ap.add_argument("--passive", action="store_true",
+                    help="ignore active: blocks, draw phrases at random like the old scripts")
+    args = ap.parse_args(argv)
+
+    jobs = load_jobs(args.jobs, set(args.only.split(",")) if args.only else None)
+    if args.passive:
+        for job in jobs:
+            job["active"] = None
+    if args.clean:
+        for d in sorted({j["out_dir"] for j in jobs}):
+            if os.path.isdir(d):
+                shutil.rmtree(d)
+        args.redo = True
+    run(jobs, args.workers, args.chunk, args.journal, args.redo, args.device)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
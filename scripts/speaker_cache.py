@@ -0,0 +1,132 @@
+"""speaker_cache.py
+Per-speaker conditioning computed once per reference voice and kept on disk.
+
+The generators make ~100 clips per reference voice, but the speaker part of
+each one depends only on the reference wav:
+- OpenVoice: the target tone-color embedding from se_extractor.get_se
+- XTTS v2: the GPT conditioning latent + speaker embedding that tts_to_file
+  re-derives from speaker_wav on every call
+- YourTTS: the speaker-encoder d-vector, same story
+
+Both are cached under cache/speakers/<kind>/<sha1 of the wav>.pt (an edited
+reference file gets a new entry) and memoized in-process.
+
+    tgt_se = openvoice_se(wav, tone_converter)
+    latents = xtts_latents(tts, wav)
+    xtts_to_file(tts, "Hey Room", latents, "out.wav")
+    cache_speaker_encoder(tts)   # YourTTS: tts_to_file(speaker_wav=...) now hits the cache
+"""
+
+import os
+import sys
+import tempfile
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "inference"))
+from embedding_cache import file_sha1
+
+CACHE_ROOT = "cache/speakers"
+_memo = {}
+
+
+def cached(kind, wav, compute, device="cpu", root=CACHE_ROOT):
+    """compute(wav) once per (kind, wav content), then from memory / disk."""
+    path = os.path.join(root, kind, file_sha1(wav) + ".pt")
+    if path in _memo:
+        return _memo[path]
+    if os.path.exists(path):
+        value = torch.load(path, map_location=device)
+    else:
+        value = compute(wav)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # generate.py workers compute the same voice concurrently, each
+        # writes its own temp file and the last rename wins
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            torch.save(_to_cpu(value), tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    _memo[path] = value
+    return value
+
+
+def _to_cpu(value):
+    if isinstance(value, dict):
+        return {k: _to_cpu(v) for k, v in value.items()}
+    return value.detach().cpu() if torch.is_tensor(value) else value
+
+
+# --- OpenVoice ---
+def openvoice_se(wav, tone_converter, vad=False):
+    """Target speaker embedding for ToneColorConverter.convert(tgt_se=...).
+    Raises AssertionError like get_se does when the reference is too short."""
+    from openvoice import se_extractor
+
+    device = getattr(tone_converter, "device", "cpu")
+
+    def compute(w):
+        se, _ = se_extractor.get_se(w, tone_converter, vad=vad)
+        return se
+
+    return cached(f"openvoice-se-vad{int(vad)}", wav, compute, device).to(device)
+
+
+# --- XTTS v2 ---
+def xtts_latents(tts, wav):
+    """{"gpt_cond_latent", "speaker_embedding"} for a TTS.api XTTS model."""
+    model = tts.synthesizer.tts_model
+    device = next(model.parameters()).device
+    # same conditioning settings tts_to_file(speaker_wav=...) uses
+    cfg = model.config
+    settings = dict(gpt_cond_len=cfg.gpt_cond_len, gpt_cond_chunk_len=cfg.gpt_cond_chunk_len,
+                    max_ref_length=cfg.max_ref_len, sound_norm_refs=cfg.sound_norm_refs)
+
+    def compute(w):
+        gpt_cond_latent, speaker_embedding = model.get_conditioning_latents(audio_path=[w], **settings)
+        return {"gpt_cond_latent": gpt_cond_latent, "speaker_embedding": speaker_embedding}
+
+    kind = "xtts-v2-{gpt_cond_len}-{gpt_cond_chunk_len}-{max_ref_length}-{sound_norm_refs:d}".format(**settings)
+    lat = cached(kind, wav, compute, device)
+    return {k: v.to(device) for k, v in lat.items()}
+
+
+def xtts_to_file(tts, text, latents, file_path, language="en", **kw):
+    """tts.tts_to_file(text, speaker_wav=..., ...) without re-conditioning.
+    Sampling settings default to the model config, like tts_to_file."""
+    model = tts.synthesizer.tts_model
+    cfg = model.config
+    settings = dict(temperature=cfg.temperature, length_penalty=cfg.length_penalty,
+                    repetition_penalty=cfg.repetition_penalty, top_k=cfg.top_k, top_p=cfg.top_p)
+    settings.update(kw)
+    with torch.inference_mode():
+        out = model.inference(text, language, latents["gpt_cond_latent"],
+                              latents["speaker_embedding"], **settings)
+    wav = out["wav"]
+    if torch.is_tensor(wav):
+        wav = wav.cpu().numpy()
+    tts.synthesizer.save_wav(wav=wav, path=file_path)
+    return file_path
+
+
+# --- YourTTS (and other d-vector models) ---
+def cache_speaker_encoder(tts, kind="yourtts-dvector"):
+    """Route the model's speaker_manager.compute_embedding_from_clip through
+    the cache, so plain tts.tts_to_file(speaker_wav=path) stops re-encoding
+    the reference every call."""
+    manager = tts.synthesizer.tts_model.speaker_manager
+    compute = manager.compute_embedding_from_clip
+    if getattr(compute, "_speaker_cache", False):
+        return tts
+
+    def cached_compute(wav):
+        if not isinstance(wav, str):
+            return compute(wav)  # list of clips etc., not worth keying
+        return cached(kind, wav, compute)
+
+    cached_compute._speaker_cache = True
+    manager.compute_embedding_from_clip = cached_compute
+    return tts
@@ -1,40 +1,148 @@
 """whisper_testbench_xtts.py
 Benchmarks how well Whisper transcribes wake words like "hey room" using XTTS samples.
 This script evaluates the model's accuracy on positive and negative samples located in the data/samples_xtts directories.
+
+Clips are decoded in batches: each 1-3 s clip is padded to Whisper's 30 s
+window, a whole batch of log-mels goes through the encoder at once and is
+decoded greedily (temperature 0, no timestamps) in one pass. Transcripts are
+cached by audio sha1 + model size + language in cache/whisper/, so re-runs
+only transcribe new clips. Each transcript is scored against every phrase,
+not just WAKE_PHRASE.
+
+    python scripts/whisper_testbench.py                        # positive / negative accuracy
+    python scripts/whisper_testbench.py --screen data/training_data/finalheyroom:"hey room" \
+        data/training_data/finalnotwakeword --out whisper_screen.csv
 """
 
 import os
-import whisper
+import re
+import sys
+import csv
+import json
+import argparse
 import difflib
 from glob import glob
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+import whisper
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "inference"))
+from audio_io import iter_chunks, load_audio
+from embedding_cache import file_sha1
 
 # Expecting these folders to contain .wav samples
 POS_DIR = "data/samples_xtts/positive"
 NEG_DIR = "data/samples_xtts/negative"
 # Wake phrase specific to XTTS test; change as needed for other tests
 WAKE_PHRASE = "hey room"
+# every phrase the models know - transcripts are scored against all of them
+PHRASES = ["hey room", "hi room", "wake up room"]
+MATCH = 0.75
+CACHE_DIR = "cache/whisper"
+
+
+def normalize(text):
+    # "Hey, Room!" -> "hey room"
+    return " ".join(re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split())
+
+
+def score_all(text, phrases=PHRASES):
+    t = normalize(text)
+    return {p: difflib.SequenceMatcher(None, t, p).ratio() for p in phrases}
+
+
+class TranscriptCache:
+    """Append-only sha1 -> transcript map, one file per model + language."""
+
+    def __init__(self, model_name, language="en", root=CACHE_DIR):
+        os.makedirs(root, exist_ok=True)
+        self.path = os.path.join(root, f"{model_name}-{language}.tsv")
+        self.texts = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t", 1)
+                    if len(parts) == 2:
+                        try:
+                            self.texts[parts[0]] = json.loads(parts[1])
+                        except ValueError:
+                            pass  # torn last line, see embedding_cache.py
+        self._f = open(self.path, "a")
+
+    def get(self, key):
+        return self.texts.get(key)
 
-model = whisper.load_model("base")  # could use "tiny" or "medium" depending on speed/accuracy needs
+    def put(self, key, text):
+        self.texts[key] = text
+        self._f.write(f"{key}\t{json.dumps(text)}\n")
 
-def transcribe(path):
-    try:
-        result = model.transcribe(path)
-        txt = result["text"].strip().lower()
-        score = difflib.SequenceMatcher(None, txt, WAKE_PHRASE).ratio()
-        return txt, score
-    except Exception as e:
-        return f"[ERR] {e}", 0.0
+    def flush(self):
+        self._f.flush()
 
-def eval_dir(folder, label):
+    def close(self):
+        self._f.close()
+
+
+class BatchTranscriber:
+    def __init__(self, model_name="base", language="en", batch_size=16, workers=4, device=None):
+        self.model_name = model_name
+        self.model = whisper.load_model(model_name, device=device)
+        self.language = language
+        self.batch_size = batch_size
+        self.workers = workers
+        self.options = whisper.DecodingOptions(language=language, task="transcribe", temperature=0.0,
+                                               without_timestamps=True,
+                                               fp16=self.model.device.type == "cuda")
+        self.cache = TranscriptCache(model_name, language)
+
+    def _decode(self, waves):
+        n_mels = self.model.dims.n_mels
+        mel = torch.stack([whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(w)), n_mels)
+                           for w in waves]).to(self.model.device)
+        with torch.inference_mode():
+            results = whisper.decode(self.model, mel, self.options)
+        return [r.text.strip() for r in results]
+
+    def transcribe(self, paths):
+        """{path: transcript or None (failed)}; cached clips aren't decoded."""
+        with ThreadPoolExecutor(self.workers) as ex:
+            keys = dict(zip(paths, ex.map(file_sha1, paths)))
+        out = {p: self.cache.get(k) for p, k in keys.items()}
+        todo = [p for p, t in out.items() if t is None]
+        print(f"{len(paths)} clips, {len(paths) - len(todo)} cached, {len(todo)} to transcribe ({self.model_name})")
+
+        done = 0
+        for waves, ok, failed in iter_chunks(todo, load_audio, self.batch_size, self.workers):
+            for p, err in failed:
+                print(f"[ERR] {os.path.basename(p)}: {err}")
+            if waves:
+                for p, text in zip(ok, self._decode(waves)):
+                    self.cache.put(keys[p], text)
+                    out[p] = text
+                self.cache.flush()  # a killed run keeps what it decoded
+            done += len(ok) + len(failed)
+            if done % (self.batch_size * 20) < self.batch_size:
+                print(f"   - {done}/{len(todo)}")
+        return out
+
+
+def eval_dir(transcriber, folder, label, expected=WAKE_PHRASE):
     print(f"\n▶ {label.upper()} | {folder}")
-    files = glob(os.path.join(folder, "*.wav"))
+    files = sorted(glob(os.path.join(folder, "*.wav")))
+    texts = transcriber.transcribe(files)
     total, correct = 0, 0
 
     for f in files:
-        guess, score = transcribe(f)
-        match = score >= 0.75
+        guess = texts.get(f)
+        if guess is None:
+            continue
+        scores = score_all(guess)
+        best = max(scores, key=scores.get)
+        match = scores[expected] >= MATCH
         is_correct = (match and label == "positive") or (not match and label == "negative")
-        print(f"{os.path.basename(f):<30} → '{guess}' ({score:.2f}) {'✓' if is_correct else '✗'}")
+        print(f"{os.path.basename(f):<30} → '{guess}' ({scores[expected]:.2f}, best '{best}' "
+              f"{scores[best]:.2f}) {'✓' if is_correct else '✗'}")
         total += 1
         correct += int(is_correct)
 
@@ -42,10 +150,57 @@ def eval_dir(folder, label):
     print(f"\n[{label}] Accuracy: {acc:.1f}% ({correct}/{total})\n")
     return acc
 
+
+def screen(transcriber, specs, out_path):
+    """Transcribe every clip of DIR[:expected phrase] and write per-clip
+    scores for all phrases - expected "" means a negative folder."""
+    rows = []
+    for spec in specs:
+        n_ok = 0
+        folder, _, expected = spec.partition(":")
+        files = sorted(glob(os.path.join(folder, "*.wav")))
+        texts = transcriber.transcribe(files)
+        for f in files:
+            if texts.get(f) is None:
+                continue
+            scores = score_all(texts[f])
+            best = max(scores, key=scores.get)
+            if expected:
+                ok = scores.get(expected, score_all(texts[f], [expected])[expected]) >= MATCH
+            else:
+                ok = scores[best] < MATCH
+            n_ok += ok
+            rows.append([f, expected or "negative", texts[f], best, round(scores[best], 3), ok] +
+                        [round(scores[p], 3) for p in PHRASES])
+        print(f"{folder}: {n_ok}/{len(files)} clips look right")
+
+    with open(out_path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["path", "expected", "transcript", "best_phrase", "best_score", "ok"] + PHRASES)
+        w.writerows(rows)
+    print(f"{len(rows)} rows -> {out_path}")
+
+
 if __name__ == "__main__":
-    acc_pos = eval_dir(POS_DIR, "positive")
-    acc_neg = eval_dir(NEG_DIR, "negative")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="base", help="tiny / base / small / medium")
+    ap.add_argument("--batch", type=int, default=16)
+    ap.add_argument("--workers", type=int, default=4, help="decode threads")
+    ap.add_argument("--screen", nargs="+", default=None, metavar="DIR[:phrase]",
+                    help="score every clip in these folders instead of the pos/neg benchmark")
+    ap.add_argument("--out", default="whisper_screen.csv")
+    args = ap.parse_args()
+
+    transcriber = BatchTranscriber(args.model, batch_size=args.batch, workers=args.workers)
+    if args.screen:
+        screen(transcriber, args.screen, args.out)
+        transcriber.cache.close()
+        sys.exit(0)
+
+    acc_pos = eval_dir(transcriber, POS_DIR, "positive")
+    acc_neg = eval_dir(transcriber, NEG_DIR, "negative")
+    transcriber.cache.close()
 
     print("\n=== FINAL SUMMARY ===")
     print(f"✅ POSITIVE: {acc_pos:.1f}%")
-    print(f"❌ NEGATIVE: {acc_neg:.1f}%")
\ No newline at end of file
+    print(f"❌ NEGATIVE: {acc_neg:.1f}%")
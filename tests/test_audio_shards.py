@@ -0,0 +1,89 @@
+import hashlib
+import os
+
+import numpy as np
+import soundfile as sf
+
+from audio_shards import AudioShards, blob_path, pack
+
+SR = 16000
+CLIP = 8000  # samples per clip
+
+
+def write_clips(d, seed):
+    rng = np.random.default_rng(seed)
+    os.makedirs(d, exist_ok=True)
+    clips = {}
+    for i in range(6):
+        x = np.round(rng.uniform(-0.5, 0.5, CLIP) * 32768) / 32768
+        p = os.path.join(d, f"c{i}.wav")
+        sf.write(p, x, SR, subtype="PCM_16")
+        clips[os.path.normpath(p)] = x.astype(np.float32)
+    return clips
+
+
+def test_pack_roundtrip(tmp_path):
+    clips = write_clips(str(tmp_path / "pos"), 0)
+    shards = pack(str(tmp_path / "pack"), [str(tmp_path / "pos")], workers=2, blob_bytes=2 * CLIP * 2)
+    assert len(shards) == 6
+    assert len(set(shards.blob.tolist())) == 3
+    for p, x in clips.items():
+        np.testing.assert_array_equal(shards.load(p), x)
+
+
+def test_resume_after_rollover_crash(tmp_path):
+    root, src = str(tmp_path / "pack"), str(tmp_path / "pos")
+    write_clips(src, 0)
+    pack(root, [src], workers=2, blob_bytes=2 * CLIP * 2)
+
+    # crash after rolling over to the last blob, before its index lines
+    index_path = os.path.join(root, "index.tsv")
+    with open(index_path) as f:
+        lines = f.readlines()
+    with open(index_path, "w") as f:
+        f.writelines(l for l in lines if not l.startswith("2\t"))
+    # ... plus a few samples torn onto blob 1
+    with open(blob_path(root, 1), "ab") as f:
+        f.write(np.ones(100, np.int16).tobytes())
+    assert os.path.exists(blob_path(root, 2))
+
+    clips = write_clips(src, 1)  # new audio, so every source is re-packed
+    for p in clips:
+        os.utime(p, ns=(0, 10 ** 9))
+    pack(root, [src], workers=2, blob_bytes=2 * CLIP * 2)
+
+    shards = AudioShards(root)
+    for p, x in clips.items():
+        np.testing.assert_array_equal(shards.load(p), x)
+    for b in set(shards.blob.tolist()):
+        in_b = shards.blob == b
+        end = int((shards.offset[in_b] + shards.length[in_b]).max())
+        assert os.path.getsize(blob_path(root, b)) == end * 2
+
+
+def test_cache_key_follows_packed_audio(tmp_path):
+    from embedding_cache import file_sha1
+
+    src = str(tmp_path / "mixed")
+    clips = write_clips(src, 0)
+    same = sorted(clips)[0]
+    other = os.path.join(src, "float.wav")  # re-quantized to int16 when packed
+    sf.write(other, np.random.default_rng(2).uniform(-0.5, 0.5, CLIP), SR, subtype="FLOAT")
+    root = str(tmp_path / "pack")
+    shards = pack(root, [src], workers=2)
+
+    # 16 kHz mono int16 packs losslessly and shares the loose file's key
+    assert shards.key_for(same) == f"{file_sha1(same)}:{SR}"
+    # anything else is keyed on what was actually packed
+    pcm_sha1 = hashlib.sha1(shards.view(shards.index_of(other)).tobytes()).hexdigest()
+    assert shards.key_for(other) == f"{pcm_sha1}:{SR}"
+    assert shards.stat(other)[2] == pcm_sha1 != file_sha1(other)
+
+    # packs indexed before the key column fall back to hashing the PCM
+    index_path = os.path.join(root, "index.tsv")
+    with open(index_path) as f:
+        rows = [l.rstrip("\n").split("\t") for l in f]
+    with open(index_path, "w") as f:
+        f.writelines("\t".join(r[:5] + r[6:]) + "\n" for r in rows)
+    legacy = AudioShards(root)
+    assert legacy.key_for(other) == f"{pcm_sha1}:{SR}"
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import LogisticRegression
+from sklearn.neural_network import MLPClassifier
+from sklearn.preprocessing import StandardScaler
+
+from heads import NumpyHead, load_head
+
+TOL = 1e-6
+
+
+def data(n_classes, dim=32, n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, n_classes, n)
+    centers = rng.standard_normal((n_classes, dim)) * 2
+    X = (centers[y] + rng.standard_normal((n, dim)) * 3 + 5).astype(np.float32)
+    return X, y
+
+
+def fitted(case):
+    if case == "binary_logreg":
+        X, y = data(2)
+        return LogisticRegression(max_iter=2000).fit(X, y), None, X
+    if case == "liblinear_ovr":
+        X, y = data(3)
+        return LogisticRegression(solver="liblinear", max_iter=2000).fit(X, y), None, X
+    if case == "multiclass_mlp":
+        X, y = data(4)
+        return MLPClassifier(hidden_layer_sizes=(16,), max_iter=300, random_state=0).fit(X, y), None, X
+    if case == "folded_scaler":
+        X, y = data(2)
+        scaler = StandardScaler().fit(X)
+        return LogisticRegression(max_iter=2000).fit(scaler.transform(X), y), scaler, X
+    raise ValueError(case)
+
+
+@pytest.mark.filterwarnings("ignore::sklearn.exceptions.ConvergenceWarning")
+@pytest.mark.parametrize("case", ["binary_logreg", "liblinear_ovr", "multiclass_mlp", "folded_scaler"])
+def test_predict_proba_matches_sklearn(case, tmp_path):
+    clf, scaler, X = fitted(case)
+    expected = clf.predict_proba(scaler.transform(X) if scaler is not None else X)
+
+    head = NumpyHead.from_sklearn(clf, scaler)
+    np.testing.assert_allclose(head.predict_proba(X), expected, rtol=0, atol=TOL)
+
+    path = str(tmp_path / "head.npz")
+    head.save(path)
+    loaded, folded = load_head(path)
+    assert folded == (scaler is not None)
+    np.testing.assert_allclose(loaded.predict_proba(X), expected, rtol=0, atol=TOL)